@@ -0,0 +1,265 @@
+"""
+Annotates location traces offline with the affordances the API would have returned for each fix, e.g. to label
+historical GPS data for analysis.
+
+Reads (lat, lng, timestamp) rows from a CSV file (with a header row) or a JSONL file, and writes one JSON object per
+row to a JSONL file:
+    {"row": 0, "lat": 42.05, "lng": -87.68, "timestamp": "2019-03-02T17:06:00+00:00", "conditions": {...}}
+
+Rows that cannot be read or scored (e.g. a missing lat, or an upstream failure) are written as an error record instead,
+and the run continues:
+    {"row": 1, "error": "ValueError: could not convert string to float: 'x'"}
+
+Rows are read in chunks. Each chunk is grouped by location cell so that rows sharing cache entries are scored
+together by the same worker, and groups are spread across a process pool. Weather, forecast and sunrise/sunset are
+fetched once per group, as their cache cells are much larger than a group (keep --cell-size below them), and Yelp
+places once per Yelp cache cell within it. Output is written as groups finish, so rows
+come out grouped by cell rather than in input order; use "row" (the 0-based input row number) to restore it. Memory
+use depends on the chunk size, not the input size.
+
+Timestamps may be epoch seconds or ISO 8601 strings, and are taken as UTC if they have no offset. Time affordances
+(local time, weekday, period of day) are computed for each row's timestamp. Weather and places come from the same
+caches and upstream APIs as the live API, so they describe current conditions.
+
+From root of project, call
+python batch_score.py input.csv output.jsonl [--workers 4] [--chunk-size 10000] [--cell-size 1000] [--as-of row]
+
+Use - as input or output to read from stdin (JSONL only) or write to stdout.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import argparse
+import csv
+import datetime
+import json
+import sys
+from itertools import islice
+from multiprocessing import Pool
+
+from pytz import utc
+
+from geo_cells import tile_id
+
+# main is imported in each worker process, so that every worker gets its own MongoDB client and thread pools
+main = None
+
+
+def parse_timestamp(value):
+    """
+    Parses a timestamp given as epoch seconds or an ISO 8601 string.
+
+    :param value: int, float, or string timestamp
+    :return: timezone-aware datetime, in UTC
+    """
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, utc)
+
+    value = value.strip()
+    try:
+        return datetime.datetime.fromtimestamp(float(value), utc)
+    except ValueError:
+        pass
+
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=utc)
+    return parsed.astimezone(utc)
+
+
+def read_rows(input_file, input_format, on_error=None):
+    """
+    Lazily reads rows from a CSV or JSONL file.
+
+    :param input_file: open text file
+    :param input_format: string, either 'csv' or 'jsonl'
+    :param on_error: optional function taking (row number, exception) for rows that cannot be read, which are then
+        skipped. if not given, the exception is raised.
+    :return: generator of (row number, lat, lng, timestamp value) tuples
+    """
+    if input_format == 'csv':
+        records = csv.DictReader(input_file)
+    else:
+        records = (line for line in input_file if line.strip())
+
+    for row_number, record in enumerate(records):
+        try:
+            if input_format != 'csv':
+                record = json.loads(record)
+            yield row_number, float(record['lat']), float(record['lng']), record.get('timestamp')
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            if on_error is None:
+                raise
+            on_error(row_number, e)
+
+
+def error_record(row_number, error, lat=None, lng=None):
+    """
+    Returns the output written in place of a row that could not be read or scored.
+
+    :param row_number: int 0-based input row number
+    :param error: exception raised for the row
+    :param lat: optional float latitude of the row, if it was read
+    :param lng: optional float longitude of the row, if it was read
+    :return: dict
+    """
+    record = {'row': row_number}
+    if lat is not None:
+        record.update({'lat': lat, 'lng': lng})
+    record['error'] = '{}: {}'.format(type(error).__name__, error)
+    return record
+
+
+def group_by_cell(rows, cell_size):
+    """
+    Groups rows by the location cell they fall in.
+
+    :param rows: list of (row number, lat, lng, timestamp value) tuples
+    :param cell_size: float size of a cell in meters
+    :return: list of lists of rows, one per cell
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tile_id(row[1], row[2], cell_size), []).append(row)
+    return list(groups.values())
+
+
+def init_worker():
+    """
+    Sets up a worker process, importing main for its caches and API clients.
+
+    :return: None
+    """
+    global main
+
+    # main logs with print, keep stdout free for output
+    sys.stdout = sys.stderr
+    import main as main_module
+    main = main_module
+
+
+def score_rows(args):
+    """
+    Computes the conditions for a group of rows in the same cell, as get_current_conditions_as_keyvalues would at each
+    row's time. Weather, forecast and sunrise/sunset are fetched once for the group, and Yelp places once per Yelp
+    cache cell. A row that fails gets an error record, and the rest of the group is still scored.
+
+    :param args: tuple of (list of (row number, lat, lng, timestamp value) tuples, string as_of option)
+    :return: list of output dicts, one per row
+    """
+    rows, as_of_option = args
+
+    group_data = None
+    yelp_by_cell = {}
+    scored = []
+    for row_number, lat, lng, timestamp in rows:
+        try:
+            if as_of_option == 'row':
+                as_of = parse_timestamp(timestamp) if timestamp not in (None, '') else None
+            elif as_of_option == 'now':
+                as_of = None
+            else:
+                as_of = parse_timestamp(as_of_option)
+
+            if group_data is None:
+                group_data = main.fetch_conditions_data(lat, lng, include_yelp=False)
+
+            yelp_affordances, yelp_is_stale = None, False
+            if main.needs_yelp(lat, lng):
+                yelp_cell = tile_id(lat, lng, main.YELP_CACHE_DISTANCE_THRESHOLD)
+                if yelp_cell not in yelp_by_cell:
+                    stale_sources = []
+                    yelp_by_cell[yelp_cell] = (main.get_categories_for_location(lat, lng, stale_sources),
+                                               bool(stale_sources))
+                yelp_affordances, yelp_is_stale = yelp_by_cell[yelp_cell]
+
+            fetched_data = dict(group_data, yelp=yelp_affordances,
+                                stale_sources=sorted(group_data['stale_sources'] + (['yelp'] if yelp_is_stale else [])))
+            campus_affordances = main.get_campus_categories_for_location(lat, lng)
+            scored.append({
+                'row': row_number,
+                'lat': lat,
+                'lng': lng,
+                'timestamp': as_of.isoformat() if as_of is not None else None,
+                'conditions': main.format_conditions_as_keyvalues(lat, lng, campus_affordances, fetched_data,
+                                                                  as_of=as_of)
+            })
+        except Exception as e:
+            print('batch_score -- error scoring row {}: {}'.format(row_number, e))
+            scored.append(error_record(row_number, e, lat, lng))
+    return scored
+
+
+def score_file(input_file, output_file, input_format, workers, chunk_size, cell_size, as_of_option):
+    """
+    Scores every row of input_file across a process pool, writing JSONL to output_file.
+
+    :param input_file: open text file of rows
+    :param output_file: open text file to write JSONL to
+    :param input_format: string, either 'csv' or 'jsonl'
+    :param workers: int number of worker processes
+    :param chunk_size: int number of rows to read and group at a time
+    :param cell_size: float size in meters of the cells rows are grouped by
+    :param as_of_option: string 'row' to use each row's timestamp, 'now', or an ISO 8601 timestamp for all rows
+    :return: int number of rows written, including error records
+    """
+    counts = {'written': 0, 'errors': 0}
+
+    def write(result):
+        output_file.write(json.dumps(result) + '\n')
+        counts['written'] += 1
+        if 'error' in result:
+            counts['errors'] += 1
+
+    rows = read_rows(input_file, input_format,
+                     on_error=lambda row_number, error: write(error_record(row_number, error)))
+
+    pool = Pool(processes=workers, initializer=init_worker)
+    try:
+        # Pool.imap reads its whole input up front, so feed it one chunk at a time to keep memory bounded
+        chunk = list(islice(rows, chunk_size))
+        while chunk:
+            groups = group_by_cell(chunk, cell_size)
+            for scored in pool.imap_unordered(score_rows, [(group, as_of_option) for group in groups]):
+                for result in scored:
+                    write(result)
+            output_file.flush()
+            print('batch_score -- {} rows written, {} errors.'.format(counts['written'], counts['errors']),
+                  file=sys.stderr)
+
+            chunk = list(islice(rows, chunk_size))
+    finally:
+        pool.close()
+        pool.join()
+
+    return counts['written']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Annotate location traces with affordances, as JSONL.')
+    parser.add_argument('input', help='CSV or JSONL file with lat, lng, and timestamp fields, or - for stdin')
+    parser.add_argument('output', help='JSONL file to write, or - for stdout')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                        help='input format, by default from the input file extension')
+    parser.add_argument('--workers', type=int, default=4, help='number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='number of rows to read and group at a time')
+    parser.add_argument('--cell-size', type=float, default=1000.0, help='size in meters of cells to group rows by')
+    parser.add_argument('--as-of', default='row',
+                        help="'row' to compute time affordances at each row's timestamp, 'now', or an ISO 8601 "
+                             "timestamp to use for all rows")
+    args = parser.parse_args()
+
+    input_format = args.format
+    if input_format is None:
+        input_format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+
+    input_file = sys.stdin if args.input == '-' else open(args.input, newline='')
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        score_file(input_file, output_file, input_format, args.workers, args.chunk_size, args.cell_size,
+                   args.as_of)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
@@ -0,0 +1,107 @@
+"""
+Benchmarks DataCache lookup latency on a collection with 1M cached points, comparing the old lookup (create_index
+on every call, planar $near, geodesic in Python) against the current one (index created once, spherical $geoNear
+bounded by maxDistance).
+
+Must run local mongod instance, i.e.
+mongod --config /usr/local/etc/mongod.conf
+
+From root of project, call
+python bench_cache_lookup.py [number of points]
+"""
+from __future__ import print_function
+
+import contextlib
+import datetime
+import io
+import random
+import sys
+import timeit
+
+from geopy.distance import geodesic
+from pymongo import MongoClient, GEO2D, GEOSPHERE
+
+from data_cache import DataCache
+
+MONGODB_URI = "mongodb://localhost:27017/"
+DB_NAME = "affordance-aware-bench"
+OLD_COLLECTION = "BenchCacheOld"
+NEW_COLLECTION = "BenchCacheNew"
+
+CENTER = (42.048735, -87.683187)  # lat, lng
+SPREAD = 0.5                      # degrees around CENTER to scatter points in
+DISTANCE_THRESHOLD = 10.0         # meters, same as YELP_CACHE_DISTANCE_THRESHOLD
+TIME_THRESHOLD = 10080            # minutes, same as YELP_CACHE_TIME_THRESHOLD
+LOOKUPS = 500
+
+
+def populate(collection, num_points, batch_size=10000):
+    """
+    Fills a collection with num_points random cache documents around CENTER.
+
+    :param collection: pymongo collection to fill.
+    :param num_points: int number of documents to insert.
+    :param batch_size: optional int number of documents per insert_many.
+    :return: None
+    """
+    collection.drop()
+    rand = random.Random(0)
+    now = datetime.datetime.utcnow()
+
+    for start in range(0, num_points, batch_size):
+        collection.insert_many([{
+            'location': [CENTER[1] + rand.uniform(-SPREAD, SPREAD), CENTER[0] + rand.uniform(-SPREAD, SPREAD)],
+            'data': {},
+            'date': now
+        } for _ in range(min(batch_size, num_points - start))], ordered=False)
+
+
+def old_fetch_from_cache(collection, lat, lng):
+    """
+    The lookup DataCache.fetch_from_cache made before indexes were bootstrapped once.
+    """
+    collection.create_index([('location', GEO2D)])
+    nearest_cached_loc = collection.find_one({'location': {'$near': [lng, lat]}})
+
+    if nearest_cached_loc is not None:
+        nearest_cached_loc_location = (nearest_cached_loc['location'][1], nearest_cached_loc['location'][0])
+        dist_to_nearest = geodesic(nearest_cached_loc_location, (lat, lng)).meters
+        if dist_to_nearest < DISTANCE_THRESHOLD:
+            return nearest_cached_loc, True
+    return None, False
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    client = MongoClient(MONGODB_URI)
+    db = client[DB_NAME]
+
+    print('populating {} points in each collection...'.format(num_points))
+    populate(db[OLD_COLLECTION], num_points)
+    populate(db[NEW_COLLECTION], num_points)
+    db[OLD_COLLECTION].create_index([('location', GEO2D)])
+    db[NEW_COLLECTION].create_index([('location', GEOSPHERE)])
+
+    rand = random.Random(1)
+    queries = [(CENTER[0] + rand.uniform(-SPREAD, SPREAD), CENTER[1] + rand.uniform(-SPREAD, SPREAD))
+               for _ in range(LOOKUPS)]
+
+    data_cache = DataCache(MONGODB_URI, DB_NAME, l1_max_entries=0)
+
+    def run_old():
+        for lat, lng in queries:
+            old_fetch_from_cache(db[OLD_COLLECTION], lat, lng)
+
+    def run_new():
+        for lat, lng in queries:
+            data_cache.fetch_from_cache(NEW_COLLECTION, lat, lng, DISTANCE_THRESHOLD, TIME_THRESHOLD)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        old = timeit.timeit(run_old, number=1)
+        new = timeit.timeit(run_new, number=1)
+
+    print('mean lookup latency over {} lookups on {} points'.format(LOOKUPS, num_points))
+    print('  old ($near + geodesic, create_index per call): {:8.3f} ms'.format(old / LOOKUPS * 1000))
+    print('  new ($geoNear with maxDistance):               {:8.3f} ms'.format(new / LOOKUPS * 1000))
+
+    client.drop_database(DB_NAME)
@@ -0,0 +1,100 @@
+"""
+Benchmarks the compact cache schema against the raw upstream responses cached before it: BSON size of the cached data,
+and compute_weather_time_affordances latency when reading each format.
+
+From root of project, call
+python bench_cache_schema.py
+"""
+from __future__ import print_function
+
+import contextlib
+import io
+import time
+import timeit
+
+import bson
+
+import cache_schema
+import main
+
+LAT, LNG = 42.048735, -87.683187
+REPEAT = 2000
+
+NOW = int(time.time())
+WEATHER_RESP = {
+    'coord': {'lon': LNG, 'lat': LAT},
+    'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}],
+    'base': 'stations',
+    'main': {'temp': 282.55, 'feels_like': 281.86, 'temp_min': 280.37, 'temp_max': 284.26, 'pressure': 1023,
+             'humidity': 100},
+    'visibility': 16093,
+    'wind': {'speed': 1.5, 'deg': 350},
+    'clouds': {'all': 1},
+    'dt': NOW,
+    'sys': {'type': 1, 'id': 5122, 'country': 'US', 'sunrise': NOW - 21600, 'sunset': NOW + 21600},
+    'timezone': -18000,
+    'id': 4891382,
+    'name': 'Evanston',
+    'cod': 200
+}
+FORECAST_RESP = {
+    'cod': '200',
+    'message': 0,
+    'cnt': 40,
+    'list': [{
+        'dt': NOW + 3 * 60 * 60 * i,
+        'main': {'temp': 280.0 + i % 5, 'feels_like': 278.0, 'temp_min': 279.0, 'temp_max': 281.0, 'pressure': 1020,
+                 'sea_level': 1020, 'grnd_level': 990, 'humidity': 80, 'temp_kf': 0.5},
+        'weather': [{'id': 803, 'main': 'Clouds', 'description': 'broken clouds', 'icon': '04d'}],
+        'clouds': {'all': 75},
+        'wind': {'speed': 3.2, 'deg': 200},
+        'visibility': 10000,
+        'pop': 0.1,
+        'sys': {'pod': 'd'},
+        'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(NOW + 3 * 60 * 60 * i))
+    } for i in range(40)],
+    'city': {'id': 4891382, 'name': 'Evanston', 'coord': {'lat': LAT, 'lon': LNG}, 'country': 'US'}
+}
+SUNRISE_SUNSET_RESP = {
+    'sunrise': time.strftime('%Y-%m-%dT11:00:00+00:00', time.gmtime(NOW)),
+    'sunset': time.strftime('%Y-%m-%dT23:30:00+00:00', time.gmtime(NOW)),
+    'solar_noon': time.strftime('%Y-%m-%dT17:15:00+00:00', time.gmtime(NOW)),
+    'day_length': 45000,
+    'civil_twilight_begin': time.strftime('%Y-%m-%dT10:30:00+00:00', time.gmtime(NOW)),
+    'civil_twilight_end': time.strftime('%Y-%m-%dT00:00:00+00:00', time.gmtime(NOW)),
+    'timezone': 'America/Chicago'
+}
+
+
+def run(weather_forecast_dict, sunrise_sunset_dict):
+    """
+    Times compute_weather_time_affordances on already fetched data.
+
+    :return: float mean seconds per call.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        total = timeit.timeit(lambda: main.compute_weather_time_affordances(LAT, LNG, weather_forecast_dict,
+                                                                            sunrise_sunset_dict), number=REPEAT)
+    return total / REPEAT
+
+
+if __name__ == '__main__':
+    raw_weather = {'weather': WEATHER_RESP, 'timezone': 'America/Chicago'}
+    raw_forecast = {'forecast': FORECAST_RESP, 'timezone': 'America/Chicago'}
+    compact_weather = dict(cache_schema.compact_weather(WEATHER_RESP), timezone='America/Chicago')
+    compact_forecast = dict(cache_schema.compact_forecast(FORECAST_RESP), timezone='America/Chicago')
+    compact_sunrise_sunset = dict(cache_schema.compact_sunrise_sunset(SUNRISE_SUNSET_RESP), timezone='America/Chicago')
+
+    print('cached data size (BSON bytes)      raw     compact')
+    for name, raw, compact in [('weather', raw_weather, compact_weather),
+                               ('forecast', raw_forecast, compact_forecast),
+                               ('sunrise/sunset', SUNRISE_SUNSET_RESP, compact_sunrise_sunset)]:
+        print('  {:20s} {:10d} {:10d}'.format(name, len(bson.encode(raw)), len(bson.encode(compact))))
+
+    main.SUNRISE_SUNSET_SOURCE = 'api'
+    raw_time = run({'weather': WEATHER_RESP, 'forecast': FORECAST_RESP, 'timezone': 'America/Chicago'},
+                   SUNRISE_SUNSET_RESP)
+    compact_time = run(main.combine_weather_forecast(compact_weather, compact_forecast), compact_sunrise_sunset)
+    print('compute_weather_time_affordances latency over {} calls'.format(REPEAT))
+    print('  raw upstream format:  {:8.1f} us'.format(raw_time * 1e6))
+    print('  compact format:       {:8.1f} us'.format(compact_time * 1e6))
@@ -0,0 +1,39 @@
+"""
+Benchmarks the distance backends in distance.py, one location against many, as done for hardcoded locations and
+L1 cache lookups.
+
+From root of project, call
+python bench_distance.py [number of points]
+"""
+from __future__ import print_function
+
+import random
+import sys
+import timeit
+
+import distance
+
+CENTER = (42.048735, -87.683187)
+SPREAD = 0.05        # degrees around CENTER to scatter points in, roughly Evanston
+REPEATS = 5
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rand = random.Random(0)
+    lats = [CENTER[0] + rand.uniform(-SPREAD, SPREAD) for _ in range(num_points)]
+    lngs = [CENTER[1] + rand.uniform(-SPREAD, SPREAD) for _ in range(num_points)]
+
+    print('distance from one location to {} points, best of {} runs (numpy {})'.format(
+        num_points, REPEATS, 'available' if distance.np is not None else 'not installed'))
+
+    for name, scalar, batched in [('geodesic', distance.geodesic_distance, distance.geodesic_many),
+                                  ('haversine', distance.haversine, distance.haversine_many),
+                                  ('equirectangular', distance.equirectangular, distance.equirectangular_many)]:
+        scalar_time = min(timeit.repeat(lambda: [scalar(CENTER[0], CENTER[1], lat, lng)
+                                                 for lat, lng in zip(lats, lngs)],
+                                        number=1, repeat=REPEATS))
+        batched_time = min(timeit.repeat(lambda: batched(CENTER[0], CENTER[1], lats, lngs),
+                                         number=1, repeat=REPEATS))
+        print('  {:16s} scalar: {:10.3f} ms   batched: {:10.3f} ms'.format(name, scalar_time * 1000,
+                                                                         batched_time * 1000))
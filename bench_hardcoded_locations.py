@@ -0,0 +1,81 @@
+"""
+Benchmarks Yelp.fetch_hardcoded_locations with 10k synthetic hardcoded locations, comparing the old linear scan
+(validate and compute geodesic for every entry on every call) against the grid index built at construction.
+
+From root of project, call
+python bench_hardcoded_locations.py [number of hardcoded locations]
+"""
+from __future__ import print_function
+
+import random
+import sys
+import timeit
+
+from geopy.distance import geodesic
+
+import distance
+from yelp import Yelp
+
+CENTER = (42.048735, -87.683187)
+SPREAD = 0.05        # degrees around CENTER to scatter hardcoded locations in, roughly Evanston
+DISTANCE_THRESHOLD = 60
+LOOKUPS = 50
+
+
+def linear_fetch_hardcoded_locations(hardcoded_locations, lat, lng, distance_threshold=60):
+    """
+    The lookup Yelp.fetch_hardcoded_locations did before hardcoded locations were indexed.
+    """
+    nearby_hardcoded_place_cats = {}
+
+    for location in hardcoded_locations:
+        place_categorylist_dict = location[0]
+        if len(place_categorylist_dict) != 1:
+            raise ValueError(
+                'element of hardcoded_locations should look like ({"placename": [affordance]}, (lat,lng))')
+        curr_location_coords = location[1]
+        if len(curr_location_coords) != 2:
+            raise ValueError(
+                'element of hardcoded_locations should look like ({"placename": [affordance]}, (lat,lng))')
+
+        dist = geodesic(curr_location_coords, (lat, lng)).meters
+        if dist < distance_threshold:
+            for place, categorylist in place_categorylist_dict.items():
+                nearby_hardcoded_place_cats[place] = {'categories': categorylist, 'distance': dist}
+
+    return nearby_hardcoded_place_cats
+
+
+if __name__ == '__main__':
+    num_locations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rand = random.Random(0)
+
+    hardcoded_locations = [
+        ({'place_{}'.format(i): ['category_{}'.format(i % 20)]},
+         (CENTER[0] + rand.uniform(-SPREAD, SPREAD), CENTER[1] + rand.uniform(-SPREAD, SPREAD)))
+        for i in range(num_locations)
+    ]
+    queries = [(CENTER[0] + rand.uniform(-SPREAD, SPREAD), CENTER[1] + rand.uniform(-SPREAD, SPREAD))
+               for _ in range(LOOKUPS)]
+
+    build = timeit.timeit(lambda: Yelp('', hardcoded_locations=hardcoded_locations), number=1)
+    yelp_api = Yelp('', hardcoded_locations=hardcoded_locations)
+
+    # both lookups must agree when computing the same distance
+    distance.set_backend('geodesic')
+    for lat, lng in queries[:10]:
+        assert (linear_fetch_hardcoded_locations(hardcoded_locations, lat, lng, DISTANCE_THRESHOLD) ==
+                yelp_api.fetch_hardcoded_locations(lat, lng, DISTANCE_THRESHOLD))
+    distance.set_backend('haversine')
+
+    linear = timeit.timeit(lambda: [linear_fetch_hardcoded_locations(hardcoded_locations, lat, lng,
+                                                                     DISTANCE_THRESHOLD)
+                                    for lat, lng in queries], number=1)
+    indexed = timeit.timeit(lambda: [yelp_api.fetch_hardcoded_locations(lat, lng, DISTANCE_THRESHOLD)
+                                     for lat, lng in queries], number=1)
+
+    print('fetch_hardcoded_locations with {} hardcoded locations, mean over {} lookups'.format(num_locations,
+                                                                                            LOOKUPS))
+    print('  old (linear scan + geodesic):  {:10.3f} ms'.format(linear / LOOKUPS * 1000))
+    print('  new (grid index + haversine):  {:10.3f} ms'.format(indexed / LOOKUPS * 1000))
+    print('  one-time index build:          {:10.3f} ms'.format(build * 1000))
@@ -0,0 +1,77 @@
+"""
+Benchmarks compute_weather_time_affordances with the old per-call TimezoneFinder against the shared TimezoneResolver.
+
+Weather and sunrise/sunset data are passed in as fixed documents so that only the local CPU cost is measured.
+
+From root of project, call
+python bench_timezone.py
+"""
+from __future__ import print_function
+
+import contextlib
+import io
+import time
+import timeit
+
+from timezonefinder import TimezoneFinder
+
+import main
+
+LAT, LNG = 42.048735, -87.683187
+REPEAT = 20
+
+NOW = int(time.time())
+WEATHER_FORECAST_DICT = {
+    'weather': {'weather': [{'main': 'Clear'}]},
+    'forecast': {'list': [{'dt': NOW + 3 * 60 * 60 * i, 'weather': [{'main': 'Clouds'}]} for i in range(40)]}
+}
+SUNRISE_SUNSET_DICT = {
+    'sunrise': time.strftime('%Y-%m-%dT11:00:00+00:00', time.gmtime(NOW)),
+    'sunset': time.strftime('%Y-%m-%dT23:30:00+00:00', time.gmtime(NOW))
+}
+
+
+class PerCallTimezoneFinder(object):
+    """
+    Reproduces the old get_local_time behavior of building a new TimezoneFinder on every call.
+    """
+
+    @staticmethod
+    def timezone_at(lat, lng):
+        return TimezoneFinder().timezone_at(lng=lng, lat=lat)
+
+
+def run(resolver, store_timezone):
+    """
+    Times compute_weather_time_affordances for the given resolver.
+
+    :param resolver: object with a timezone_at(lat, lng) method to install as main.TIMEZONE_RESOLVER.
+    :param store_timezone: bool whether cached documents carry a resolved timezone name.
+    :return: float mean seconds per call.
+    """
+    weather_forecast_dict = dict(WEATHER_FORECAST_DICT)
+    sunrise_sunset_dict = dict(SUNRISE_SUNSET_DICT)
+    if store_timezone:
+        weather_forecast_dict['timezone'] = 'America/Chicago'
+        sunrise_sunset_dict['timezone'] = 'America/Chicago'
+
+    main.TIMEZONE_RESOLVER = resolver
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.compute_weather_time_affordances(LAT, LNG, weather_forecast_dict, sunrise_sunset_dict)  # warm up
+        total = timeit.timeit(lambda: main.compute_weather_time_affordances(LAT, LNG, weather_forecast_dict,
+                                                                            sunrise_sunset_dict), number=REPEAT)
+    return total / REPEAT
+
+
+if __name__ == '__main__':
+    old = run(PerCallTimezoneFinder(), store_timezone=False)
+    resolver = main.TimezoneResolver()
+    new_cell_cache = run(resolver, store_timezone=False)
+    new_cached_doc = run(main.TimezoneResolver(), store_timezone=True)
+
+    print('compute_weather_time_affordances latency over {} calls'.format(REPEAT))
+    print('  old (TimezoneFinder per call):      {:10.3f} ms'.format(old * 1000))
+    print('  new (resolver cell cache):          {:10.3f} ms'.format(new_cell_cache * 1000))
+    print('  new (timezone stored in cache doc): {:10.3f} ms'.format(new_cached_doc * 1000))
+    print('  resolver stats: {}'.format(resolver.stats()))
@@ -0,0 +1,102 @@
+"""
+Benchmarks a Yelp cache miss against a stub Yelp with fixed latency per request: the original fetch, which sent the
+generic and category searches one after the other, against Yelp.fetch_yelp_locations with 1 and 4 pages per search.
+
+From root of project, call
+python bench_yelp_fetch.py [latency in ms]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from yelp import Yelp
+
+CENTER = (42.048735, -87.683187)
+CATEGORIES = 'grocery,trainstations,transport,bars,climbing,cafeteria,libraries,religiousorgs,sports_clubs,fitness'
+REPEATS = 5
+
+
+class StubResponse(object):
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class StubSession(object):
+    """
+    Answers Yelp searches after a fixed delay, from a list of businesses where every fourth one is in CATEGORIES, so
+    the category search returns businesses the generic search also does.
+    """
+
+    def __init__(self, num_businesses, latency):
+        self.latency = latency
+        self.calls = 0
+        self.businesses = [{'id': str(i), 'alias': 'place-{}'.format(i), 'distance': 30.0 * i / num_businesses,
+                            'categories': [{'alias': 'bars' if i % 4 == 0 else 'pizza'}]}
+                           for i in range(num_businesses)]
+
+    def get(self, url, headers=None, params=None):
+        self.calls += 1
+        time.sleep(self.latency)
+
+        businesses = self.businesses
+        if 'categories' in params:
+            businesses = [business for business in businesses if business['categories'][0]['alias'] == 'bars']
+        offset = params.get('offset', 0)
+        return StubResponse({'businesses': businesses[offset:offset + params['limit']], 'total': len(businesses)})
+
+
+def fetch_sequential(yelp_api):
+    """
+    The original fetch_yelp_locations: both searches in turn, with duplicates processed twice.
+
+    :return: int number of businesses processed
+    """
+    generic = yelp_api.yelp_search(yelp_api.header, CENTER[0], CENTER[1], radius=30, limit=50,
+                                   session=yelp_api.session)
+    specific = yelp_api.yelp_search(yelp_api.header, CENTER[0], CENTER[1], radius=30, limit=50,
+                                    categories=CATEGORIES, session=yelp_api.session)
+    businesses = generic.json()['businesses'] + specific.json()['businesses']
+    for business in businesses:
+        yelp_api.clean_string(business['alias'])
+    return len(businesses)
+
+
+def measure(fetch, session):
+    """
+    Returns the best latency of REPEATS fetches, and upstream calls per fetch.
+    """
+    session.calls = 0
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.time()
+        fetch()
+        best = min(best, time.time() - start)
+    return best, session.calls / float(REPEATS)
+
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) / 1000.0 if len(sys.argv) > 1 else 0.08
+
+    print('Yelp cache miss with {:.0f} ms per request, best of {} runs'.format(latency * 1000, REPEATS))
+    for num_businesses in (30, 400):
+        print('  {} businesses within the search radius'.format(num_businesses))
+        session = StubSession(num_businesses, latency)
+
+        sequential_api = Yelp('', session=session)
+        before, before_calls = measure(lambda: fetch_sequential(sequential_api), session)
+        print('    {:28s} {:8.1f} ms  {:4.1f} requests  {:4d} businesses processed'.format(
+            'sequential (before)', before * 1000, before_calls, fetch_sequential(sequential_api)))
+
+        for max_pages in (1, 4):
+            yelp_api = Yelp('', session=session, max_pages=max_pages)
+            after, after_calls = measure(lambda: yelp_api.fetch_yelp_locations(CENTER[0], CENTER[1], CATEGORIES),
+                                         session)
+            print('    {:28s} {:8.1f} ms  {:4.1f} requests  {:4d} businesses found'.format(
+                'concurrent, {} page(s)'.format(max_pages), after * 1000, after_calls,
+                len(yelp_api.fetch_yelp_locations(CENTER[0], CENTER[1], CATEGORIES))))
@@ -0,0 +1,215 @@
+"""
+This module keeps a local, geo-indexed copy of Yelp businesses, so that queries for any small radius inside an area
+already fetched with one wide Yelp search are answered without calling Yelp again.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import datetime
+import threading
+
+from pymongo import GEOSPHERE, UpdateOne
+
+import distance
+from geo_cells import tile_id
+from singleflight import SingleFlight
+
+
+class BusinessStore(object):
+    """
+    Stores businesses with their own coordinates and categories in one collection, and the circles known to contain
+    every business in another. In areas too dense for a wide search to return every business, the covered circle is
+    smaller than requested and marked truncated, and queries near it are left to narrow searches instead.
+
+    Attributes:
+        db: pymongo database to keep the collections in.
+        fetch_radius (float): radius in meters of the wide searches used to fill the store.
+        max_age_minutes (float): how long businesses and coverage are trusted before the area is fetched again.
+        collection_name (str): collection of businesses, keyed by Yelp business id.
+        coverage_collection_name (str): collection of covered circles.
+    """
+
+    def __init__(self, db, fetch_radius=250.0, max_age_minutes=10080, collection_name='YelpBusinesses',
+                 coverage_collection_name='YelpCoverage'):
+        """
+        Returns a BusinessStore object with class variables initialized.
+
+        :param db: pymongo database, e.g. DataCache.db.
+        :param fetch_radius: optional float radius in meters of wide searches.
+        :param max_age_minutes: optional float minutes businesses and coverage are trusted for.
+        :param collection_name: optional string collection of businesses.
+        :param coverage_collection_name: optional string collection of covered circles.
+        """
+        self.db = db
+        self.fetch_radius = fetch_radius
+        self.max_age_minutes = max_age_minutes
+        self.collection_name = collection_name
+        self.coverage_collection_name = coverage_collection_name
+
+        self._indexed = False
+        self._single_flight = SingleFlight()
+        self._stats = {'local_answers': 0, 'wide_fetches': 0, 'businesses_upserted': 0, 'uncovered_queries': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    def ensure_indexes(self):
+        """
+        Creates the spherical indexes used for lookups, once per process.
+
+        :return: None
+        """
+        if self._indexed:
+            return
+
+        self.db[self.collection_name].create_index([('location', GEOSPHERE)])
+        self.db[self.coverage_collection_name].create_index([('center', GEOSPHERE)])
+        self._indexed = True
+
+    def _cutoff(self):
+        return datetime.datetime.utcnow() - datetime.timedelta(minutes=self.max_age_minutes)
+
+    def _coverage(self, lat, lng, radius):
+        """
+        Returns whether a circle lies entirely inside an area fetched within max_age_minutes, and whether a truncated
+        wide search was made nearby.
+
+        :param lat: float latitude of circle center.
+        :param lng: float longitude of circle center.
+        :param radius: float radius of circle in meters.
+        :return: tuple of (bool covered, bool near a truncated search)
+        """
+        self.ensure_indexes()
+
+        # covered circles have radius at most fetch_radius, so their centers are within fetch_radius of the query
+        nearby_coverage = self.db[self.coverage_collection_name].find({
+            'center': {'$geoWithin': {'$centerSphere': [[lng, lat],
+                                                        self.fetch_radius / distance.EARTH_RADIUS_METERS]}},
+            'date': {'$gte': self._cutoff()}
+        })
+        truncated = False
+        for coverage in nearby_coverage:
+            center_lng, center_lat = coverage['center']['coordinates']
+            if distance.distance(lat, lng, center_lat, center_lng) + radius <= coverage['radius']:
+                return True, truncated
+            truncated = truncated or coverage.get('truncated', False)
+        return False, truncated
+
+    def covers(self, lat, lng, radius):
+        """
+        Returns whether a circle lies entirely inside an area fetched within max_age_minutes.
+
+        :param lat: float latitude of circle center.
+        :param lng: float longitude of circle center.
+        :param radius: float radius of circle in meters.
+        :return: bool
+        """
+        return self._coverage(lat, lng, radius)[0]
+
+    def ensure_covered(self, lat, lng, radius, fetch_wide):
+        """
+        Fills the store around a location with one wide search, unless a circle around it is already covered.
+        Concurrent calls in the same wide-radius cell share one search. No search is made near a recent truncated
+        one, as the area is too dense for a wide search to cover.
+
+        :param lat: float latitude of circle center.
+        :param lng: float longitude of circle center.
+        :param radius: float radius of circle in meters.
+        :param fetch_wide: function taking (lat, lng, radius) and returning a tuple of (list of Yelp business dicts,
+            float radius in meters within which the list is complete).
+        :return: bool whether the circle is covered, so that within answers it completely. if not, the caller should
+            search the circle itself.
+        """
+        covered, truncated = self._coverage(lat, lng, radius)
+        if covered:
+            return True
+
+        if not truncated:
+            fetch_radius = max(self.fetch_radius, radius)
+            self._single_flight.do(tile_id(lat, lng, fetch_radius), self._fill, lat, lng, radius, fetch_radius,
+                                   fetch_wide)
+
+            # the fill may have been for another location in the cell, or truncated short of this circle
+            if self.covers(lat, lng, radius):
+                return True
+
+        self._count('uncovered_queries')
+        return False
+
+    def _fill(self, lat, lng, radius, fetch_radius, fetch_wide):
+        # a concurrent fill may have covered this circle while waiting
+        if self.covers(lat, lng, radius):
+            return
+
+        businesses, covered_radius = fetch_wide(lat, lng, fetch_radius)
+        self._count('wide_fetches')
+        self.upsert(businesses)
+        self.db[self.coverage_collection_name].insert_one({
+            'center': {'type': 'Point', 'coordinates': [lng, lat]},
+            'radius': covered_radius,
+            'truncated': covered_radius < fetch_radius,
+            'date': datetime.datetime.utcnow()
+        })
+
+    def upsert(self, businesses):
+        """
+        Adds or updates businesses as returned by Yelp's business search. Businesses without coordinates are skipped.
+
+        :param businesses: list of Yelp business dicts.
+        :return: int number of businesses written
+        """
+        self.ensure_indexes()
+
+        current_date = datetime.datetime.utcnow()
+        operations = []
+        for business in businesses:
+            coordinates = business.get('coordinates') or {}
+            if coordinates.get('latitude') is None or coordinates.get('longitude') is None:
+                continue
+
+            operations.append(UpdateOne({'_id': business['id']}, {'$set': {
+                'alias': business['alias'],
+                'categories': [category['alias'] for category in business['categories']],
+                'location': {'type': 'Point', 'coordinates': [coordinates['longitude'], coordinates['latitude']]},
+                'date': current_date
+            }}, upsert=True))
+
+        if operations:
+            self.db[self.collection_name].bulk_write(operations, ordered=False)
+        self._count('businesses_upserted', len(operations))
+        return len(operations)
+
+    def within(self, lat, lng, radius):
+        """
+        Returns stored businesses within a distance of a location, seen by a search within max_age_minutes.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :param radius: float distance in meters.
+        :return: list of (business dict with 'alias' and 'categories', float distance in meters) tuples, nearest first
+        """
+        self.ensure_indexes()
+
+        nearby_businesses = self.db[self.collection_name].find({
+            'location': {'$geoWithin': {'$centerSphere': [[lng, lat], radius / distance.EARTH_RADIUS_METERS]}},
+            'date': {'$gte': self._cutoff()}
+        })
+
+        results = []
+        for business in nearby_businesses:
+            business_lng, business_lat = business['location']['coordinates']
+            results.append((business, distance.distance(lat, lng, business_lat, business_lng)))
+
+        self._count('local_answers')
+        return sorted(results, key=lambda result: result[1])
+
+    def stats(self):
+        """
+        Returns counters describing the store's use.
+
+        :return: dict with number of local answers, wide fetches, businesses upserted, and queries left uncovered
+        """
+        with self._lock:
+            return dict(self._stats)
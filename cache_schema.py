@@ -0,0 +1,125 @@
+"""
+This module converts upstream API responses into the compact documents stored in the caches, and reads cached data in
+either the compact format or the raw upstream format stored before it.
+
+Compact formats, marked with 'schema': SCHEMA_VERSION:
+    weather:          {'weather_main': ['Clear', ...]}
+    forecast:         {'forecast_dt': [epoch int, ...], 'forecast_main': ['Clouds', ...]}, parallel arrays sorted by
+                      dt. both are None if the forecast could not be fetched.
+    sunrise/sunset:   {'sunrise': epoch int, 'sunset': epoch int}
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import calendar
+import datetime
+
+SCHEMA_VERSION = 2
+
+
+def compact_weather(weather_resp):
+    """
+    Extracts the fields used from an OpenWeatherMap current weather response.
+
+    :param weather_resp: dict weather response, or empty if the request failed.
+    :return: dict in the compact weather format
+    """
+    return {
+        'schema': SCHEMA_VERSION,
+        'weather_main': [weather['main'] for weather in weather_resp['weather']] if weather_resp else []
+    }
+
+
+def compact_forecast(forecast_resp):
+    """
+    Extracts the fields used from an OpenWeatherMap 5 day forecast response.
+
+    :param forecast_resp: dict forecast response, or empty if the request failed.
+    :return: dict in the compact forecast format
+    """
+    if not forecast_resp:
+        return {'schema': SCHEMA_VERSION, 'forecast_dt': None, 'forecast_main': None}
+
+    predictions = sorted(forecast_resp['list'], key=lambda prediction: prediction['dt'])
+    return {
+        'schema': SCHEMA_VERSION,
+        'forecast_dt': [prediction['dt'] for prediction in predictions],
+        'forecast_main': [prediction['weather'][0]['main'] for prediction in predictions]
+    }
+
+
+def compact_sunrise_sunset(sunrise_sunset_dict):
+    """
+    Extracts the fields used from sunrise-sunset.org "results", or the same fields computed by solar.sunrise_sunset.
+
+    :param sunrise_sunset_dict: dict with 'sunrise' and 'sunset' UTC time strings, or empty if unavailable.
+    :return: dict in the compact sunrise/sunset format, empty if unavailable
+    """
+    if not sunrise_sunset_dict:
+        return {}
+
+    return {
+        'schema': SCHEMA_VERSION,
+        'sunrise': _epoch(sunrise_sunset_dict['sunrise']),
+        'sunset': _epoch(sunrise_sunset_dict['sunset'])
+    }
+
+
+def _epoch(time_string):
+    """
+    Converts a UTC time string like '2019-03-02T12:25:00+00:00' to epoch seconds.
+
+    :param time_string: string UTC time
+    :return: int epoch seconds
+    """
+    return calendar.timegm(datetime.datetime.fromisoformat(time_string).utctimetuple())
+
+
+def weather_main(weather_data):
+    """
+    Returns the weather 'main' values from cached weather data in either format.
+
+    :param weather_data: dict with compact 'weather_main', or raw response under 'weather'.
+    :return: list of strings, e.g. ['Clear']
+    """
+    if 'weather_main' in weather_data:
+        return weather_data['weather_main']
+
+    weather_resp = weather_data.get('weather')
+    return [weather['main'] for weather in weather_resp['weather']] if weather_resp else []
+
+
+def forecast_series(forecast_data):
+    """
+    Returns the forecast as parallel arrays from cached forecast data in either format.
+
+    :param forecast_data: dict with compact 'forecast_dt' and 'forecast_main', or raw response under 'forecast'.
+    :return: tuple of (list of epoch ints, list of strings) sorted by time, or None if there is no forecast
+    """
+    if 'forecast_dt' in forecast_data:
+        if forecast_data['forecast_dt'] is None:
+            return None
+        return forecast_data['forecast_dt'], forecast_data['forecast_main']
+
+    forecast_resp = forecast_data.get('forecast')
+    if not forecast_resp:
+        return None
+
+    compact = compact_forecast(forecast_resp)
+    return compact['forecast_dt'], compact['forecast_main']
+
+
+def sunrise_sunset_epochs(sunrise_sunset_data):
+    """
+    Returns sunrise and sunset from cached sunrise/sunset data in either format.
+
+    :param sunrise_sunset_data: dict with compact epoch ints or raw time strings under 'sunrise' and 'sunset'.
+    :return: tuple of (int, int) sunrise and sunset epoch seconds, or None if unavailable
+    """
+    if not sunrise_sunset_data or 'sunrise' not in sunrise_sunset_data:
+        return None
+
+    sunrise, sunset = sunrise_sunset_data['sunrise'], sunrise_sunset_data['sunset']
+    if isinstance(sunrise, int):
+        return sunrise, sunset
+    return _epoch(sunrise), _epoch(sunset)
@@ -0,0 +1,186 @@
+"""
+This module answers which campus buildings contain or are near a location, using the footprints in campus_locations.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import math
+from array import array
+
+from geo_cells import METERS_PER_DEGREE_LAT
+from spatial_index import GridIndex
+from yelp import Yelp
+
+
+class CampusBuilding(object):
+    """
+    A campus building footprint, parsed once into compact coordinate arrays.
+
+    Attributes:
+        name (string): name of the building, cleaned using Yelp.clean_string.
+        category (string): building category from its 'des' field, cleaned using Yelp.clean_string.
+        lats (array): latitudes of the polygon vertices, with the first vertex repeated at the end.
+        lngs (array): longitudes of the polygon vertices, with the first vertex repeated at the end.
+        bbox (tuple): (min_lat, min_lng, max_lat, max_lng) bounding box of the polygon.
+        center (tuple): (lat, lng) centerpoint of the building.
+    """
+
+    def __init__(self, facility):
+        """
+        Returns a CampusBuilding object parsed from a campus_locations.campus_buildings entry.
+
+        :param facility: dict 'Facility' value of a campus_buildings entry.
+        """
+        self.name = Yelp.clean_string(facility['name'])
+        self.category = Yelp.clean_string(facility['des'])
+
+        points = [point.split(',') for point in facility['the_points'].split('|') if point.strip()]
+        self.lats = array('d', [float(point[0]) for point in points])
+        self.lngs = array('d', [float(point[1]) for point in points])
+
+        # close the polygon if needed
+        if self.lats[0] != self.lats[-1] or self.lngs[0] != self.lngs[-1]:
+            self.lats.append(self.lats[0])
+            self.lngs.append(self.lngs[0])
+
+        self.bbox = (min(self.lats), min(self.lngs), max(self.lats), max(self.lngs))
+
+        center_lat, center_lng = facility['centerpoint'].split(',')
+        self.center = (float(center_lat), float(center_lng))
+
+    def contains(self, lat, lng):
+        """
+        Returns whether a location is inside the building footprint, using ray casting.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :return: bool
+        """
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+
+        inside = False
+        lats, lngs = self.lats, self.lngs
+        for i in range(len(lats) - 1):
+            lat_a, lng_a, lat_b, lng_b = lats[i], lngs[i], lats[i + 1], lngs[i + 1]
+            if (lat_a > lat) != (lat_b > lat):
+                crossing_lng = lng_a + (lat - lat_a) * (lng_b - lng_a) / (lat_b - lat_a)
+                if lng < crossing_lng:
+                    inside = not inside
+        return inside
+
+    def distance(self, lat, lng):
+        """
+        Returns the distance from a location to the building footprint, 0 if inside. Uses a flat-earth approximation
+        around the location, which is accurate to well under a meter at campus scale.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :return: float distance in meters.
+        """
+        if self.contains(lat, lng):
+            return 0.0
+
+        meters_per_degree_lng = METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))
+        xs = [(vertex_lng - lng) * meters_per_degree_lng for vertex_lng in self.lngs]
+        ys = [(vertex_lat - lat) * METERS_PER_DEGREE_LAT for vertex_lat in self.lats]
+
+        nearest = float('inf')
+        for i in range(len(xs) - 1):
+            x_a, y_a, x_b, y_b = xs[i], ys[i], xs[i + 1], ys[i + 1]
+            edge_x, edge_y = x_b - x_a, y_b - y_a
+            edge_length_sq = edge_x * edge_x + edge_y * edge_y
+
+            # project location (the origin) onto the edge, clamped to its endpoints
+            t = 0.0 if edge_length_sq == 0 else max(0.0, min(1.0, -(x_a * edge_x + y_a * edge_y) / edge_length_sq))
+            nearest = min(nearest, math.hypot(x_a + t * edge_x, y_a + t * edge_y))
+        return nearest
+
+    def radius(self):
+        """
+        Returns an upper bound on the distance from the centerpoint to any vertex.
+
+        :return: float distance in meters.
+        """
+        meters_per_degree_lng = METERS_PER_DEGREE_LAT * math.cos(math.radians(self.center[0]))
+        return max(math.hypot((vertex_lat - self.center[0]) * METERS_PER_DEGREE_LAT,
+                              (vertex_lng - self.center[1]) * meters_per_degree_lng)
+                   for vertex_lat, vertex_lng in zip(self.lats, self.lngs))
+
+
+class CampusGeometry(object):
+    """
+    Spatial index over campus building footprints.
+
+    Attributes:
+        buildings (list): CampusBuilding objects.
+        index (GridIndex): index of building centerpoints.
+        max_radius (float): largest building radius in meters, used to widen centerpoint queries.
+    """
+
+    def __init__(self, campus_buildings, cell_size=100.0):
+        """
+        Returns a CampusGeometry object with buildings parsed and indexed.
+
+        :param campus_buildings: list of {'Facility': {...}} dicts, as in campus_locations.campus_buildings.
+        :param cell_size: optional float size in meters of index cells.
+        """
+        self.buildings = [CampusBuilding(building['Facility']) for building in campus_buildings]
+        self.index = GridIndex(cell_size_meters=cell_size)
+        self.max_radius = 0.0
+
+        for building in self.buildings:
+            self.index.insert(building.center[0], building.center[1], building)
+            self.max_radius = max(self.max_radius, building.radius())
+
+    def containing(self, lat, lng):
+        """
+        Returns buildings whose footprint contains a location.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :return: list of CampusBuilding.
+        """
+        return [building for _, _, building in self.index.candidates(lat, lng, self.max_radius)
+                if building.contains(lat, lng)]
+
+    def nearest(self, lat, lng, distance_threshold):
+        """
+        Returns buildings within distance_threshold of a location, nearest first. Buildings containing the location
+        have distance 0.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :param distance_threshold: float distance in meters.
+        :return: list of (CampusBuilding, float distance in meters) tuples.
+        """
+        # cheap bounding box check in degrees before computing exact distance to the footprint
+        lat_delta = distance_threshold / METERS_PER_DEGREE_LAT
+        lng_delta = lat_delta / max(math.cos(math.radians(lat)), 1e-6)
+
+        results = []
+        for _, _, building in self.index.candidates(lat, lng, self.max_radius + distance_threshold):
+            min_lat, min_lng, max_lat, max_lng = building.bbox
+            if not (min_lat - lat_delta <= lat <= max_lat + lat_delta and
+                    min_lng - lng_delta <= lng <= max_lng + lng_delta):
+                continue
+
+            dist = building.distance(lat, lng)
+            if dist <= distance_threshold:
+                results.append((building, dist))
+        return sorted(results, key=lambda result: result[1])
+
+    def place_categories_dict(self, lat, lng, distance_threshold=0.0):
+        """
+        Returns categories of buildings containing or within distance_threshold of a location, in the same shape as
+        Yelp.fetch_all_locations.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :param distance_threshold: optional float distance in meters.
+        :return: dict, e.g. {'blomquist_recreation_center': {'distance': 0.0, 'categories': ['gym']}}. if two
+            buildings share a name, the nearer one is kept.
+        """
+        return {building.name: {'categories': [building.category], 'distance': dist}
+                for building, dist in reversed(self.nearest(lat, lng, distance_threshold))}
@@ -1,6 +1,25 @@
 import datetime
-from pymongo import MongoClient, GEO2D
-from geopy.distance import geodesic 
+import threading
+import uuid
+from pymongo import MongoClient, GEOSPHERE
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+import distance
+from memory_cache import LocationLRUCache
+from geo_cells import tile_id, tile_center
+
+
+class NegativeResult(object):
+    """
+    Wraps data fetched for a failed or empty upstream response, so that it is cached with the collection's negative
+    TTL instead of its usual time threshold.
+
+    Attributes:
+        data: data to cache and return in place of a real response, e.g. an empty list.
+    """
+
+    def __init__(self, data):
+        self.data = data
 
 
 class DataCache(object):
@@ -12,14 +31,25 @@ class DataCache(object):
         mongo_uri: A string that tells what MongoDB to use for the location cache.
         db: DB to use.
         client: Mongo client initialized with mongo_uri.
+        l1_max_entries: Number of documents per collection to keep in the in-process L1 tier. 0 disables it.
+        l1: dict of collection name to LocationLRUCache, the in-process L1 tier in front of MongoDB (the L2 tier).
+        tile_sizes: dict of collection name to tile size in meters, for collections keyed by tile instead of by
+            nearest location. Documents in these collections use the tile id as '_id', so reads are point lookups
+            and writes are upserts.
+        negative_ttls: dict of collection name to minutes that documents cached for failed or empty upstream
+            responses are valid for, instead of the time threshold given to lookups. Negative documents are never
+            held in L1.
     """
 
-    def __init__(self, mongo_uri, db_name):
+    def __init__(self, mongo_uri, db_name, l1_max_entries=0, tile_sizes=None, negative_ttls=None):
         """
         Returns a DataCache object with class variables and MongoDB client initialized.
 
         :param mongo_uri: A string that tells what MongoDB to use for the location cache.
         :param db_name: A string indicating DB to use.
+        :param l1_max_entries: optional int number of documents per collection to keep in memory. 0 disables L1.
+        :param tile_sizes: optional dict of collection name to tile size in meters, for collections to key by tile.
+        :param negative_ttls: optional dict of collection name to minutes negative documents are valid for.
         """
         # setup DB related attributes
         self.mongo_uri = mongo_uri
@@ -27,6 +57,160 @@ class DataCache(object):
 
         self.db = self.client[db_name]
 
+        # setup in-process L1 tier, created per collection on first use
+        self.l1_max_entries = l1_max_entries
+        self.l1 = {}
+
+        # setup tile-keyed collections
+        if tile_sizes is None:
+            tile_sizes = {}
+
+        self.tile_sizes = tile_sizes
+
+        # setup negative caching
+        if negative_ttls is None:
+            negative_ttls = {}
+
+        self.negative_ttls = negative_ttls
+
+        # collections whose indexes have been created by this process
+        self._indexed_collections = set()
+
+        self._stats = {
+            'l1': {'hits': 0, 'misses': 0},
+            'l2': {'hits': 0, 'expired': 0, 'misses': 0},
+            'negative': {'hits': 0, 'writes': 0}
+        }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def age_in_minutes(cached_doc):
+        """
+        Returns how long ago a cached document was added or updated.
+
+        :param cached_doc: dict cached document, as returned by fetch_from_cache.
+        :return: float age in minutes
+        """
+        return (datetime.datetime.utcnow() - cached_doc['date']).total_seconds() / 60.0
+
+    def _time_threshold_for(self, collection_name, cached_doc, time_threshold):
+        """
+        Returns how long a cached document is valid for, which is the collection's negative TTL for negative documents.
+
+        :param collection_name: A string indicating collection the document is from.
+        :param cached_doc: dict cached document.
+        :param time_threshold: An int that specifies the longest positive data is valid for in minutes.
+        :return: minutes the document is valid for
+        """
+        if cached_doc.get('negative') and collection_name in self.negative_ttls:
+            return self.negative_ttls[collection_name]
+        return time_threshold
+
+    def _is_valid(self, collection_name, cached_doc, time_threshold, current_date):
+        """
+        Returns whether a document from MongoDB is still valid, counting hits on negative documents.
+
+        :param collection_name: A string indicating collection the document is from.
+        :param cached_doc: dict cached document.
+        :param time_threshold: An int that specifies the longest positive data is valid for in minutes.
+        :param current_date: datetime to compute the document's age at.
+        :return: bool
+        """
+        time_delta_mins = divmod((current_date - cached_doc['date']).total_seconds(), 60)[0]
+        valid = time_delta_mins < self._time_threshold_for(collection_name, cached_doc, time_threshold)
+        if valid and cached_doc.get('negative'):
+            self._count('negative', 'hits')
+        return valid
+
+    def _put_l1(self, l1_cache, cached_doc):
+        """
+        Adds a document to L1, unless L1 is disabled or the document is negative.
+
+        :param l1_cache: LocationLRUCache, or None if L1 is disabled.
+        :param cached_doc: dict cached document.
+        :return: None
+        """
+        if l1_cache is not None and not cached_doc.get('negative'):
+            l1_cache.put(cached_doc)
+
+    def ensure_indexes(self, collection_name):
+        """
+        Creates the indexes a collection needs for lookups, once per process.
+
+        :param collection_name: A string indicating collection to use.
+        :return: the collection
+        """
+        current_collection = self.db[collection_name]
+        if collection_name in self._indexed_collections:
+            return current_collection
+
+        # spherical index so that lookups can be bounded by distance in meters on the server
+        # the planar index used by older lookups is left alone here, see migrate_indexes
+        current_collection.create_index([('location', GEOSPHERE)])
+
+        with self._lock:
+            self._indexed_collections.add(collection_name)
+        return current_collection
+
+    def migrate_indexes(self, collection_name):
+        """
+        Drops the planar 'location_2d' index older lookups used, and creates the spherical index current lookups use.
+
+        Older workers create the planar index again on every lookup, so this is run once, after every worker runs a
+        version that no longer does (see migrate_cache_indexes.py), rather than at request time.
+
+        :param collection_name: A string indicating collection to use.
+        :return: bool whether the planar index was dropped
+        """
+        current_collection = self.db[collection_name]
+        current_collection.create_index([('location', GEOSPHERE)])
+
+        if 'location_2d' not in current_collection.index_information():
+            return False
+        current_collection.drop_index('location_2d')
+        return True
+
+    def _l1_for(self, collection_name):
+        """
+        Returns the L1 cache for a collection, creating it if needed.
+
+        :param collection_name: A string indicating collection to use.
+        :return: LocationLRUCache for the collection, or None if L1 is disabled.
+        """
+        if self.l1_max_entries <= 0:
+            return None
+
+        with self._lock:
+            if collection_name not in self.l1:
+                self.l1[collection_name] = LocationLRUCache(max_entries=self.l1_max_entries)
+            return self.l1[collection_name]
+
+    def _count(self, tier, counter):
+        """
+        Increments a hit/miss counter for a cache tier.
+
+        :param tier: A string, either 'l1' or 'l2'.
+        :param counter: A string naming the counter to increment.
+        :return: None
+        """
+        with self._lock:
+            self._stats[tier][counter] += 1
+
+    def stats(self):
+        """
+        Returns hit, miss, and eviction counts for each cache tier.
+
+        :return: dict with 'l1' and 'l2' counters.
+        """
+        with self._lock:
+            l1_caches = list(self.l1.values())
+            stats = {tier: dict(counters) for tier, counters in self._stats.items()}
+
+        stats['l1']['evictions'] = sum(l1_cache.evictions for l1_cache in l1_caches)
+        stats['l1']['expirations'] = sum(l1_cache.expirations for l1_cache in l1_caches)
+        stats['l1']['size'] = sum(len(l1_cache) for l1_cache in l1_caches)
+        return stats
+
     def fetch_from_cache(self, collection_name, lat, lng, distance_threshold, time_threshold):
         """
         Fetches the nearest cached location to lat, lng and returns if within self.threshold distance.
@@ -38,20 +222,45 @@ class DataCache(object):
         :param time_threshold: An int that specifies the longest data in the cache is valid for in minutes.
         :return: tuple of (dict, bool) where dict is cached location (or None) and bool is whether location is valid
         """
-        # get the current collection
-        current_collection = self.db[collection_name]
+        # tile-keyed collections are looked up by exact tile id instead
+        if collection_name in self.tile_sizes:
+            return self._fetch_tile_from_cache(collection_name, lat, lng, time_threshold)
+
+        # check the in-process L1 tier first, it only holds documents that are still valid
+        l1_cache = self._l1_for(collection_name)
+        if l1_cache is not None:
+            l1_cached_loc, l1_dist = l1_cache.lookup(lat, lng, distance_threshold, time_threshold)
+            if l1_cached_loc is not None:
+                self._count('l1', 'hits')
+                print('{} -- L1 cache hit: {} meters away.'.format(collection_name, l1_dist))
+                return l1_cached_loc, True
+            self._count('l1', 'misses')
 
-        # setup index if it doesnt already exist
-        current_collection.create_index([('location', GEO2D)])
+        # get the current collection, creating its indexes on first use
+        current_collection = self.ensure_indexes(collection_name)
 
-        # find nearest location
-        nearest_cached_loc = current_collection.find_one({'location': {'$near': [lng, lat]}})
+        # find nearest location within distance_threshold, letting the server compute the distance in meters
+        try:
+            nearest_cached_locs = list(current_collection.aggregate([
+                {'$geoNear': {
+                    'near': {'type': 'Point', 'coordinates': [lng, lat]},
+                    'key': 'location',
+                    'distanceField': 'distance',
+                    'maxDistance': distance_threshold,
+                    'spherical': True
+                }},
+                {'$limit': 1}
+            ]))
+        except OperationFailure as e:
+            # $geoNear fails while the planar index older workers create is still there, until migrate_indexes runs
+            print('{} -- $geoNear failed, falling back to $geoWithin: {}'.format(collection_name, e))
+            nearest_cached_locs = self._nearest_within(current_collection, lat, lng, distance_threshold)
+        nearest_cached_loc = nearest_cached_locs[0] if nearest_cached_locs else None
 
         # check if valid cache object is returned
         if nearest_cached_loc is not None:
-            # compute distance to nearest cached object
-            nearest_cached_loc_location = (nearest_cached_loc['location'][1], nearest_cached_loc['location'][0])
-            dist_to_nearest = geodesic(nearest_cached_loc_location, (lat, lng)).meters
+            # distance to nearest cached object, as computed by $geoNear
+            dist_to_nearest = nearest_cached_loc.pop('distance')
 
             # compute time diff between cached object and current time
             current_date = datetime.datetime.utcnow()
@@ -65,15 +274,196 @@ class DataCache(object):
             # cache is valid if within distance
             if dist_to_nearest < distance_threshold:
                 # return cache object iff valid AND within time threshold
-                if time_delta_mins_to_nearest < time_threshold:
+                if self._is_valid(collection_name, nearest_cached_loc, time_threshold, current_date):
+                    self._count('l2', 'hits')
+                    self._put_l1(l1_cache, nearest_cached_loc)
                     return nearest_cached_loc, True
                 else:
+                    self._count('l2', 'expired')
                     return nearest_cached_loc, False
 
         # no valid cache object could be found
+        self._count('l2', 'misses')
         return None, False
 
-    def add_to_cache(self, collection_name, lat, lng, data_to_save):
+    def _nearest_within(self, current_collection, lat, lng, distance_threshold):
+        """
+        Finds the nearest cached location within distance_threshold without $geoNear, which does not need a single
+        geo index on 'location'.
+
+        :param current_collection: pymongo collection to search.
+        :param lat: Latitude of location, as float.
+        :param lng: Longitude of location, as float.
+        :param distance_threshold: A float distance in meters the cached location must be within.
+        :return: list with the nearest cached location, its 'distance' set in meters, or an empty list
+        """
+        radius_radians = distance_threshold / distance.EARTH_RADIUS_METERS
+        candidate_locs = list(current_collection.find({
+            'location': {'$geoWithin': {'$centerSphere': [[lng, lat], radius_radians]}}
+        }))
+        if not candidate_locs:
+            return []
+
+        dists = distance.distance_many(lat, lng,
+                                       [candidate_loc['location'][1] for candidate_loc in candidate_locs],
+                                       [candidate_loc['location'][0] for candidate_loc in candidate_locs])
+        nearest = min(range(len(candidate_locs)), key=dists.__getitem__)
+        candidate_locs[nearest]['distance'] = float(dists[nearest])
+        return [candidate_locs[nearest]]
+
+    def _fetch_tile_from_cache(self, collection_name, lat, lng, time_threshold):
+        """
+        Fetches the cached document for the tile containing lat, lng.
+
+        :param collection_name: A string indicating a tile-keyed collection to use.
+        :param lat: Latitude of location, as float.
+        :param lng: Longitude of location, as float.
+        :param time_threshold: An int that specifies the longest data in the cache is valid for in minutes.
+        :return: tuple of (dict, bool) where dict is cached tile (or None) and bool is whether tile is valid
+        """
+        tile = tile_id(lat, lng, self.tile_sizes[collection_name])
+
+        # check the in-process L1 tier first, it only holds documents that are still valid
+        l1_cache = self._l1_for(collection_name)
+        if l1_cache is not None:
+            l1_cached_tile = l1_cache.get(tile, time_threshold)
+            if l1_cached_tile is not None:
+                self._count('l1', 'hits')
+                print('{} -- L1 cache hit: tile {}.'.format(collection_name, tile))
+                return l1_cached_tile, True
+            self._count('l1', 'misses')
+
+        cached_tile = self.ensure_indexes(collection_name).find_one({'_id': tile})
+        if cached_tile is None:
+            self._count('l2', 'misses')
+            return None, False
+
+        # compute time diff between cached object and current time
+        current_date = datetime.datetime.utcnow()
+        time_delta_sec = (current_date - cached_tile['date']).total_seconds()
+        time_delta_mins = divmod(time_delta_sec, 60)[0]
+
+        print('{} -- Cached tile {}: {} minutes ago.'.format(collection_name, tile, time_delta_mins))
+
+        if self._is_valid(collection_name, cached_tile, time_threshold, current_date):
+            self._count('l2', 'hits')
+            self._put_l1(l1_cache, cached_tile)
+            return cached_tile, True
+
+        self._count('l2', 'expired')
+        return cached_tile, False
+
+    def fetch_many_from_cache(self, collection_name, locations, distance_threshold, time_threshold):
+        """
+        Fetches the nearest cached location for each of many locations, with a single MongoDB query for all those not
+        held in L1.
+
+        :param collection_name: A string indicating collection to use.
+        :param locations: list of (lat, lng) tuples of floats.
+        :param distance_threshold: A float that determine the distance in meters the nearest cache entry must be within.
+        :param time_threshold: An int that specifies the longest data in the cache is valid for in minutes.
+        :return: list of (dict, bool) tuples in the same order as locations, as returned by fetch_from_cache
+        """
+        # tile-keyed collections are looked up by exact tile id instead
+        if collection_name in self.tile_sizes:
+            return self._fetch_many_tiles_from_cache(collection_name, locations, time_threshold)
+
+        results = [(None, False)] * len(locations)
+
+        # check the in-process L1 tier first, it only holds documents that are still valid
+        l1_cache = self._l1_for(collection_name)
+        remaining = []
+        for i, (lat, lng) in enumerate(locations):
+            if l1_cache is not None:
+                l1_cached_loc, _ = l1_cache.lookup(lat, lng, distance_threshold, time_threshold)
+                if l1_cached_loc is not None:
+                    self._count('l1', 'hits')
+                    results[i] = (l1_cached_loc, True)
+                    continue
+                self._count('l1', 'misses')
+            remaining.append(i)
+
+        if not remaining:
+            return results
+
+        # get every cached location within distance_threshold of any remaining location in one query
+        current_collection = self.ensure_indexes(collection_name)
+        radius_radians = distance_threshold / distance.EARTH_RADIUS_METERS
+        candidate_locs = list(current_collection.find({'$or': [
+            {'location': {'$geoWithin': {'$centerSphere': [[locations[i][1], locations[i][0]], radius_radians]}}}
+            for i in remaining
+        ]}))
+        candidate_lngs = [candidate_loc['location'][0] for candidate_loc in candidate_locs]
+        candidate_lats = [candidate_loc['location'][1] for candidate_loc in candidate_locs]
+
+        current_date = datetime.datetime.utcnow()
+        for i in remaining:
+            # pick the nearest candidate for this location
+            nearest_cached_loc = None
+            if candidate_locs:
+                dists = distance.distance_many(locations[i][0], locations[i][1], candidate_lats, candidate_lngs)
+                nearest = min(range(len(candidate_locs)), key=dists.__getitem__)
+                if dists[nearest] < distance_threshold:
+                    nearest_cached_loc = candidate_locs[nearest]
+
+            if nearest_cached_loc is None:
+                self._count('l2', 'misses')
+                continue
+
+            if self._is_valid(collection_name, nearest_cached_loc, time_threshold, current_date):
+                self._count('l2', 'hits')
+                self._put_l1(l1_cache, nearest_cached_loc)
+                results[i] = (nearest_cached_loc, True)
+            else:
+                self._count('l2', 'expired')
+                results[i] = (nearest_cached_loc, False)
+
+        return results
+
+    def _fetch_many_tiles_from_cache(self, collection_name, locations, time_threshold):
+        """
+        Fetches the cached document for the tile containing each of many locations, with a single MongoDB query for
+        all tiles not held in L1.
+
+        :param collection_name: A string indicating a tile-keyed collection to use.
+        :param locations: list of (lat, lng) tuples of floats.
+        :param time_threshold: An int that specifies the longest data in the cache is valid for in minutes.
+        :return: list of (dict, bool) tuples in the same order as locations, as returned by fetch_from_cache
+        """
+        tiles = [tile_id(lat, lng, self.tile_sizes[collection_name]) for lat, lng in locations]
+
+        # check the in-process L1 tier first, it only holds documents that are still valid
+        cached_tiles = {}
+        l1_cache = self._l1_for(collection_name)
+        for tile in set(tiles):
+            if l1_cache is not None:
+                l1_cached_tile = l1_cache.get(tile, time_threshold)
+                if l1_cached_tile is not None:
+                    self._count('l1', 'hits')
+                    cached_tiles[tile] = (l1_cached_tile, True)
+                    continue
+                self._count('l1', 'misses')
+            cached_tiles[tile] = (None, False)
+
+        remaining = [tile for tile, (cached_tile, _) in cached_tiles.items() if cached_tile is None]
+        if remaining:
+            current_date = datetime.datetime.utcnow()
+            for cached_tile in self.ensure_indexes(collection_name).find({'_id': {'$in': remaining}}):
+                if self._is_valid(collection_name, cached_tile, time_threshold, current_date):
+                    self._count('l2', 'hits')
+                    self._put_l1(l1_cache, cached_tile)
+                    cached_tiles[cached_tile['_id']] = (cached_tile, True)
+                else:
+                    self._count('l2', 'expired')
+                    cached_tiles[cached_tile['_id']] = (cached_tile, False)
+
+            for tile in remaining:
+                if cached_tiles[tile][0] is None:
+                    self._count('l2', 'misses')
+
+        return [cached_tiles[tile] for tile in tiles]
+
+    def add_to_cache(self, collection_name, lat, lng, data_to_save, negative=False):
         """
         Adds location to cache.
 
@@ -81,40 +471,126 @@ class DataCache(object):
         :param lat: Latitude of location, as float.
         :param lng: Longitude of location, as float.
         :param data_to_save: Data to save for location, as list
-        :return: inserted id of document, if successful
+        :param negative: optional bool whether the data is for a failed or empty upstream response.
+        :return: inserted id of document (the tile id for tile-keyed collections), if successful
         """
-        # get the current collection
-        current_collection = self.db[collection_name]
+        if negative:
+            self._count('negative', 'writes')
+
+        # get the current collection, creating its indexes on first use
+        current_collection = self.ensure_indexes(collection_name)
+
+        # tile-keyed collections upsert the tile, so concurrent misses in the same tile write one document
+        if collection_name in self.tile_sizes:
+            tile = tile_id(lat, lng, self.tile_sizes[collection_name])
+            tile_lat, tile_lng = tile_center(tile)
+            new_doc = {
+                '_id': tile,
+                'location': [tile_lng, tile_lat],  # longitude, latitude format
+                'data': data_to_save,
+                'date': datetime.datetime.utcnow(),
+                'negative': negative
+            }
+            current_collection.replace_one({'_id': tile}, new_doc, upsert=True)
+            inserted_id = tile
+        else:
+            # add new data to cache
+            new_doc = {
+                'location': [lng, lat],  # longitude, latitude format
+                'data': data_to_save,
+                'date': datetime.datetime.utcnow(),
+                'negative': negative
+            }
+            inserted_id = current_collection.insert_one(new_doc).inserted_id
 
-        # add new data to cache
-        return current_collection.insert_one({
-            'location': [lng, lat],  # longitude, latitude format
-            'data': data_to_save,
-            'date': datetime.datetime.utcnow()
-        }).inserted_id
+        # write through to L1 (insert_one sets '_id' on new_doc)
+        self._put_l1(self._l1_for(collection_name), new_doc)
 
-    def update_cache(self, collection_name, object_id, new_data_to_save):
+        return inserted_id
+
+    def update_cache(self, collection_name, object_id, new_data_to_save, negative=False):
         """
         Updates existing location in cache.
 
         :param collection_name: A string indicating collection to use.
         :param object_id: Id of object to update, as ObjectId
         :param new_data_to_save: Data to save for location, as list
+        :param negative: optional bool whether the data is for a failed or empty upstream response.
         :return: inserted id of document, if successful
         """
+        if negative:
+            self._count('negative', 'writes')
+
         # get the current collection
         current_collection = self.db[collection_name]
 
         # update data for object_id
-        return current_collection.update_one({
+        current_date = datetime.datetime.utcnow()
+        update_result = current_collection.update_one({
             '_id': object_id
         }, {
             '$set': {
                 'data': new_data_to_save,
-                'date': datetime.datetime.utcnow()
+                'date': current_date,
+                'negative': negative
             }
         }, upsert=False)
 
+        # write through to L1, which does not hold negative documents
+        l1_cache = self._l1_for(collection_name)
+        if l1_cache is not None:
+            if negative:
+                l1_cache.remove(object_id)
+            else:
+                l1_cache.update(object_id, new_data_to_save, current_date)
+
+        return update_result
+
+
+    def acquire_lock(self, key, lock_seconds):
+        """
+        Tries to take a short-lived lock shared by all workers using this DB, e.g. to let one worker fetch data for a
+        location while others wait for it to land in the cache.
+
+        :param key: A string identifying what is being locked.
+        :param lock_seconds: A float number of seconds after which the lock is considered abandoned.
+        :return: string owner token if the lock was taken, to pass to release_lock. None if another worker holds it.
+        """
+        lock_collection = self.db['CacheLocks']
+        if 'CacheLocks' not in self._indexed_collections:
+            # let MongoDB clean up abandoned locks
+            lock_collection.create_index('expires', expireAfterSeconds=0)
+            with self._lock:
+                self._indexed_collections.add('CacheLocks')
+
+        owner = uuid.uuid4().hex
+        current_date = datetime.datetime.utcnow()
+        lock_doc = {
+            '_id': key,
+            'owner': owner,
+            'expires': current_date + datetime.timedelta(seconds=lock_seconds)
+        }
+
+        try:
+            lock_collection.insert_one(lock_doc)
+            return owner
+        except DuplicateKeyError:
+            pass
+
+        # the TTL monitor only runs every minute, so take over locks that have expired but not been removed yet
+        taken_over = lock_collection.find_one_and_replace({'_id': key, 'expires': {'$lt': current_date}}, lock_doc)
+        return owner if taken_over is not None else None
+
+    def release_lock(self, key, owner):
+        """
+        Releases a lock taken with acquire_lock, if still held by owner.
+
+        :param key: A string identifying what is being locked.
+        :param owner: A string owner token returned by acquire_lock.
+        :return: None
+        """
+        self.db['CacheLocks'].delete_one({'_id': key, 'owner': owner})
+
 
 if __name__ == 'main':
     pass
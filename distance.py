@@ -0,0 +1,183 @@
+"""
+This module computes distances between locations, with a switch between an exact ellipsoidal backend and fast
+spherical approximations.
+
+Error bounds, relative to the exact WGS-84 geodesic:
+    geodesic:         exact (Karney's algorithm, via geopy). about two orders of magnitude slower than the others.
+    haversine:        great-circle distance on a sphere of mean earth radius. within 0.5% at any distance, so within
+                      0.3 meters at the 60 meter thresholds used for hardcoded locations.
+    equirectangular:  flat-earth approximation around the two points. adds less than 0.01% over haversine below
+                      10 kilometers at mid-latitudes, growing with distance and near the poles. only suitable for
+                      short distances.
+
+NumPy is used for the batched kernels if it is installed, otherwise they fall back to plain Python loops.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import math
+
+from geopy.distance import geodesic
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_METERS = 6371008.8  # mean earth radius
+
+BACKENDS = ('geodesic', 'haversine', 'equirectangular')
+_backend = 'haversine'
+
+
+def geodesic_distance(lat1, lng1, lat2, lng2):
+    """
+    Returns the exact ellipsoidal distance between two locations.
+
+    :param lat1: float latitude of first location.
+    :param lng1: float longitude of first location.
+    :param lat2: float latitude of second location.
+    :param lng2: float longitude of second location.
+    :return: float distance in meters.
+    """
+    return geodesic((lat1, lng1), (lat2, lng2)).meters
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    Returns the great-circle distance between two locations.
+
+    :param lat1: float latitude of first location.
+    :param lng1: float longitude of first location.
+    :param lat2: float latitude of second location.
+    :param lng2: float longitude of second location.
+    :return: float distance in meters.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    sin_dphi = math.sin((phi2 - phi1) / 2.0)
+    sin_dlambda = math.sin(math.radians(lng2 - lng1) / 2.0)
+    a = sin_dphi * sin_dphi + math.cos(phi1) * math.cos(phi2) * sin_dlambda * sin_dlambda
+    return 2.0 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def equirectangular(lat1, lng1, lat2, lng2):
+    """
+    Returns the flat-earth approximate distance between two nearby locations.
+
+    :param lat1: float latitude of first location.
+    :param lng1: float longitude of first location.
+    :param lat2: float latitude of second location.
+    :param lng2: float longitude of second location.
+    :return: float distance in meters.
+    """
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2.0))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_METERS * math.sqrt(x * x + y * y)
+
+
+def haversine_many(lat, lng, lats, lngs):
+    """
+    Returns the great-circle distance from one location to many.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param lats: sequence of float latitudes.
+    :param lngs: sequence of float longitudes.
+    :return: numpy array (or list, without numpy) of float distances in meters.
+    """
+    if np is None:
+        return [haversine(lat, lng, other_lat, other_lng) for other_lat, other_lng in zip(lats, lngs)]
+
+    phi1 = math.radians(lat)
+    phi2 = np.radians(np.asarray(lats, dtype=float))
+    sin_dphi = np.sin((phi2 - phi1) / 2.0)
+    sin_dlambda = np.sin(np.radians(np.asarray(lngs, dtype=float) - lng) / 2.0)
+    a = sin_dphi * sin_dphi + math.cos(phi1) * np.cos(phi2) * sin_dlambda * sin_dlambda
+    return 2.0 * EARTH_RADIUS_METERS * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def equirectangular_many(lat, lng, lats, lngs):
+    """
+    Returns the flat-earth approximate distance from one location to many nearby ones.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param lats: sequence of float latitudes.
+    :param lngs: sequence of float longitudes.
+    :return: numpy array (or list, without numpy) of float distances in meters.
+    """
+    if np is None:
+        return [equirectangular(lat, lng, other_lat, other_lng) for other_lat, other_lng in zip(lats, lngs)]
+
+    lats = np.asarray(lats, dtype=float)
+    x = np.radians(np.asarray(lngs, dtype=float) - lng) * np.cos(np.radians((lats + lat) / 2.0))
+    y = np.radians(lats - lat)
+    return EARTH_RADIUS_METERS * np.sqrt(x * x + y * y)
+
+
+def geodesic_many(lat, lng, lats, lngs):
+    """
+    Returns the exact ellipsoidal distance from one location to many.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param lats: sequence of float latitudes.
+    :param lngs: sequence of float longitudes.
+    :return: list of float distances in meters.
+    """
+    return [geodesic_distance(lat, lng, other_lat, other_lng) for other_lat, other_lng in zip(lats, lngs)]
+
+
+_KERNELS = {
+    'geodesic': (geodesic_distance, geodesic_many),
+    'haversine': (haversine, haversine_many),
+    'equirectangular': (equirectangular, equirectangular_many)
+}
+
+
+def set_backend(backend):
+    """
+    Sets the backend used by distance and distance_many.
+
+    :param backend: string, one of BACKENDS.
+    :return: None
+    """
+    global _backend
+    if backend not in _KERNELS:
+        raise ValueError('distance backend should be one of {}, got {}'.format(BACKENDS, backend))
+    _backend = backend
+
+
+def get_backend():
+    """
+    Returns the name of the backend used by distance and distance_many.
+
+    :return: string, one of BACKENDS.
+    """
+    return _backend
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """
+    Returns the distance between two locations, using the current backend.
+
+    :param lat1: float latitude of first location.
+    :param lng1: float longitude of first location.
+    :param lat2: float latitude of second location.
+    :param lng2: float longitude of second location.
+    :return: float distance in meters.
+    """
+    return _KERNELS[_backend][0](lat1, lng1, lat2, lng2)
+
+
+def distance_many(lat, lng, lats, lngs):
+    """
+    Returns the distance from one location to many, using the current backend.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param lats: sequence of float latitudes.
+    :param lngs: sequence of float longitudes.
+    :return: sequence of float distances in meters.
+    """
+    return _KERNELS[_backend][1](lat, lng, lats, lngs)
@@ -0,0 +1,76 @@
+"""
+This module answers point-in-time questions about a forecast with binary search over its timestamps.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+from bisect import bisect_left, bisect_right
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class ForecastTimeline(object):
+    """
+    A forecast as parallel arrays of prediction times and predicted weather, sorted by time.
+
+    Attributes:
+        dts (list): epoch seconds of each prediction, ascending.
+        mains (list): predicted weather 'main' value of each prediction, e.g. 'Rain'.
+    """
+
+    def __init__(self, dts, mains):
+        """
+        Returns a ForecastTimeline object over already sorted predictions, e.g. as returned by
+        cache_schema.forecast_series.
+
+        :param dts: list of epoch seconds, ascending.
+        :param mains: list of strings, parallel to dts.
+        """
+        if len(dts) != len(mains):
+            raise ValueError('dts and mains should be the same length, got {} and {}'.format(len(dts), len(mains)))
+
+        self.dts = dts
+        self.mains = mains
+
+    def __len__(self):
+        return len(self.dts)
+
+    def at(self, t, max_gap=3 * 60 * 60):
+        """
+        Returns the predicted weather at a time, from the prediction nearest to it.
+
+        :param t: epoch seconds.
+        :param max_gap: optional seconds the nearest prediction may be from t.
+        :return: string predicted weather, or None if no prediction is within max_gap. ties go to the earlier one.
+        """
+        i = bisect_left(self.dts, t)
+        nearest = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self.dts) and abs(self.dts[j] - t) <= max_gap:
+                if nearest is None or abs(self.dts[j] - t) < abs(self.dts[nearest] - t):
+                    nearest = j
+        return self.mains[nearest] if nearest is not None else None
+
+    def first_near(self, t, window, same_utc_day=False):
+        """
+        Returns the predicted weather of the earliest prediction within window of a time.
+
+        :param t: epoch seconds.
+        :param window: seconds a prediction may be before or after t.
+        :param same_utc_day: optional bool to only consider predictions on the same UTC day as t.
+        :return: string predicted weather, or None if there is no such prediction.
+        """
+        for j in range(bisect_left(self.dts, t - window), bisect_right(self.dts, t + window)):
+            if not same_utc_day or self.dts[j] // SECONDS_PER_DAY == t // SECONDS_PER_DAY:
+                return self.mains[j]
+        return None
+
+    def between(self, start, end):
+        """
+        Returns the predicted weather of every prediction in a time range.
+
+        :param start: epoch seconds, inclusive.
+        :param end: epoch seconds, inclusive.
+        :return: list of strings, in time order.
+        """
+        return self.mains[bisect_left(self.dts, start):bisect_right(self.dts, end)]
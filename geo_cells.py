@@ -0,0 +1,53 @@
+"""
+This module snaps locations to square tiles of a given size, used as exact-match keys for cached data.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import math
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+# fewest meters per degree of latitude anywhere (WGS-84, at the equator), below what any distance backend measures, so
+# bounding boxes in degrees sized with it always contain the circle they are meant to cover
+MIN_METERS_PER_DEGREE_LAT = 110574.0
+
+
+def _lng_step(lat_step, row):
+    """
+    Returns the width in degrees of tiles in a row, so that tiles are roughly square on the ground.
+
+    :param lat_step: float height of a tile, in degrees.
+    :param row: int row of the tile, counted from the south pole.
+    :return: float width of a tile in this row, in degrees.
+    """
+    row_center_lat = -90.0 + (row + 0.5) * lat_step
+    return min(lat_step / max(math.cos(math.radians(row_center_lat)), 1e-6), 360.0)
+
+
+def tile_id(lat, lng, tile_size):
+    """
+    Returns the id of the tile containing a location.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param tile_size: float length of a tile side, in meters.
+    :return: string tile id, e.g. '10:1162310:65417'. tiles of different sizes never share an id.
+    """
+    lat_step = tile_size / METERS_PER_DEGREE_LAT
+    row = int(math.floor((lat + 90.0) / lat_step))
+    col = int(math.floor((lng + 180.0) / _lng_step(lat_step, row)))
+    return '{:g}:{}:{}'.format(tile_size, row, col)
+
+
+def tile_center(tile):
+    """
+    Returns the center of a tile.
+
+    :param tile: string tile id, as returned by tile_id.
+    :return: tuple of (float, float) latitude and longitude of the tile center.
+    """
+    tile_size, row, col = tile.split(':')
+    lat_step = float(tile_size) / METERS_PER_DEGREE_LAT
+    row, col = int(row), int(col)
+    return -90.0 + (row + 0.5) * lat_step, -180.0 + (col + 0.5) * _lng_step(lat_step, row)
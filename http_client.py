@@ -0,0 +1,365 @@
+"""
+This module provides the pooled HTTP session shared by the upstream API clients, with timeouts, a circuit breaker,
+and bounded retries so that a slow or failing upstream cannot stall the workers calling it.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds for requests sent without a PooledSession
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+# responses worth retrying, and counted as failures by the circuit breaker. other 4xx responses mean the request
+# itself is wrong and are returned right away.
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# number of recent attempts that hedge delays and the hedge budget are computed over
+RECENT_ATTEMPTS = 200
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    Raised instead of sending a request while an upstream's circuit breaker is open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to an upstream after consecutive failures, so callers fail fast instead of waiting on timeouts. After
+    reset_timeout seconds, one trial call is let through (half open): if it succeeds the breaker closes, otherwise it
+    opens again.
+
+    Attributes:
+        failure_threshold (int): consecutive failures that open the breaker.
+        reset_timeout (float): seconds to stay open before letting a trial call through.
+        state (string): 'closed', 'open', or 'half_open'.
+        times_opened (int): number of times the breaker has opened.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Returns a CircuitBreaker object, closed.
+
+        :param failure_threshold: optional int consecutive failures that open the breaker.
+        :param reset_timeout: optional float seconds to stay open before a trial call.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = 'closed'
+        self.times_opened = 0
+
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may be made now. While half open, only one trial call is allowed at a time.
+
+        :return: bool
+        """
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        """
+        Records a successful call, closing the breaker.
+
+        :return: None
+        """
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Records a failed call, opening the breaker after failure_threshold in a row or if a trial call failed.
+
+        :return: None
+        """
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self._failures >= self.failure_threshold):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                self.times_opened += 1
+
+    def stats(self):
+        """
+        Returns the breaker's state.
+
+        :return: dict with state, consecutive failures, and number of times opened
+        """
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'times_opened': self.times_opened
+            }
+
+
+class PooledSession(object):
+    """
+    Keep-alive HTTP session with a bounded connection pool per upstream host. Each API client owns one, so
+    connections are reused across requests handled by the same worker instead of opening a new TCP/TLS connection
+    for every call.
+
+    Every request has connect and read timeouts. Timeouts, connection errors and retryable statuses (RETRY_STATUSES)
+    are retried up to retries times with jittered exponential backoff, and counted by a circuit breaker that fails
+    requests fast with CircuitOpenError while the upstream is down.
+
+    Hedging is opt-in with hedge_percentile: if an attempt has not answered within that percentile of recent
+    latencies, a duplicate is sent and whichever answers first is used. Hedges are limited to hedge_budget of the last
+    RECENT_ATTEMPTS attempts, so a slow upstream cannot double quota usage, however long it was healthy before.
+
+    Attributes:
+        name (string): name of the upstream, used when reporting stats.
+        session (requests.Session): underlying session with pooled adapters mounted for http and https.
+        adapter (HTTPAdapter): adapter holding the per-host connection pools.
+        timeout (tuple): (connect, read) timeouts in seconds.
+        retries (int): number of times to retry a failed GET.
+        backoff (float): base delay in seconds before the first retry, doubled for each later one.
+        breaker (CircuitBreaker): circuit breaker for this upstream.
+        hedge_percentile (float): percentile of recent latencies after which to hedge, or None to never hedge.
+        hedge_budget (float): maximum fraction of recent attempts that may be hedged.
+        hedge_min_delay (float): minimum seconds to wait before hedging.
+    """
+
+    def __init__(self, name, pool_connections=4, pool_maxsize=16, pool_block=False, connect_timeout=3.05,
+                 read_timeout=10.0, retries=1, backoff=0.2, breaker=None, hedge_percentile=None, hedge_budget=0.05,
+                 hedge_min_delay=0.05, hedge_min_samples=20):
+        """
+        Returns a PooledSession object with class variables initialized.
+
+        :param name: string name of the upstream, used when reporting stats.
+        :param pool_connections: optional int number of per-host pools to keep.
+        :param pool_maxsize: optional int maximum number of connections kept open per host.
+        :param pool_block: optional bool for whether to wait for a free connection instead of opening a throwaway
+            one when a host's pool is exhausted, making pool_maxsize a hard per-host limit.
+        :param connect_timeout: optional float seconds to wait for a connection.
+        :param read_timeout: optional float seconds to wait between bytes of the response.
+        :param retries: optional int number of times to retry a failed GET.
+        :param backoff: optional float base delay in seconds before retrying.
+        :param breaker: optional CircuitBreaker. one with default settings is created if not provided.
+        :param hedge_percentile: optional float percentile (0-100) of recent latencies after which to send a
+            duplicate request. None disables hedging.
+        :param hedge_budget: optional float maximum fraction of recent attempts that may be hedged.
+        :param hedge_min_delay: optional float minimum seconds to wait before hedging.
+        :param hedge_min_samples: optional int number of latencies to observe before hedging.
+        """
+        self.name = name
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   pool_block=pool_block)
+
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        # setup resilience settings
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+
+        if breaker is None:
+            breaker = CircuitBreaker()
+
+        self.breaker = breaker
+
+        # setup hedging settings
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+
+        self._latencies = deque(maxlen=RECENT_ATTEMPTS)
+        self._recent_hedges = deque(maxlen=RECENT_ATTEMPTS)  # 1 for each recent attempt that was hedged, 0 otherwise
+        self._hedge_executor = None
+        if hedge_percentile is not None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=pool_maxsize * 2,
+                                                      thread_name_prefix='{}-hedge'.format(name))
+
+        self._counters = {'timeouts': 0, 'connection_errors': 0, 'retryable_statuses': 0, 'retries': 0,
+                          'short_circuited': 0, 'other_errors': 0, 'attempts': 0, 'hedges': 0, 'hedge_wins': 0,
+                          'hedges_over_budget': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _timed_get(self, url, **kwargs):
+        start = time.monotonic()
+        resp = self.session.get(url, **kwargs)
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return resp
+
+    def hedge_delay(self):
+        """
+        Returns how long to wait for an attempt before hedging it.
+
+        :return: float seconds, or None if hedging is disabled or too few latencies have been observed
+        """
+        if self.hedge_percentile is None:
+            return None
+
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.hedge_min_samples:
+            return None
+
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100.0))
+        return max(self.hedge_min_delay, latencies[index])
+
+    def _record_attempt(self, hedged):
+        with self._lock:
+            self._recent_hedges.append(1 if hedged else 0)
+
+    def _take_hedge(self):
+        # hedges are capped at hedge_budget of recent attempts, including this one, so credit from a long healthy
+        # period cannot be spent all at once
+        with self._lock:
+            if sum(self._recent_hedges) + 1 > self.hedge_budget * (len(self._recent_hedges) + 1):
+                self._counters['hedges_over_budget'] += 1
+                self._recent_hedges.append(0)
+                return False
+            self._counters['hedges'] += 1
+            self._recent_hedges.append(1)
+            return True
+
+    def _send(self, url, **kwargs):
+        """
+        Sends one attempt, hedging it if it is slower than hedge_delay and the budget allows.
+
+        :return: response object of whichever request answered first
+        """
+        self._count('attempts')
+        delay = self.hedge_delay()
+        if delay is None:
+            self._record_attempt(False)
+            return self._timed_get(url, **kwargs)
+
+        primary = self._hedge_executor.submit(self._timed_get, url, **kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            self._record_attempt(False)
+            return primary.result()
+        if not self._take_hedge():
+            return primary.result()
+
+        hedge = self._hedge_executor.submit(self._timed_get, url, **kwargs)
+        pending = [primary, hedge]
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # the slower request is left to finish in the background, and its response dropped
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded or not pending:
+                winner = (succeeded or list(done))[0]
+                if winner is hedge:
+                    self._count('hedge_wins')
+                return winner.result()
+
+    def get(self, url, **kwargs):
+        """
+        Sends a GET request over a pooled connection, retrying failures.
+
+        :param url: string url to request.
+        :param kwargs: optional arguments passed on to requests.Session.get (headers, params, etc.).
+        :return: response object. the last response is returned if retryable statuses persist.
+        :raises CircuitOpenError: if the circuit breaker is open.
+        :raises requests.exceptions.RequestException: if the last attempt timed out or could not connect, or any
+            other request error.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                # full jitter, so callers retrying together do not hit the upstream in lockstep
+                self._count('retries')
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+            if not self.breaker.allow():
+                self._count('short_circuited')
+                raise CircuitOpenError('{} circuit breaker is open'.format(self.name))
+
+            try:
+                resp = self._send(url, **kwargs)
+            except requests.exceptions.Timeout:
+                self._count('timeouts')
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                continue
+            except requests.exceptions.ConnectionError:
+                self._count('connection_errors')
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                continue
+            except Exception:
+                # e.g. ChunkedEncodingError or TooManyRedirects. not retried, but still a failure, so a half open
+                # breaker's trial slot is released instead of wedging the breaker open.
+                self._count('other_errors')
+                self.breaker.record_failure()
+                raise
+
+            if resp.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return resp
+
+            self._count('retryable_statuses')
+            self.breaker.record_failure()
+            if attempt == self.retries:
+                return resp
+
+    def stats(self):
+        """
+        Returns connection reuse counts across all host pools currently held by this session, failure and retry
+        counts, and the circuit breaker's state.
+
+        :return: dict with number of requests sent, connections opened, requests that reused a connection, timeouts,
+            connection errors, retryable statuses, other errors, retries, requests short circuited, attempts, hedges
+            sent and won, hedges skipped for budget, current hedge delay in seconds, and 'breaker' stats.
+        """
+        num_requests = 0
+        num_connections = 0
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            num_requests += pool.num_requests
+            num_connections += pool.num_connections
+
+        with self._lock:
+            counters = dict(self._counters)
+
+        return dict(counters, **{
+            'requests': num_requests,
+            'connections_opened': num_connections,
+            'connections_reused': max(num_requests - num_connections, 0),
+            'hedge_delay': self.hedge_delay(),
+            'breaker': self.breaker.stats()
+        })
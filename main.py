@@ -4,19 +4,38 @@ from __future__ import absolute_import
 # application setup
 from os import environ
 import json
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 
 # location and time imports
+import calendar
 import datetime
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pytz import timezone, utc
-from timezonefinder import TimezoneFinder
 
 # Modules
 from yelp import Yelp
 from weather import Weather
 from sunrise_sunset import SunriseSunset
-from data_cache import DataCache
+from data_cache import DataCache, NegativeResult
+from business_store import BusinessStore
+import distance
+from timezone_resolver import TimezoneResolver
+from solar import SolarCalculator
+import cache_schema
+from forecast_timeline import ForecastTimeline
+from http_client import CircuitBreaker, PooledSession
+from singleflight import SingleFlight
+from movement import MovementTracker
+from prewarm import CacheWarmer, WarmJob, hot_locations, read_places
+from geo_cells import tile_id
+from campus_geometry import CampusGeometry
+from campus_locations import campus_buildings
 
 # setup Flask app
 app = Flask(__name__)
@@ -72,6 +91,13 @@ HARDCODED_LOCATION = [
         # ("parks", (42.055037, -87.679631)),              # library and orrington
         # ("parks", (42.057300, -87.679615))               # haven and orrington
 ]
+# get configuration variable for distance computations (see distance.py for error bounds of each backend)
+DISTANCE_BACKEND = environ.get("DISTANCE_BACKEND")
+if DISTANCE_BACKEND is None:
+    DISTANCE_BACKEND = 'haversine'
+    print("DISTANCE_BACKEND not specified. Default to {}.".format(DISTANCE_BACKEND))
+distance.set_backend(DISTANCE_BACKEND)
+
 # get configuration variables for hardcoded location threshold and yelp query radius
 HARDCODED_LOCATION_DISTANCE_THRESHOLD = environ.get("HARDCODED_LOCATION_DISTANCE_THRESHOLD")
 if HARDCODED_LOCATION_DISTANCE_THRESHOLD is None:
@@ -90,13 +116,133 @@ if YELP_QUERY_RADIUS is None:
 else:
     YELP_QUERY_RADIUS = int(json.loads(YELP_QUERY_RADIUS))
 
+YELP_MAX_PAGES = environ.get("YELP_MAX_PAGES")
+if YELP_MAX_PAGES is None:
+    # more pages find more businesses in dense areas, at the cost of more requests per cache miss
+    YELP_MAX_PAGES = 1
+    print("YELP_MAX_PAGES not specified. Default to {} pages.".format(YELP_MAX_PAGES))
+else:
+    YELP_MAX_PAGES = int(YELP_MAX_PAGES)
+
+# get configuration variables for campus building lookups
+CAMPUS_BUILDING_DISTANCE_THRESHOLD = environ.get("CAMPUS_BUILDING_DISTANCE_THRESHOLD")
+if CAMPUS_BUILDING_DISTANCE_THRESHOLD is None:
+    # default to 15 meters, to allow for GPS drift indoors
+    CAMPUS_BUILDING_DISTANCE_THRESHOLD = 15.0
+    print("CAMPUS_BUILDING_DISTANCE_THRESHOLD not specified. Default to {} meters.".format(CAMPUS_BUILDING_DISTANCE_THRESHOLD))
+else:
+    CAMPUS_BUILDING_DISTANCE_THRESHOLD = float(CAMPUS_BUILDING_DISTANCE_THRESHOLD)
+
+CAMPUS_SKIP_YELP = environ.get("CAMPUS_SKIP_YELP")
+if CAMPUS_SKIP_YELP is None:
+    # points inside a campus building get their place categories from the building instead of Yelp
+    CAMPUS_SKIP_YELP = True
+    print("CAMPUS_SKIP_YELP not specified. Default to {}.".format(CAMPUS_SKIP_YELP))
+else:
+    CAMPUS_SKIP_YELP = bool(json.loads(CAMPUS_SKIP_YELP))
+
+# setup campus building footprints, parsed and indexed once
+CAMPUS_GEOMETRY = CampusGeometry(campus_buildings)
+
+# get configuration variables for pooled upstream HTTP connections
+HTTP_POOL_CONNECTIONS = environ.get("HTTP_POOL_CONNECTIONS")
+if HTTP_POOL_CONNECTIONS is None:
+    HTTP_POOL_CONNECTIONS = 4
+    print("HTTP_POOL_CONNECTIONS not specified. Default to {} hosts per upstream.".format(HTTP_POOL_CONNECTIONS))
+else:
+    HTTP_POOL_CONNECTIONS = int(HTTP_POOL_CONNECTIONS)
+
+HTTP_POOL_MAXSIZE = environ.get("HTTP_POOL_MAXSIZE")
+if HTTP_POOL_MAXSIZE is None:
+    HTTP_POOL_MAXSIZE = 16
+    print("HTTP_POOL_MAXSIZE not specified. Default to {} connections per host.".format(HTTP_POOL_MAXSIZE))
+else:
+    HTTP_POOL_MAXSIZE = int(HTTP_POOL_MAXSIZE)
+
+HTTP_POOL_BLOCK = environ.get("HTTP_POOL_BLOCK")
+if HTTP_POOL_BLOCK is None:
+    HTTP_POOL_BLOCK = False
+    print("HTTP_POOL_BLOCK not specified. Default to {}.".format(HTTP_POOL_BLOCK))
+else:
+    HTTP_POOL_BLOCK = bool(json.loads(HTTP_POOL_BLOCK))
+
+# get configuration variables for upstream timeouts, retries, and circuit breakers
+HTTP_CONNECT_TIMEOUT = environ.get("HTTP_CONNECT_TIMEOUT")
+if HTTP_CONNECT_TIMEOUT is None:
+    HTTP_CONNECT_TIMEOUT = 3.05
+    print("HTTP_CONNECT_TIMEOUT not specified. Default to {} seconds.".format(HTTP_CONNECT_TIMEOUT))
+else:
+    HTTP_CONNECT_TIMEOUT = float(HTTP_CONNECT_TIMEOUT)
+
+HTTP_READ_TIMEOUT = environ.get("HTTP_READ_TIMEOUT")
+if HTTP_READ_TIMEOUT is None:
+    HTTP_READ_TIMEOUT = 10.0
+    print("HTTP_READ_TIMEOUT not specified. Default to {} seconds.".format(HTTP_READ_TIMEOUT))
+else:
+    HTTP_READ_TIMEOUT = float(HTTP_READ_TIMEOUT)
+
+HTTP_RETRIES = environ.get("HTTP_RETRIES")
+if HTTP_RETRIES is None:
+    HTTP_RETRIES = 1
+    print("HTTP_RETRIES not specified. Default to {} retry per request.".format(HTTP_RETRIES))
+else:
+    HTTP_RETRIES = int(HTTP_RETRIES)
+
+HTTP_BREAKER_FAILURES = environ.get("HTTP_BREAKER_FAILURES")
+if HTTP_BREAKER_FAILURES is None:
+    HTTP_BREAKER_FAILURES = 5
+    print("HTTP_BREAKER_FAILURES not specified. Default to {} consecutive failures.".format(HTTP_BREAKER_FAILURES))
+else:
+    HTTP_BREAKER_FAILURES = int(HTTP_BREAKER_FAILURES)
+
+HTTP_BREAKER_RESET_SECONDS = environ.get("HTTP_BREAKER_RESET_SECONDS")
+if HTTP_BREAKER_RESET_SECONDS is None:
+    HTTP_BREAKER_RESET_SECONDS = 30.0
+    print("HTTP_BREAKER_RESET_SECONDS not specified. Default to {} seconds.".format(HTTP_BREAKER_RESET_SECONDS))
+else:
+    HTTP_BREAKER_RESET_SECONDS = float(HTTP_BREAKER_RESET_SECONDS)
+
+# hedging sends a duplicate request when one is slower than this percentile of recent latencies
+HTTP_HEDGE_PERCENTILE = environ.get("HTTP_HEDGE_PERCENTILE")
+if HTTP_HEDGE_PERCENTILE is None or HTTP_HEDGE_PERCENTILE == "":
+    HTTP_HEDGE_PERCENTILE = None
+    print("HTTP_HEDGE_PERCENTILE not specified. Hedged requests disabled.")
+else:
+    HTTP_HEDGE_PERCENTILE = float(HTTP_HEDGE_PERCENTILE)
+
+HTTP_HEDGE_BUDGET = environ.get("HTTP_HEDGE_BUDGET")
+if HTTP_HEDGE_BUDGET is None:
+    HTTP_HEDGE_BUDGET = 0.05
+    print("HTTP_HEDGE_BUDGET not specified. Default to hedging at most {:.0%} of requests.".format(
+        HTTP_HEDGE_BUDGET))
+else:
+    HTTP_HEDGE_BUDGET = float(HTTP_HEDGE_BUDGET)
+
+
+def upstream_session(name):
+    """
+    Returns a PooledSession for an upstream, with its own circuit breaker and hedge budget, configured from the HTTP_
+    variables.
+
+    :param name: string name of the upstream, used when reporting stats.
+    :return: PooledSession
+    """
+    return PooledSession(name, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                         pool_block=HTTP_POOL_BLOCK, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                         read_timeout=HTTP_READ_TIMEOUT, retries=HTTP_RETRIES, hedge_percentile=HTTP_HEDGE_PERCENTILE,
+                         hedge_budget=HTTP_HEDGE_BUDGET,
+                         breaker=CircuitBreaker(failure_threshold=HTTP_BREAKER_FAILURES,
+                                                reset_timeout=HTTP_BREAKER_RESET_SECONDS))
+
+
 # setup Yelp API with configuration variables
-YELP_API = Yelp(environ.get("YELP_API_KEY"), hardcoded_locations=HARDCODED_LOCATION)
+YELP_API = Yelp(environ.get("YELP_API_KEY"), hardcoded_locations=HARDCODED_LOCATION, max_pages=YELP_MAX_PAGES,
+                session=upstream_session('yelp'))
 
 # setup weather API
-WEATHER_API = Weather(environ.get("WEATHER_KEY"))
+WEATHER_API = Weather(environ.get("WEATHER_KEY"), session=upstream_session('openweathermap'))
 
-SUNRISE_SUNSET_API = SunriseSunset()
+SUNRISE_SUNSET_API = SunriseSunset(session=upstream_session('sunrise-sunset'))
 
 # setup DB connection to cache
 MONGODB_URI = environ.get("MONGODB_URI")
@@ -119,7 +265,7 @@ if YELP_CACHE_TIME_THRESHOLD is None:
 else:
     YELP_CACHE_TIME_THRESHOLD = float(YELP_CACHE_TIME_THRESHOLD)
 
-# get configuration variables for Weather cache
+# get configuration variables for Weather cache, which holds current weather
 WEATHER_CACHE_DISTANCE_THRESHOLD = environ.get("WEATHER_CACHE_DISTANCE_THRESHOLD")
 if WEATHER_CACHE_DISTANCE_THRESHOLD is None:
     WEATHER_CACHE_DISTANCE_THRESHOLD = 16000.0  # 16 kilometers = 10 miles
@@ -134,7 +280,30 @@ if WEATHER_CACHE_TIME_THRESHOLD is None:
 else:
     WEATHER_CACHE_TIME_THRESHOLD = float(WEATHER_CACHE_TIME_THRESHOLD)
 
-# get configuration variables for SunriseSunset cache
+# get configuration variables for Forecast cache. forecasts are issued every 3 hours and cover a wider area.
+FORECAST_CACHE_DISTANCE_THRESHOLD = environ.get("FORECAST_CACHE_DISTANCE_THRESHOLD")
+if FORECAST_CACHE_DISTANCE_THRESHOLD is None:
+    FORECAST_CACHE_DISTANCE_THRESHOLD = 16000.0  # 16 kilometers = 10 miles
+    print("FORECAST_CACHE_DISTANCE_THRESHOLD not specified. Default to {} meters.".format(FORECAST_CACHE_DISTANCE_THRESHOLD))
+else:
+    FORECAST_CACHE_DISTANCE_THRESHOLD = float(FORECAST_CACHE_DISTANCE_THRESHOLD)
+
+FORECAST_CACHE_TIME_THRESHOLD = environ.get("FORECAST_CACHE_TIME_THRESHOLD")
+if FORECAST_CACHE_TIME_THRESHOLD is None:
+    FORECAST_CACHE_TIME_THRESHOLD = 180  # 3 hours
+    print("FORECAST_CACHE_TIME_THRESHOLD not specified. Default to {} minutes.".format(FORECAST_CACHE_TIME_THRESHOLD))
+else:
+    FORECAST_CACHE_TIME_THRESHOLD = float(FORECAST_CACHE_TIME_THRESHOLD)
+
+# get configuration variable for where sunrise/sunset comes from: computed locally, or from sunrise-sunset.org
+SUNRISE_SUNSET_SOURCE = environ.get("SUNRISE_SUNSET_SOURCE")
+if SUNRISE_SUNSET_SOURCE is None:
+    SUNRISE_SUNSET_SOURCE = 'local'
+    print("SUNRISE_SUNSET_SOURCE not specified. Default to {}.".format(SUNRISE_SUNSET_SOURCE))
+elif SUNRISE_SUNSET_SOURCE not in ('local', 'api'):
+    raise ValueError("SUNRISE_SUNSET_SOURCE should be 'local' or 'api', got {}".format(SUNRISE_SUNSET_SOURCE))
+
+# get configuration variables for SunriseSunset cache, used if SUNRISE_SUNSET_SOURCE is 'api'
 SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD = environ.get("SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD")
 if SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD is None:
     SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD = 100000.0   # 100km = 60 miles
@@ -150,8 +319,385 @@ if SUNRISE_SUNSET_TIME_THRESHOLD is None:
 else:
     SUNRISE_SUNSET_TIME_THRESHOLD = float(SUNRISE_SUNSET_TIME_THRESHOLD)
 
+# get configuration variables for in-process L1 cache in front of MongoDB
+L1_CACHE_MAX_ENTRIES = environ.get("L1_CACHE_MAX_ENTRIES")
+if L1_CACHE_MAX_ENTRIES is None:
+    L1_CACHE_MAX_ENTRIES = 1024
+    print("L1_CACHE_MAX_ENTRIES not specified. Default to {} entries per collection.".format(L1_CACHE_MAX_ENTRIES))
+else:
+    L1_CACHE_MAX_ENTRIES = int(L1_CACHE_MAX_ENTRIES)
+
+# get configuration variable for how cached data is keyed. 'nearest' matches the nearest cached location within each
+# cache's distance threshold, 'tile' snaps locations to tiles as large as each cache's distance threshold.
+CACHE_KEY_MODE = environ.get("CACHE_KEY_MODE")
+if CACHE_KEY_MODE is None:
+    CACHE_KEY_MODE = 'nearest'
+    print("CACHE_KEY_MODE not specified. Default to {}.".format(CACHE_KEY_MODE))
+
+if CACHE_KEY_MODE == 'tile':
+    CACHE_TILE_SIZES = {
+        'LocationCache': YELP_CACHE_DISTANCE_THRESHOLD,
+        'WeatherCache': WEATHER_CACHE_DISTANCE_THRESHOLD,
+        'ForecastCache': FORECAST_CACHE_DISTANCE_THRESHOLD,
+        'SunriseSunsetCache': SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD
+    }
+elif CACHE_KEY_MODE == 'nearest':
+    CACHE_TILE_SIZES = {}
+else:
+    raise ValueError("CACHE_KEY_MODE must be 'nearest' or 'tile', got {}".format(CACHE_KEY_MODE))
+
+# get configuration variables for negative caching: how long failed or empty upstream responses are cached for, so
+# outages do not send every request back to the failing API
+YELP_NEGATIVE_CACHE_TTL = environ.get("YELP_NEGATIVE_CACHE_TTL")
+if YELP_NEGATIVE_CACHE_TTL is None:
+    YELP_NEGATIVE_CACHE_TTL = 5
+    print("YELP_NEGATIVE_CACHE_TTL not specified. Default to {} minutes.".format(YELP_NEGATIVE_CACHE_TTL))
+else:
+    YELP_NEGATIVE_CACHE_TTL = float(YELP_NEGATIVE_CACHE_TTL)
+
+WEATHER_NEGATIVE_CACHE_TTL = environ.get("WEATHER_NEGATIVE_CACHE_TTL")
+if WEATHER_NEGATIVE_CACHE_TTL is None:
+    WEATHER_NEGATIVE_CACHE_TTL = 2
+    print("WEATHER_NEGATIVE_CACHE_TTL not specified. Default to {} minutes.".format(WEATHER_NEGATIVE_CACHE_TTL))
+else:
+    WEATHER_NEGATIVE_CACHE_TTL = float(WEATHER_NEGATIVE_CACHE_TTL)
+
+FORECAST_NEGATIVE_CACHE_TTL = environ.get("FORECAST_NEGATIVE_CACHE_TTL")
+if FORECAST_NEGATIVE_CACHE_TTL is None:
+    FORECAST_NEGATIVE_CACHE_TTL = 5
+    print("FORECAST_NEGATIVE_CACHE_TTL not specified. Default to {} minutes.".format(FORECAST_NEGATIVE_CACHE_TTL))
+else:
+    FORECAST_NEGATIVE_CACHE_TTL = float(FORECAST_NEGATIVE_CACHE_TTL)
+
+SUNRISE_SUNSET_NEGATIVE_CACHE_TTL = environ.get("SUNRISE_SUNSET_NEGATIVE_CACHE_TTL")
+if SUNRISE_SUNSET_NEGATIVE_CACHE_TTL is None:
+    SUNRISE_SUNSET_NEGATIVE_CACHE_TTL = 5
+    print("SUNRISE_SUNSET_NEGATIVE_CACHE_TTL not specified. Default to {} minutes.".format(
+        SUNRISE_SUNSET_NEGATIVE_CACHE_TTL))
+else:
+    SUNRISE_SUNSET_NEGATIVE_CACHE_TTL = float(SUNRISE_SUNSET_NEGATIVE_CACHE_TTL)
+
+CACHE_NEGATIVE_TTLS = {
+    'LocationCache': YELP_NEGATIVE_CACHE_TTL,
+    'WeatherCache': WEATHER_NEGATIVE_CACHE_TTL,
+    'ForecastCache': FORECAST_NEGATIVE_CACHE_TTL,
+    'SunriseSunsetCache': SUNRISE_SUNSET_NEGATIVE_CACHE_TTL
+}
+
 # initialize data cache
-DATA_CACHE = DataCache(MONGODB_URI, "affordance-aware")
+DATA_CACHE = DataCache(MONGODB_URI, "affordance-aware", l1_max_entries=L1_CACHE_MAX_ENTRIES,
+                       tile_sizes=CACHE_TILE_SIZES, negative_ttls=CACHE_NEGATIVE_TTLS)
+
+# get configuration variables for answering Yelp searches from a local store filled by wide searches
+YELP_BUSINESS_STORE_ENABLED = environ.get("YELP_BUSINESS_STORE_ENABLED")
+if YELP_BUSINESS_STORE_ENABLED is None:
+    YELP_BUSINESS_STORE_ENABLED = False
+    print("YELP_BUSINESS_STORE_ENABLED not specified. Default to {}.".format(YELP_BUSINESS_STORE_ENABLED))
+else:
+    YELP_BUSINESS_STORE_ENABLED = bool(json.loads(YELP_BUSINESS_STORE_ENABLED))
+
+YELP_BUSINESS_STORE_RADIUS = environ.get("YELP_BUSINESS_STORE_RADIUS")
+if YELP_BUSINESS_STORE_RADIUS is None:
+    YELP_BUSINESS_STORE_RADIUS = 250.0
+    print("YELP_BUSINESS_STORE_RADIUS not specified. Default to {} meters.".format(YELP_BUSINESS_STORE_RADIUS))
+else:
+    YELP_BUSINESS_STORE_RADIUS = float(YELP_BUSINESS_STORE_RADIUS)
+
+# setup local business store, trusted for as long as LocationCache entries
+if YELP_BUSINESS_STORE_ENABLED:
+    YELP_API.business_store = BusinessStore(DATA_CACHE.db, fetch_radius=YELP_BUSINESS_STORE_RADIUS,
+                                            max_age_minutes=YELP_CACHE_TIME_THRESHOLD)
+
+# get configuration variables for timezone resolver
+TIMEZONE_CELL_SIZE = environ.get("TIMEZONE_CELL_SIZE")
+if TIMEZONE_CELL_SIZE is None:
+    TIMEZONE_CELL_SIZE = 0.01  # roughly 1 kilometer
+    print("TIMEZONE_CELL_SIZE not specified. Default to {} degrees.".format(TIMEZONE_CELL_SIZE))
+else:
+    TIMEZONE_CELL_SIZE = float(TIMEZONE_CELL_SIZE)
+
+TIMEZONE_CACHE_SIZE = environ.get("TIMEZONE_CACHE_SIZE")
+if TIMEZONE_CACHE_SIZE is None:
+    TIMEZONE_CACHE_SIZE = 4096
+    print("TIMEZONE_CACHE_SIZE not specified. Default to {} cells.".format(TIMEZONE_CACHE_SIZE))
+else:
+    TIMEZONE_CACHE_SIZE = int(TIMEZONE_CACHE_SIZE)
+
+# get configuration variables for coalescing concurrent cache misses
+SINGLEFLIGHT_DISTRIBUTED = environ.get("SINGLEFLIGHT_DISTRIBUTED")
+if SINGLEFLIGHT_DISTRIBUTED is None:
+    # only coalesce within this worker by default
+    SINGLEFLIGHT_DISTRIBUTED = False
+    print("SINGLEFLIGHT_DISTRIBUTED not specified. Default to {}.".format(SINGLEFLIGHT_DISTRIBUTED))
+else:
+    SINGLEFLIGHT_DISTRIBUTED = bool(json.loads(SINGLEFLIGHT_DISTRIBUTED))
+
+SINGLEFLIGHT_LOCK_SECONDS = environ.get("SINGLEFLIGHT_LOCK_SECONDS")
+if SINGLEFLIGHT_LOCK_SECONDS is None:
+    SINGLEFLIGHT_LOCK_SECONDS = 10.0
+    print("SINGLEFLIGHT_LOCK_SECONDS not specified. Default to {} seconds.".format(SINGLEFLIGHT_LOCK_SECONDS))
+else:
+    SINGLEFLIGHT_LOCK_SECONDS = float(SINGLEFLIGHT_LOCK_SECONDS)
+
+SINGLEFLIGHT_POLL_SECONDS = 0.1
+
+# setup coalescing of concurrent cache misses within this worker
+SINGLE_FLIGHT = SingleFlight()
+
+# get configuration variables for serving stale cache entries while they are refreshed in the background
+YELP_CACHE_STALE_GRACE = environ.get("YELP_CACHE_STALE_GRACE")
+if YELP_CACHE_STALE_GRACE is None:
+    YELP_CACHE_STALE_GRACE = 1440  # 1 day
+    print("YELP_CACHE_STALE_GRACE not specified. Default to {} minutes.".format(YELP_CACHE_STALE_GRACE))
+else:
+    YELP_CACHE_STALE_GRACE = float(YELP_CACHE_STALE_GRACE)
+
+WEATHER_CACHE_STALE_GRACE = environ.get("WEATHER_CACHE_STALE_GRACE")
+if WEATHER_CACHE_STALE_GRACE is None:
+    WEATHER_CACHE_STALE_GRACE = 15  # 15 minutes
+    print("WEATHER_CACHE_STALE_GRACE not specified. Default to {} minutes.".format(WEATHER_CACHE_STALE_GRACE))
+else:
+    WEATHER_CACHE_STALE_GRACE = float(WEATHER_CACHE_STALE_GRACE)
+
+FORECAST_CACHE_STALE_GRACE = environ.get("FORECAST_CACHE_STALE_GRACE")
+if FORECAST_CACHE_STALE_GRACE is None:
+    FORECAST_CACHE_STALE_GRACE = 60  # 1 hour
+    print("FORECAST_CACHE_STALE_GRACE not specified. Default to {} minutes.".format(FORECAST_CACHE_STALE_GRACE))
+else:
+    FORECAST_CACHE_STALE_GRACE = float(FORECAST_CACHE_STALE_GRACE)
+
+SUNRISE_SUNSET_STALE_GRACE = environ.get("SUNRISE_SUNSET_STALE_GRACE")
+if SUNRISE_SUNSET_STALE_GRACE is None:
+    # stale sunrise/sunset times may be for the previous day, so do not serve them by default
+    SUNRISE_SUNSET_STALE_GRACE = 0
+    print("SUNRISE_SUNSET_STALE_GRACE not specified. Default to {} minutes.".format(SUNRISE_SUNSET_STALE_GRACE))
+else:
+    SUNRISE_SUNSET_STALE_GRACE = float(SUNRISE_SUNSET_STALE_GRACE)
+
+CACHE_STALE_GRACE = {
+    'LocationCache': YELP_CACHE_STALE_GRACE,
+    'WeatherCache': WEATHER_CACHE_STALE_GRACE,
+    'ForecastCache': FORECAST_CACHE_STALE_GRACE,
+    'SunriseSunsetCache': SUNRISE_SUNSET_STALE_GRACE
+}
+
+CACHE_EARLY_REFRESH_BETA = environ.get("CACHE_EARLY_REFRESH_BETA")
+if CACHE_EARLY_REFRESH_BETA is None:
+    # larger values refresh earlier, e.g. 1.0. 0 disables early refresh
+    CACHE_EARLY_REFRESH_BETA = 0
+    print("CACHE_EARLY_REFRESH_BETA not specified. Default to {}, early refresh disabled.".format(
+        CACHE_EARLY_REFRESH_BETA))
+else:
+    CACHE_EARLY_REFRESH_BETA = float(CACHE_EARLY_REFRESH_BETA)
+
+REFRESH_POOL_SIZE = environ.get("REFRESH_POOL_SIZE")
+if REFRESH_POOL_SIZE is None:
+    REFRESH_POOL_SIZE = 2
+    print("REFRESH_POOL_SIZE not specified. Default to {} threads.".format(REFRESH_POOL_SIZE))
+else:
+    REFRESH_POOL_SIZE = int(REFRESH_POOL_SIZE)
+
+# last upstream fetch duration in seconds per collection, and stale-while-revalidate counters per collection
+UPSTREAM_FETCH_SECONDS = {}
+REFRESH_STATS = {}
+REFRESH_STATS_LOCK = threading.Lock()
+
+# stale and early refreshes run on their own pool, so they never queue ahead of requests on REQUEST_EXECUTOR. refreshes
+# beyond REFRESH_MAX_PENDING waiting or running are dropped, a later request for the entry triggers another.
+REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=REFRESH_POOL_SIZE)
+REFRESH_MAX_PENDING = REFRESH_POOL_SIZE * 4
+REFRESH_PENDING = 0
+
+# upstream calls made and saved (requests answered from cache or a shared result instead) per collection
+UPSTREAM_STATS = {}
+UPSTREAM_STATS_LOCK = threading.Lock()
+
+# setup timezone resolver and sunrise/sunset calculator, shared by all requests in this worker
+TIMEZONE_RESOLVER = TimezoneResolver(cell_size=TIMEZONE_CELL_SIZE, max_entries=TIMEZONE_CACHE_SIZE)
+SOLAR_CALCULATOR = SolarCalculator()
+
+# get configuration variables for concurrent data fetching
+FETCH_POOL_SIZE = environ.get("FETCH_POOL_SIZE")
+if FETCH_POOL_SIZE is None:
+    FETCH_POOL_SIZE = 16
+    print("FETCH_POOL_SIZE not specified. Default to {} threads.".format(FETCH_POOL_SIZE))
+else:
+    FETCH_POOL_SIZE = int(FETCH_POOL_SIZE)
+
+# seconds to wait for sources before responding without the slow ones, overridable per request with ?deadline=
+REQUEST_DEADLINE = environ.get("REQUEST_DEADLINE")
+if REQUEST_DEADLINE is None or REQUEST_DEADLINE == "":
+    REQUEST_DEADLINE = None
+    print("REQUEST_DEADLINE not specified. Requests wait for all sources.")
+else:
+    REQUEST_DEADLINE = float(REQUEST_DEADLINE)
+
+# fetches of one source that may be in flight at once when requests have a deadline. a source at the cap (e.g. left
+# running by earlier requests while its upstream is slow) is reported missing at once rather than queued, so it cannot
+# fill REQUEST_EXECUTOR and hold up the other sources. the default splits the pool between the four sources.
+SOURCE_MAX_IN_FLIGHT = environ.get("SOURCE_MAX_IN_FLIGHT")
+if SOURCE_MAX_IN_FLIGHT is None:
+    SOURCE_MAX_IN_FLIGHT = max(1, FETCH_POOL_SIZE // 4)
+    print("SOURCE_MAX_IN_FLIGHT not specified. Default to {} fetches.".format(SOURCE_MAX_IN_FLIGHT))
+else:
+    SOURCE_MAX_IN_FLIGHT = int(SOURCE_MAX_IN_FLIGHT)
+
+# responses sent without some sources, number of times each source was missing, and number of times it was skipped
+# because it was at SOURCE_MAX_IN_FLIGHT
+DEADLINE_STATS = {'partial_responses': 0, 'missing_sources': {}, 'skipped_sources': {}}
+DEADLINE_STATS_LOCK = threading.Lock()
+SOURCE_IN_FLIGHT = {}
+SOURCE_IN_FLIGHT_LOCK = threading.Lock()
+
+# get configuration variable for batch requests
+BATCH_MAX_LOCATIONS = environ.get("BATCH_MAX_LOCATIONS")
+if BATCH_MAX_LOCATIONS is None:
+    BATCH_MAX_LOCATIONS = 1000
+    print("BATCH_MAX_LOCATIONS not specified. Default to {} locations.".format(BATCH_MAX_LOCATIONS))
+else:
+    BATCH_MAX_LOCATIONS = int(BATCH_MAX_LOCATIONS)
+
+BATCH_POOL_SIZE = environ.get("BATCH_POOL_SIZE")
+if BATCH_POOL_SIZE is None:
+    BATCH_POOL_SIZE = 8
+    print("BATCH_POOL_SIZE not specified. Default to {} threads.".format(BATCH_POOL_SIZE))
+else:
+    BATCH_POOL_SIZE = int(BATCH_POOL_SIZE)
+
+# get configuration variables for pre-warming caches for frequently visited locations
+PREWARM_ENABLED = environ.get("PREWARM_ENABLED")
+if PREWARM_ENABLED is None:
+    PREWARM_ENABLED = False
+    print("PREWARM_ENABLED not specified. Default to {}.".format(PREWARM_ENABLED))
+else:
+    PREWARM_ENABLED = bool(json.loads(PREWARM_ENABLED))
+
+PREWARM_PLACES_FILE = environ.get("PREWARM_PLACES_FILE")
+if PREWARM_PLACES_FILE is None:
+    PREWARM_PLACES_FILE = 'places.txt'
+    print("PREWARM_PLACES_FILE not specified. Default to {}.".format(PREWARM_PLACES_FILE))
+
+PREWARM_LEAD_MINUTES = environ.get("PREWARM_LEAD_MINUTES")
+if PREWARM_LEAD_MINUTES is None:
+    # should be longer than PREWARM_INTERVAL, so entries are not missed between checks
+    PREWARM_LEAD_MINUTES = 5.0
+    print("PREWARM_LEAD_MINUTES not specified. Default to {} minutes.".format(PREWARM_LEAD_MINUTES))
+else:
+    PREWARM_LEAD_MINUTES = float(PREWARM_LEAD_MINUTES)
+
+PREWARM_INTERVAL = environ.get("PREWARM_INTERVAL")
+if PREWARM_INTERVAL is None:
+    PREWARM_INTERVAL = 60.0
+    print("PREWARM_INTERVAL not specified. Default to {} seconds.".format(PREWARM_INTERVAL))
+else:
+    PREWARM_INTERVAL = float(PREWARM_INTERVAL)
+
+PREWARM_RATE_PER_MINUTE = environ.get("PREWARM_RATE_PER_MINUTE")
+if PREWARM_RATE_PER_MINUTE is None:
+    PREWARM_RATE_PER_MINUTE = 30.0
+    print("PREWARM_RATE_PER_MINUTE not specified. Default to {} refreshes.".format(PREWARM_RATE_PER_MINUTE))
+else:
+    PREWARM_RATE_PER_MINUTE = float(PREWARM_RATE_PER_MINUTE)
+
+PREWARM_MAX_IN_FLIGHT = environ.get("PREWARM_MAX_IN_FLIGHT")
+if PREWARM_MAX_IN_FLIGHT is None:
+    # pause pre-warming while this worker serves more requests than this
+    PREWARM_MAX_IN_FLIGHT = 8
+    print("PREWARM_MAX_IN_FLIGHT not specified. Default to {} requests.".format(PREWARM_MAX_IN_FLIGHT))
+else:
+    PREWARM_MAX_IN_FLIGHT = int(PREWARM_MAX_IN_FLIGHT)
+
+# /metrics url read for load when prewarm.py runs as its own process, e.g. http://localhost:5000/metrics
+PREWARM_LOAD_URL = environ.get("PREWARM_LOAD_URL")
+if PREWARM_LOAD_URL is None or PREWARM_LOAD_URL == "":
+    PREWARM_LOAD_URL = None
+    print("PREWARM_LOAD_URL not specified. prewarm.py processes will not pause for load.")
+
+# number of requests this worker is serving, used to pause pre-warming under load
+IN_FLIGHT_REQUESTS = 0
+IN_FLIGHT_REQUESTS_LOCK = threading.Lock()
+
+# get configuration variables for prefetching Yelp data along the path of clients that send a session_id
+MOVEMENT_PREFETCH_ENABLED = environ.get("MOVEMENT_PREFETCH_ENABLED")
+if MOVEMENT_PREFETCH_ENABLED is None:
+    MOVEMENT_PREFETCH_ENABLED = False
+    print("MOVEMENT_PREFETCH_ENABLED not specified. Default to {}.".format(MOVEMENT_PREFETCH_ENABLED))
+else:
+    MOVEMENT_PREFETCH_ENABLED = bool(json.loads(MOVEMENT_PREFETCH_ENABLED))
+
+MOVEMENT_PREFETCH_SECONDS = environ.get("MOVEMENT_PREFETCH_SECONDS")
+if MOVEMENT_PREFETCH_SECONDS is None:
+    MOVEMENT_PREFETCH_SECONDS = 20.0
+    print("MOVEMENT_PREFETCH_SECONDS not specified. Default to {} seconds.".format(MOVEMENT_PREFETCH_SECONDS))
+else:
+    MOVEMENT_PREFETCH_SECONDS = float(MOVEMENT_PREFETCH_SECONDS)
+
+MOVEMENT_PREFETCH_CELLS = environ.get("MOVEMENT_PREFETCH_CELLS")
+if MOVEMENT_PREFETCH_CELLS is None:
+    MOVEMENT_PREFETCH_CELLS = 4
+    print("MOVEMENT_PREFETCH_CELLS not specified. Default to {} cells.".format(MOVEMENT_PREFETCH_CELLS))
+else:
+    MOVEMENT_PREFETCH_CELLS = int(MOVEMENT_PREFETCH_CELLS)
+
+MOVEMENT_PREFETCH_POOL_SIZE = environ.get("MOVEMENT_PREFETCH_POOL_SIZE")
+if MOVEMENT_PREFETCH_POOL_SIZE is None:
+    MOVEMENT_PREFETCH_POOL_SIZE = 2
+    print("MOVEMENT_PREFETCH_POOL_SIZE not specified. Default to {} threads.".format(MOVEMENT_PREFETCH_POOL_SIZE))
+else:
+    MOVEMENT_PREFETCH_POOL_SIZE = int(MOVEMENT_PREFETCH_POOL_SIZE)
+
+# setup movement tracking and prefetching, on its own pool so prefetches never hold up requests. prefetches beyond
+# MOVEMENT_PREFETCH_MAX_PENDING waiting or running are dropped rather than queued behind stale predictions.
+MOVEMENT_TRACKER = MovementTracker()
+PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=MOVEMENT_PREFETCH_POOL_SIZE)
+MOVEMENT_PREFETCH_MAX_PENDING = MOVEMENT_PREFETCH_POOL_SIZE * 4
+PREFETCH_STATS = {'submitted': 0, 'dropped': 0, 'already_cached': 0, 'prefetched': 0, 'errors': 0}
+PREFETCH_PENDING = 0
+PREFETCH_LOCK = threading.Lock()
+
+# sources (weather, forecast, sunrise/sunset, yelp) are fanned out on REQUEST_EXECUTOR. each source makes at most one
+# upstream call itself (yelp fans out on its own pool), so a source never waits on a call queued behind other sources.
+REQUEST_EXECUTOR = ThreadPoolExecutor(max_workers=FETCH_POOL_SIZE)
+
+# batch requests fetch their misses on their own pool, so a large batch queues behind itself rather than ahead of
+# single-location requests on REQUEST_EXECUTOR
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_POOL_SIZE)
+
+
+# request load tracking
+@app.before_request
+def count_request_started():
+    """
+    Counts a request as in flight.
+
+    :return: None
+    """
+    global IN_FLIGHT_REQUESTS
+    with IN_FLIGHT_REQUESTS_LOCK:
+        IN_FLIGHT_REQUESTS += 1
+
+
+@app.teardown_request
+def count_request_finished(exception=None):
+    """
+    Counts a request as no longer in flight, whether or not it succeeded.
+
+    :param exception: exception raised while handling the request, if any
+    :return: None
+    """
+    global IN_FLIGHT_REQUESTS
+    with IN_FLIGHT_REQUESTS_LOCK:
+        IN_FLIGHT_REQUESTS -= 1
+
+
+def in_flight_requests():
+    """
+    Returns the number of requests this worker is serving.
+
+    :return: int
+    """
+    with IN_FLIGHT_REQUESTS_LOCK:
+        return IN_FLIGHT_REQUESTS
 
 
 # routes
@@ -164,6 +710,7 @@ def get_location_tags(lat, lng):
     :param lng: longitude, as a float
     :return: current conditions as a list
     """
+    prefetch_along_path(request.args.get('session_id'), float(lat), float(lng))
     return jsonify(get_current_conditions(float(lat), float(lng)))
 
 
@@ -172,11 +719,33 @@ def get_location_keyvalues(lat, lng):
     """
     Gets tags for location, as a dict.
 
+    Sources not fetched within the deadline (REQUEST_DEADLINE, or the deadline query parameter in seconds, where 0
+    waits for all sources) are left out and listed in 'missing_sources'.
+
     :param lat: latitude, as a float
     :param lng: longitude, as a float
     :return: current conditions as key-value pairs
     """
-    return jsonify(get_current_conditions_as_keyvalues(float(lat), float(lng)))
+    prefetch_along_path(request.args.get('session_id'), float(lat), float(lng))
+    return jsonify(get_current_conditions_as_keyvalues(float(lat), float(lng), deadline=request_deadline()))
+
+@app.route('/location_keyvalues/batch', methods=['POST'])
+def get_batch_location_keyvalues():
+    """
+    Gets tags for many locations, as a dict each. Expects a JSON body of {"locations": [{"lat": ..., "lng": ...}]}.
+
+    :return: {"results": [...]} with current conditions as key-value pairs for each location, in the same order
+    """
+    body = request.get_json(silent=True)
+    try:
+        locations = [(float(location['lat']), float(location['lng'])) for location in body['locations']]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'body should look like {"locations": [{"lat": float, "lng": float}]}'}), 400
+
+    if len(locations) > BATCH_MAX_LOCATIONS:
+        return jsonify({'error': 'at most {} locations per batch'.format(BATCH_MAX_LOCATIONS)}), 400
+
+    return jsonify({'results': get_batch_conditions_as_keyvalues(locations)})
 
 @app.route('/location_weather_time_keyvalues/<string:lat>/<string:lng>', methods=['GET'])
 def get_location_weather_time_keyvalues(lat, lng):
@@ -190,6 +759,45 @@ def get_location_weather_time_keyvalues(lat, lng):
 
     return jsonify(get_weather_time_conditions_as_keyvalues(float(lat), float(lng)))
 
+def request_deadline():
+    """
+    Returns the deadline for the current request: the deadline query parameter if given, otherwise REQUEST_DEADLINE.
+
+    :return: float seconds, or None to wait for all sources
+    """
+    deadline = request.args.get('deadline', type=float)
+    if deadline is None:
+        return REQUEST_DEADLINE
+    return deadline if deadline > 0 else None
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Gets internal counters for monitoring this worker.
+
+    :return: dict of metrics, grouped by component
+    """
+    return jsonify({
+        'data_cache': DATA_CACHE.stats(),
+        'singleflight': SINGLE_FLIGHT.stats(),
+        'stale_while_revalidate': stale_while_revalidate_stats(),
+        'upstream': upstream_stats(),
+        'yelp': YELP_API.stats(),
+        'business_store': YELP_API.business_store.stats() if YELP_API.business_store is not None else None,
+        'timezone_resolver': TIMEZONE_RESOLVER.stats(),
+        'solar': SOLAR_CALCULATOR.stats(),
+        'movement_prefetch': dict(MOVEMENT_TRACKER.stats(), **prefetch_stats()),
+        'prewarm': dict(CACHE_WARMER.stats(), enabled=PREWARM_ENABLED, in_flight_requests=in_flight_requests()),
+        'deadline': dict(deadline_stats(), default_seconds=REQUEST_DEADLINE),
+        'http': {
+            'yelp': YELP_API.session.stats(),
+            'openweathermap': WEATHER_API.session.stats(),
+            'sunrise_sunset': SUNRISE_SUNSET_API.session.stats()
+        }
+    })
+
+
 @app.route("/")
 def hello():
     """
@@ -210,31 +818,67 @@ def get_current_conditions(lat, lng):
     :return: list of weather, yelp API response, and local locations
     """
     # get weather, yelp, and any custom affordances
+    campus_affordances = get_campus_categories_for_location(lat, lng)
+    fetched_data = fetch_conditions_data(lat, lng, include_yelp=needs_yelp(lat, lng))
+    weather_time_affordances = compute_weather_time_affordances(lat, lng,
+                                                                weather_forecast_dict=fetched_data['weather'],
+                                                                sunrise_sunset_dict=fetched_data['sunrise_sunset'])
+    yelp_affordances = fetched_data['yelp'] or ({}, {})
     current_conditions = []
-    current_conditions += compute_weather_time_affordances(lat, lng)[0]  # current weather/time affordances
-    current_conditions += get_categories_for_location(lat, lng)[0]       # current list of yelp conditions
+    current_conditions += weather_time_affordances[0]                    # current weather/time affordances
+    current_conditions += list(yelp_affordances[0])                      # current list of yelp conditions
+    current_conditions += list(campus_affordances[0])                    # current list of campus buildings
     current_conditions += get_custom_affordances(current_conditions)[0]  # custom list of affordances
 
     # cleanup before returning
     return [YELP_API.clean_string(aff) for aff in current_conditions]
 
-def get_current_conditions_as_keyvalues(lat, lng):
+def get_current_conditions_as_keyvalues(lat, lng, deadline=None):
     """
     Gets the user's current affordance state, given a latitude/longitude, and returns as an dictionary.
 
     :param lat: latitude, as a float
     :param lng: longitude, as a float
+    :param deadline: optional float seconds to wait for sources, see fetch_conditions_data
     :return: dict of weather, yelp API response, and local locations
     """
-    # fetch data
-    weather_time_affordances = compute_weather_time_affordances(lat, lng)
-    yelp_affordances = get_categories_for_location(lat, lng)
+    # fetch data from all sources concurrently
+    campus_affordances = get_campus_categories_for_location(lat, lng)
+    fetched_data = fetch_conditions_data(lat, lng, include_yelp=needs_yelp(lat, lng), deadline=deadline)
+    return format_conditions_as_keyvalues(lat, lng, campus_affordances, fetched_data)
+
+
+def format_conditions_as_keyvalues(lat, lng, campus_affordances, fetched_data, as_of=None):
+    """
+    Combines campus affordances and fetched data for a location into the dict get_current_conditions_as_keyvalues
+    returns.
+
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :param campus_affordances: tuple returned by get_campus_categories_for_location for the location
+    :param fetched_data: dict returned by fetch_conditions_data for the location
+    :param as_of: optional timezone-aware datetime to compute time affordances for, instead of now
+    :return: dict of weather, yelp API response, and local locations
+    """
+    weather_time_affordances = compute_weather_time_affordances(lat, lng,
+                                                                weather_forecast_dict=fetched_data['weather'],
+                                                                sunrise_sunset_dict=fetched_data['sunrise_sunset'],
+                                                                as_of=as_of)
+    yelp_affordances = fetched_data['yelp'] or ({}, {})
     # NOTE(rlouie) 3/2/19: not using custom affordances for any experiences
     # custom_affordances = get_custom_affordances(weather_time_affordances[0] + yelp_affordances[0])
 
     curr_conditions = {}
     curr_conditions.update(weather_time_affordances[1]) # weather/time nested dict
     curr_conditions.update(yelp_affordances[1]) # yelp nested dict
+    curr_conditions.update(campus_affordances[1]) # campus building nested dict
+
+    # mark sources served from stale cache entries while they are being refreshed
+    if fetched_data['stale_sources']:
+        curr_conditions['stale_sources'] = fetched_data['stale_sources']
+    # list sources left out because they missed the request's deadline
+    if fetched_data['missing_sources']:
+        curr_conditions['missing_sources'] = fetched_data['missing_sources']
     # NOTE(rlouie) 3/2/19: not using custom affordances for any experiences
     # curr_conditions.update(custom_affordances[1])
 
@@ -257,6 +901,202 @@ def get_weather_time_conditions_as_keyvalues(lat, lng):
     return {YELP_API.clean_string(k): v for k, v in curr_conditions.items()}
 
 
+def get_batch_conditions_as_keyvalues(locations):
+    """
+    Gets the current affordance state for many locations at once, as get_current_conditions_as_keyvalues does for
+    one. See submit_many_through_cache for how cache lookups and upstream queries are shared between locations.
+
+    :param locations: list of (lat, lng) tuples of floats
+    :return: list of dicts of weather, yelp API response, and local locations, in the same order as locations
+    """
+    yelp_locations = [location for location in locations if needs_yelp(*location)]
+
+    # start all sources before waiting on any, so their misses are fetched concurrently
+    weather_futures = submit_many_through_cache('WeatherCache', locations, WEATHER_CACHE_DISTANCE_THRESHOLD,
+                                                WEATHER_CACHE_TIME_THRESHOLD, fetch_weather_data, 'Weather API')
+    forecast_futures = submit_many_through_cache('ForecastCache', locations, FORECAST_CACHE_DISTANCE_THRESHOLD,
+                                                 FORECAST_CACHE_TIME_THRESHOLD, fetch_forecast_data,
+                                                 'Forecast API')
+    if SUNRISE_SUNSET_SOURCE == 'local':
+        # computed locally and memoized per cell, so no need for the cache or a thread
+        sunrise_sunset_futures = []
+        for lat, lng in locations:
+            sunrise_sunset_futures.append(Future())
+            sunrise_sunset_futures[-1].set_result((compute_sunrise_sunset_data(lat, lng), False))
+    else:
+        sunrise_sunset_futures = submit_many_through_cache('SunriseSunsetCache', locations,
+                                                           SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD,
+                                                           SUNRISE_SUNSET_TIME_THRESHOLD, fetch_sunrise_sunset_data,
+                                                           'SunriseSunset API')
+    yelp_futures = dict(zip(yelp_locations, submit_many_through_cache('LocationCache', yelp_locations,
+                                                                      YELP_CACHE_DISTANCE_THRESHOLD,
+                                                                      YELP_CACHE_TIME_THRESHOLD, fetch_yelp_data,
+                                                                      'Yelp API')))
+
+    batch_conditions = []
+    for (lat, lng), weather_future, forecast_future, sunrise_sunset_future in zip(locations, weather_futures,
+                                                                                  forecast_futures,
+                                                                                  sunrise_sunset_futures):
+        weather_dict, weather_is_stale = weather_future.result()
+        forecast_dict, forecast_is_stale = forecast_future.result()
+        sunrise_sunset_dict, sunrise_sunset_is_stale = sunrise_sunset_future.result()
+        stale_sources = []
+        if weather_is_stale:
+            stale_sources.append('weather')
+        if forecast_is_stale:
+            stale_sources.append('forecast')
+        if sunrise_sunset_is_stale:
+            stale_sources.append('sunrise_sunset')
+
+        yelp_affordances = None
+        if (lat, lng) in yelp_futures:
+            place_categories_dict, yelp_is_stale = yelp_futures[(lat, lng)].result()
+            yelp_affordances = place_categories_dict, place_categories_dict_as_keyvalues(place_categories_dict)
+            if yelp_is_stale:
+                stale_sources.append('yelp')
+
+        fetched_data = {
+            'weather': combine_weather_forecast(weather_dict, forecast_dict),
+            'sunrise_sunset': sunrise_sunset_dict,
+            'yelp': yelp_affordances,
+            'stale_sources': sorted(stale_sources),
+            'missing_sources': []
+        }
+        batch_conditions.append(format_conditions_as_keyvalues(lat, lng, get_campus_categories_for_location(lat, lng),
+                                                               fetched_data))
+
+    return batch_conditions
+
+
+def fetch_conditions_data(lat, lng, include_yelp=True, deadline=None):
+    """
+    Fetches current weather, forecast, sunrise/sunset, and optionally yelp data for a location concurrently. Each
+    source checks its own cache and queries its upstream API on a miss, so request latency is that of the slowest
+    source, or the deadline if given.
+
+    Sources still fetching at the deadline are left out, and keep running in the background so that their results are
+    cached for later requests. With a deadline, a source that already has SOURCE_MAX_IN_FLIGHT fetches running is left
+    out at once.
+
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :param include_yelp: optional bool for whether to also fetch yelp categories
+    :param deadline: optional float seconds to wait for sources. None waits for all of them.
+    :return: dict with keys 'weather' (current weather and forecast, see combine_weather_forecast), 'sunrise_sunset',
+        and 'yelp' (None if not included) holding each source's data, 'stale_sources' listing the sources that
+        returned stale cached data, and 'missing_sources' listing the sources left out at the deadline
+    """
+    sources = [('weather', get_weather_data), ('forecast', get_forecast_data),
+               ('sunrise_sunset', get_sunrise_sunset_data)]
+    if include_yelp:
+        sources.append(('yelp', get_categories_for_location))
+
+    # only requests with a deadline can leave fetches running, so only they are held to SOURCE_MAX_IN_FLIGHT
+    futures = OrderedDict()
+    skipped_sources = []
+    for source, fetch in sources:
+        future = submit_source(source, fetch, lat, lng, capped=deadline is not None)
+        if future is None:
+            skipped_sources.append(source)
+        else:
+            futures[source] = future
+
+    _, not_done = wait(futures.values(), timeout=deadline)
+    missing_sources = [source for source, _ in sources
+                       if source in skipped_sources or futures[source] in not_done]
+    if missing_sources:
+        count_missing_sources(missing_sources, skipped_sources)
+
+    def result(source, default):
+        if source not in futures or source in missing_sources:
+            return default
+        return futures[source].result()[0]
+
+    # sources missing at the deadline are read as empty, as if their upstream had returned nothing
+    return {
+        'weather': combine_weather_forecast(result('weather', {}), result('forecast', {})),
+        'sunrise_sunset': result('sunrise_sunset', {}),
+        'yelp': result('yelp', None),
+        'stale_sources': sorted(source for source, future in futures.items()
+                                if source not in missing_sources and future.result()[1]),
+        'missing_sources': missing_sources
+    }
+
+
+def submit_source(source, fetch, lat, lng, capped=False):
+    """
+    Starts fetching a source on REQUEST_EXECUTOR, unless capped and SOURCE_MAX_IN_FLIGHT fetches of it are in flight.
+
+    :param source: string source name
+    :param fetch: function taking lat, lng and a stale_sources list, e.g. get_weather_data
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :param capped: optional bool whether to hold the source to SOURCE_MAX_IN_FLIGHT
+    :return: future of (data, bool whether data is stale), or None if the source was skipped
+    """
+    with SOURCE_IN_FLIGHT_LOCK:
+        if capped and SOURCE_IN_FLIGHT.get(source, 0) >= SOURCE_MAX_IN_FLIGHT:
+            return None
+        SOURCE_IN_FLIGHT[source] = SOURCE_IN_FLIGHT.get(source, 0) + 1
+
+    def source_finished(_):
+        with SOURCE_IN_FLIGHT_LOCK:
+            SOURCE_IN_FLIGHT[source] -= 1
+
+    future = REQUEST_EXECUTOR.submit(fetch_source, fetch, lat, lng)
+    future.add_done_callback(source_finished)
+    return future
+
+
+def fetch_source(fetch, lat, lng):
+    """
+    Fetches a source, with its own stale_sources list so that nothing is shared with a request that stopped waiting.
+
+    :param fetch: function taking lat, lng and a stale_sources list, e.g. get_weather_data
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :return: tuple of (data, bool whether data is stale)
+    """
+    stale_sources = []
+    data = fetch(lat, lng, stale_sources)
+    return data, bool(stale_sources)
+
+
+def count_missing_sources(missing_sources, skipped_sources=()):
+    """
+    Counts a response sent without some sources.
+
+    :param missing_sources: list of string source names
+    :param skipped_sources: optional list of string names of the missing sources that were skipped at
+        SOURCE_MAX_IN_FLIGHT
+    :return: None
+    """
+    with DEADLINE_STATS_LOCK:
+        DEADLINE_STATS['partial_responses'] += 1
+        for source in missing_sources:
+            DEADLINE_STATS['missing_sources'][source] = DEADLINE_STATS['missing_sources'].get(source, 0) + 1
+        for source in skipped_sources:
+            DEADLINE_STATS['skipped_sources'][source] = DEADLINE_STATS['skipped_sources'].get(source, 0) + 1
+
+
+def deadline_stats():
+    """
+    Returns counters for responses sent without sources that missed their deadline.
+
+    :return: dict with number of partial responses, number of times each source was missing and skipped, and number
+        of fetches of each source in flight
+    """
+    with SOURCE_IN_FLIGHT_LOCK:
+        in_flight = dict(SOURCE_IN_FLIGHT)
+    with DEADLINE_STATS_LOCK:
+        return {
+            'partial_responses': DEADLINE_STATS['partial_responses'],
+            'missing_sources': dict(DEADLINE_STATS['missing_sources']),
+            'skipped_sources': dict(DEADLINE_STATS['skipped_sources']),
+            'in_flight': in_flight
+        }
+
+
 def place_categories_dict_as_keyvalues(place_categories_dict):
     """
     :param place_categories_dict: [dict] {'bat_17_evanston': {'distance': 17.0, 'categories': ['sandwiches', 'sportsbars']},
@@ -281,63 +1121,374 @@ def place_categories_dict_as_keyvalues(place_categories_dict):
     return res
 
 
+# cache helper functions
+def fetch_through_cache(collection_name, lat, lng, distance_threshold, time_threshold, fetch_from_upstream,
+                        source_name):
+    """
+    Returns data for a location from a cache collection if there is a valid entry. Otherwise, fetches it from the
+    upstream API and adds/updates the cache. Concurrent misses for the same collection and location cell are
+    coalesced, so only one caller queries the upstream API and the others share its result.
+
+    Entries that expired less than the collection's CACHE_STALE_GRACE minutes ago are returned right away as stale
+    while a background refresh updates them. Valid entries close to expiring are also refreshed in the background,
+    with a probability that grows as they near expiry (see should_refresh_early).
+
+    :param collection_name: string cache collection to use, e.g. 'LocationCache'
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :param distance_threshold: float distance in meters a cached entry must be within
+    :param time_threshold: float minutes a cached entry is valid for
+    :param fetch_from_upstream: function taking (lat, lng) and returning data to cache
+    :param source_name: string name of the data source, used for logging
+    :return: tuple of (data, bool) with cached or freshly fetched data and whether it is stale
+    """
+    # check cache, if not there then query from upstream
+    cached_location, valid_cache_location = DATA_CACHE.fetch_from_cache(collection_name, lat, lng,
+                                                                        distance_threshold, time_threshold)
+    return serve_from_cache(collection_name, lat, lng, distance_threshold, time_threshold, fetch_from_upstream,
+                            source_name, cached_location, valid_cache_location)
+
+
+def serve_from_cache(collection_name, lat, lng, distance_threshold, time_threshold, fetch_from_upstream,
+                     source_name, cached_location, valid_cache_location):
+    """
+    Returns data for a location given the result of its cache lookup, as described in fetch_through_cache.
+
+    :param collection_name: string cache collection to use, e.g. 'LocationCache'
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :param distance_threshold: float distance in meters a cached entry must be within
+    :param time_threshold: float minutes a cached entry is valid for
+    :param fetch_from_upstream: function taking (lat, lng) and returning data to cache
+    :param source_name: string name of the data source, used for logging
+    :param cached_location: dict cached entry returned by the lookup, or None
+    :param valid_cache_location: bool whether the cached entry is valid
+    :return: tuple of (data, bool) with cached or freshly fetched data and whether it is stale
+    """
+    flight_key = '{}:{}'.format(collection_name, tile_id(lat, lng, distance_threshold))
+    refresh_args = (flight_key, refresh_cache, collection_name, lat, lng, distance_threshold, time_threshold,
+                    fetch_from_upstream, cached_location, flight_key)
+
+    # check validity of cached location
+    if cached_location is not None:
+        cache_age = DataCache.age_in_minutes(cached_location)
+
+        if valid_cache_location:
+            print("{} -- VALID Cache HIT...returning cached data.".format(source_name))
+            if should_refresh_early(collection_name, cache_age, time_threshold):
+                print("{} -- refreshing {} early in the background.".format(source_name, flight_key))
+                count_refresh(collection_name, 'early_refreshes')
+                refresh_in_background(refresh_args)
+            count_upstream(collection_name, 'saved')
+            return cached_location['data'], False
+
+        if cache_age < time_threshold + CACHE_STALE_GRACE.get(collection_name, 0):
+            print("{} -- STALE Cache HIT...returning cached data and refreshing in the background.".format(
+                source_name))
+            count_refresh(collection_name, 'stale_served')
+            count_upstream(collection_name, 'saved')
+            refresh_in_background(refresh_args)
+            return cached_location['data'], True
+
+        print("{} -- EXPIRED Cache HIT...querying data from upstream.".format(source_name))
+    else:
+        print("{} -- Cache MISS...querying data from upstream.".format(source_name))
+
+    # coalesce with other misses in the same cell
+    data, shared = SINGLE_FLIGHT.do(*refresh_args)
+    if shared:
+        print("{} -- shared result of concurrent query for {}.".format(source_name, flight_key))
+        count_upstream(collection_name, 'saved')
+    return data, False
+
+
+def should_refresh_early(collection_name, cache_age, time_threshold):
+    """
+    Decides whether to refresh a valid cache entry before it expires, using probabilistic early expiration: the
+    chance of refreshing rises sharply as the entry's age approaches time_threshold, scaled by how long the last
+    upstream fetch for the collection took. Hot entries are then renewed by a single request shortly before expiry,
+    instead of by every request that arrives just after it.
+
+    :param collection_name: string cache collection of the entry
+    :param cache_age: float age of the entry in minutes
+    :param time_threshold: float minutes the entry is valid for
+    :return: bool whether to refresh the entry now
+    """
+    if CACHE_EARLY_REFRESH_BETA <= 0:
+        return False
+
+    fetch_minutes = UPSTREAM_FETCH_SECONDS.get(collection_name, 1.0) / 60.0
+    return cache_age - fetch_minutes * CACHE_EARLY_REFRESH_BETA * math.log(1.0 - random.random()) >= time_threshold
+
+
+def refresh_in_background(refresh_args):
+    """
+    Runs a cache refresh through SINGLE_FLIGHT on REFRESH_EXECUTOR, unless one for the same key is already running or
+    REFRESH_MAX_PENDING refreshes are already waiting or running.
+
+    :param refresh_args: tuple of arguments for SINGLE_FLIGHT.do, starting with the flight key and followed by
+        refresh_cache and its collection name
+    :return: bool whether the refresh was started
+    """
+    global REFRESH_PENDING
+    if SINGLE_FLIGHT.in_flight(refresh_args[0]):
+        return False
+
+    with REFRESH_STATS_LOCK:
+        if REFRESH_PENDING >= REFRESH_MAX_PENDING:
+            dropped = True
+        else:
+            dropped = False
+            REFRESH_PENDING += 1
+    if dropped:
+        count_refresh(refresh_args[2], 'dropped_refreshes')
+        return False
+
+    REFRESH_EXECUTOR.submit(SINGLE_FLIGHT.do, *refresh_args).add_done_callback(
+        lambda future: refresh_finished(future, refresh_args[0], refresh_args[2]))
+    return True
+
+
+def refresh_finished(future, flight_key, collection_name):
+    """
+    Frees a pending slot once a background refresh has finished, and logs and counts the refresh if it failed.
+
+    :param future: Future of the refresh
+    :param flight_key: string flight key of the refresh
+    :param collection_name: string cache collection
+    :return: None
+    """
+    global REFRESH_PENDING
+    with REFRESH_STATS_LOCK:
+        REFRESH_PENDING -= 1
+
+    e = future.exception()
+    if e is not None:
+        print("{} -- background refresh of {} failed, stale data stays cached: {}".format(
+            collection_name, flight_key, e))
+        count_refresh(collection_name, 'failed_refreshes')
+
+
+def stale_while_revalidate_stats():
+    """
+    Returns a copy of the stale-while-revalidate counters per collection.
+
+    :return: dict of collection name to counters
+    """
+    with REFRESH_STATS_LOCK:
+        return {collection_name: dict(counters) for collection_name, counters in REFRESH_STATS.items()}
+
+
+def count_refresh(collection_name, counter):
+    """
+    Increments a stale-while-revalidate counter for a collection.
+
+    :param collection_name: string cache collection
+    :param counter: string counter name, e.g. 'stale_served'
+    :return: None
+    """
+    with REFRESH_STATS_LOCK:
+        collection_stats = REFRESH_STATS.setdefault(collection_name, {'stale_served': 0, 'early_refreshes': 0,
+                                                                      'dropped_refreshes': 0,
+                                                                      'failed_refreshes': 0})
+        collection_stats[counter] += 1
+
+
+def upstream_stats():
+    """
+    Returns a copy of the upstream call counters per collection.
+
+    :return: dict of collection name to counters
+    """
+    with UPSTREAM_STATS_LOCK:
+        return {collection_name: dict(counters) for collection_name, counters in UPSTREAM_STATS.items()}
+
+
+def count_upstream(collection_name, counter):
+    """
+    Increments an upstream call counter for a collection.
+
+    :param collection_name: string cache collection
+    :param counter: string counter name, 'calls', 'saved', or 'negative' for calls that failed or returned nothing
+    :return: None
+    """
+    with UPSTREAM_STATS_LOCK:
+        collection_stats = UPSTREAM_STATS.setdefault(collection_name, {'calls': 0, 'saved': 0, 'negative': 0})
+        collection_stats[counter] += 1
+
+
+def refresh_cache(collection_name, lat, lng, distance_threshold, time_threshold, fetch_from_upstream,
+                  cached_location, lock_key):
+    """
+    Fetches data for a location from the upstream API and adds/updates the cache. If SINGLEFLIGHT_DISTRIBUTED is set,
+    first takes a lock shared by all workers, and if another worker holds it waits for that worker's result to land
+    in the cache instead.
+
+    :param collection_name: string cache collection to use, e.g. 'LocationCache'
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :param distance_threshold: float distance in meters a cached entry must be within
+    :param time_threshold: float minutes a cached entry is valid for
+    :param fetch_from_upstream: function taking (lat, lng) and returning data to cache
+    :param cached_location: dict expired cache entry to update, or None to add a new one
+    :param lock_key: string key identifying the collection and location cell
+    :return: freshly fetched data
+    """
+    lock_owner = None
+    if SINGLEFLIGHT_DISTRIBUTED:
+        lock_owner = DATA_CACHE.acquire_lock(lock_key, SINGLEFLIGHT_LOCK_SECONDS)
+
+        # another worker is fetching, wait for its result
+        wait_until = time.time() + SINGLEFLIGHT_LOCK_SECONDS
+        while lock_owner is None and time.time() < wait_until:
+            time.sleep(SINGLEFLIGHT_POLL_SECONDS)
+            refreshed_location, valid_refreshed_location = DATA_CACHE.fetch_from_cache(collection_name, lat, lng,
+                                                                                      distance_threshold,
+                                                                                      time_threshold)
+            if valid_refreshed_location:
+                count_upstream(collection_name, 'saved')
+                return refreshed_location['data']
+            lock_owner = DATA_CACHE.acquire_lock(lock_key, SINGLEFLIGHT_LOCK_SECONDS)
+
+    try:
+        # query data from upstream, timing it for should_refresh_early
+        fetch_start = time.time()
+        data = fetch_from_upstream(lat, lng)
+        UPSTREAM_FETCH_SECONDS[collection_name] = time.time() - fetch_start
+        count_upstream(collection_name, 'calls')
+
+        # failed or empty responses are cached for the collection's negative TTL. an entry that had good data keeps
+        # it, so the last good data is served until the upstream API recovers.
+        negative = isinstance(data, NegativeResult)
+        if negative:
+            count_upstream(collection_name, 'negative')
+            data = data.data
+            if cached_location is not None and not cached_location.get('negative'):
+                data = cached_location['data']
+
+        # add/update to cache depending on if object previously existed in cache
+        if cached_location is None:
+            DATA_CACHE.add_to_cache(collection_name, lat, lng, data, negative=negative)
+        else:
+            DATA_CACHE.update_cache(collection_name, cached_location['_id'], data, negative=negative)
+    finally:
+        if lock_owner is not None:
+            DATA_CACHE.release_lock(lock_key, lock_owner)
+
+    return data
+
+
+def submit_many_through_cache(collection_name, locations, distance_threshold, time_threshold, fetch_from_upstream,
+                              source_name):
+    """
+    Starts fetching data for many locations through a cache collection, as fetch_through_cache does for one. Locations
+    in the same cache cell share a single lookup, the lookups are resolved with one cache query, and misses are
+    fetched from upstream concurrently on BATCH_EXECUTOR.
+
+    :param collection_name: string cache collection to use, e.g. 'LocationCache'
+    :param locations: list of (lat, lng) tuples of floats
+    :param distance_threshold: float distance in meters a cached entry must be within
+    :param time_threshold: float minutes a cached entry is valid for
+    :param fetch_from_upstream: function taking (lat, lng) and returning data to cache
+    :param source_name: string name of the data source, used for logging
+    :return: list of futures in the same order as locations, each resolving to a (data, bool) tuple as returned by
+        fetch_through_cache
+    """
+    # one representative location per cell, the same cells concurrent misses are coalesced on
+    cells = [tile_id(lat, lng, distance_threshold) for lat, lng in locations]
+    representatives = OrderedDict()
+    for cell, location in zip(cells, locations):
+        representatives.setdefault(cell, location)
+
+    cached_locations = DATA_CACHE.fetch_many_from_cache(collection_name, list(representatives.values()),
+                                                        distance_threshold, time_threshold)
+    print("{} -- {} locations in {} cells.".format(source_name, len(locations), len(representatives)))
+
+    futures = {}
+    for (cell, (lat, lng)), (cached_location, valid_cache_location) in zip(representatives.items(),
+                                                                            cached_locations):
+        serve_args = (collection_name, lat, lng, distance_threshold, time_threshold, fetch_from_upstream,
+                      source_name, cached_location, valid_cache_location)
+        if valid_cache_location:
+            futures[cell] = Future()
+            futures[cell].set_result(serve_from_cache(*serve_args))
+        else:
+            futures[cell] = BATCH_EXECUTOR.submit(serve_from_cache, *serve_args)
+
+    return [futures[cell] for cell in cells]
+
+
 # location helper functions
-def get_categories_for_location(lat, lng):
+def get_categories_for_location(lat, lng, stale_sources=None):
     """
     Returns list of strings indicating the name of businesses and categories around the lat, lng
 
     :param lat: latitude, as a float
     :param lng: longitude, as a float
+    :param stale_sources: optional list to append 'yelp' to if stale cached data is returned
     :return: tuple of (list, key-value dict) of yelp response
     """
-    # check cache, if not there then query from yelp
-    cached_location, valid_cache_location = DATA_CACHE.fetch_from_cache('LocationCache', lat, lng,
-                                                                        YELP_CACHE_DISTANCE_THRESHOLD,
-                                                                        YELP_CACHE_TIME_THRESHOLD)
+    place_categories_dict, is_stale = fetch_through_cache('LocationCache', lat, lng,
+                                                          YELP_CACHE_DISTANCE_THRESHOLD, YELP_CACHE_TIME_THRESHOLD,
+                                                          fetch_yelp_data, 'Yelp API')
+    if is_stale and stale_sources is not None:
+        stale_sources.append('yelp')
 
-    # check validity of cache
-    if cached_location is not None:
-        if valid_cache_location:
-            print("Yelp API -- VALID Cache HIT...returning cached data.")
-            place_categories_dict = cached_location['data']
-            return place_categories_dict, place_categories_dict_as_keyvalues(place_categories_dict)
-        else:
-            print("Yelp API -- EXPIRED Cache HIT...querying data from OpenWeatherMaps.")
-    else:
-        print("Yelp API -- Cache MISS...querying data from Yelp.")
+    # return output tuple
+    return place_categories_dict, place_categories_dict_as_keyvalues(place_categories_dict)
 
-    # get data from Yelp API
-    place_categories_dict = fetch_yelp_data(lat, lng)
-    print("Yelp API -- locations/categories from Yelp: {}".format(place_categories_dict))
 
-    # add/update to cache depending on if object previously existed in cache
-    if cached_location is None:
-        DATA_CACHE.add_to_cache('LocationCache', lat, lng, place_categories_dict)
-    else:
-        DATA_CACHE.update_cache('LocationCache', cached_location['_id'], place_categories_dict)
+def get_campus_categories_for_location(lat, lng):
+    """
+    Returns campus buildings containing or near the lat, lng, with their categories.
 
-    # return output tuple
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :return: tuple of (dict, key-value dict) of campus buildings, in the same shape as get_categories_for_location
+    """
+    place_categories_dict = CAMPUS_GEOMETRY.place_categories_dict(lat, lng,
+                                                                  distance_threshold=CAMPUS_BUILDING_DISTANCE_THRESHOLD)
     return place_categories_dict, place_categories_dict_as_keyvalues(place_categories_dict)
 
 
+def needs_yelp(lat, lng):
+    """
+    Returns whether Yelp should be queried for a location. Points inside a campus building skip Yelp if
+    CAMPUS_SKIP_YELP is set, since the building provides their place categories.
+
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :return: bool
+    """
+    return not (CAMPUS_SKIP_YELP and CAMPUS_GEOMETRY.containing(lat, lng))
+
+
 def fetch_yelp_data(lat, lng):
     """
     Returns data from Yelp as a list, given at latitude and longitude.
 
     :param lat: latitude, as a float
     :param lng: longitude, as a float
-    :return: list of Yelp responses, empty if nothing is returned
+    :return: list of Yelp responses, empty if nothing is returned. NegativeResult with only hardcoded locations if
+        Yelp failed.
     """
     # query data from yelp
     categories = ['grocery', 'trainstations', 'transport', 'bars', 'climbing', 'cafeteria', 'libraries',
                   'religiousorgs', 'sports_clubs', 'fitness']
-    place_categories_dict = YELP_API.fetch_all_locations(lat, lng, ','.join(categories),
-                                                         distance_threshold=HARDCODED_LOCATION_DISTANCE_THRESHOLD,
-                                                         radius=YELP_QUERY_RADIUS)
+    try:
+        place_categories_dict = YELP_API.fetch_all_locations(lat, lng, ','.join(categories),
+                                                             distance_threshold=HARDCODED_LOCATION_DISTANCE_THRESHOLD,
+                                                             radius=YELP_QUERY_RADIUS)
+    except RuntimeError as e:
+        print("Yelp API -- request failed, caching hardcoded locations only: {}".format(e))
+        return NegativeResult(YELP_API.fetch_hardcoded_locations(
+            lat, lng, distance_threshold=HARDCODED_LOCATION_DISTANCE_THRESHOLD))
 
     #  if request returns None, return empty
     if place_categories_dict is None:
-        return {}
+        place_categories_dict = {}
+
+    print("Yelp API -- locations/categories from Yelp: {}".format(place_categories_dict))
     return place_categories_dict
 
 
@@ -366,115 +1517,208 @@ def get_custom_affordances(conditions):
     return found_custom_affordances, {key: True for key in found_custom_affordances}
 
 # weather and time helper functions
-def get_weather_data(lat, lng):
+def get_weather_data(lat, lng, stale_sources=None):
     """
-    Fetches weather and forecast data for location from cache, if possible. Otherwise, queries API.
+    Fetches current weather data for location from cache, if possible. Otherwise, queries API.
 
     :param lat: latitude, as float
     :param lng: longitude, as float
-    :return: dict with keys 'weather' and 'forecast' with lists containing current weather and forecast responses.
+    :param stale_sources: optional list to append 'weather' to if stale cached data is returned
+    :return: dict with current weather as returned by fetch_weather_data, or in the raw format cached before it.
     """
-    # check cache, if not there then query from weather api
-    cached_location, valid_cache_location = DATA_CACHE.fetch_from_cache('WeatherCache', lat, lng,
-                                                                        WEATHER_CACHE_DISTANCE_THRESHOLD,
-                                                                        WEATHER_CACHE_TIME_THRESHOLD)
+    weather_dict, is_stale = fetch_through_cache('WeatherCache', lat, lng,
+                                                 WEATHER_CACHE_DISTANCE_THRESHOLD,
+                                                 WEATHER_CACHE_TIME_THRESHOLD,
+                                                 fetch_weather_data, 'Weather API')
+    if is_stale and stale_sources is not None:
+        stale_sources.append('weather')
+    return weather_dict
 
-    # check validity of cached location
-    if cached_location is not None:
-        if valid_cache_location:
-            print("Weather API -- VALID Cache HIT...returning cached data.")
-            weather_forecast_dict = cached_location['data']
-            return weather_forecast_dict
-        else:
-            print("Weather API -- EXPIRED Cache HIT...querying data from OpenWeatherMaps.")
-    else:
-        print("Weather API -- Cache MISS...querying data from OpenWeatherMaps.")
 
-    # query data from API
-    weather_results = WEATHER_API.get_weather_at_location(lat, lng)
-    forecast_results = WEATHER_API.get_forecast_at_location(lat, lng)
+def fetch_weather_data(lat, lng):
+    """
+    Queries OpenWeatherMaps for current weather at a location.
 
-    if weather_results is None:
-        weather_results = []
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :return: dict in the compact weather format (see cache_schema), and 'timezone'. wrapped in NegativeResult if
+        the request failed.
+    """
+    # query data from API, keeping only the fields used
+    weather_resp = WEATHER_API.get_weather_at_location(lat, lng)
+    weather_dict = cache_schema.compact_weather(weather_resp)
+    weather_dict['timezone'] = TIMEZONE_RESOLVER.timezone_at(lat, lng)
+    print("Weather API -- weather from OpenWeatherMaps: {}".format(weather_dict))
 
-    if forecast_results is None:
-        forecast_results = []
+    if not weather_resp:
+        return NegativeResult(weather_dict)
 
-    weather_forecast_dict = {
-        'weather': weather_results,
-        'forecast': forecast_results
-    }
-    print("Weather API -- weather/forecast from OpenWeatherMaps: {}".format(weather_forecast_dict))
+    # return weather dict
+    return weather_dict
 
-    # update/add to cache as needed
-    if cached_location is None:
-        DATA_CACHE.add_to_cache('WeatherCache', lat, lng, weather_forecast_dict)
-    else:
-        DATA_CACHE.update_cache('WeatherCache', cached_location['_id'], weather_forecast_dict)
 
-    # return weather/forecast dict
-    return weather_forecast_dict
+def get_forecast_data(lat, lng, stale_sources=None):
+    """
+    Fetches forecast data for location from cache, if possible. Otherwise, queries API.
+
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :param stale_sources: optional list to append 'forecast' to if stale cached data is returned
+    :return: dict with forecast as returned by fetch_forecast_data, or in the raw format cached before it.
+    """
+    forecast_dict, is_stale = fetch_through_cache('ForecastCache', lat, lng,
+                                                  FORECAST_CACHE_DISTANCE_THRESHOLD,
+                                                  FORECAST_CACHE_TIME_THRESHOLD,
+                                                  fetch_forecast_data, 'Forecast API')
+    if is_stale and stale_sources is not None:
+        stale_sources.append('forecast')
+    return forecast_dict
+
+
+def fetch_forecast_data(lat, lng):
+    """
+    Queries OpenWeatherMaps for the 5 day forecast at a location.
+
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :return: dict in the compact forecast format (see cache_schema), and 'timezone'. wrapped in NegativeResult if
+        the request failed.
+    """
+    # query data from API, keeping only the fields used
+    forecast_resp = WEATHER_API.get_forecast_at_location(lat, lng)
+    forecast_dict = cache_schema.compact_forecast(forecast_resp)
+    forecast_dict['timezone'] = TIMEZONE_RESOLVER.timezone_at(lat, lng)
+    print("Forecast API -- forecast from OpenWeatherMaps: {}".format(forecast_dict))
+
+    if not forecast_resp:
+        return NegativeResult(forecast_dict)
+
+    # return forecast dict
+    return forecast_dict
+
+
+def combine_weather_forecast(weather_dict, forecast_dict):
+    """
+    Combines current weather and forecast into the dict compute_weather_time_affordances expects, converting data
+    cached in the raw upstream format. WeatherCache entries written before the forecast had its own cache also hold a
+    'forecast', which is ignored in favor of ForecastCache.
+
+    :param weather_dict: dict returned by get_weather_data
+    :param forecast_dict: dict returned by get_forecast_data
+    :return: dict with compact weather and forecast fields (see cache_schema), and 'timezone'
+    """
+    forecast = cache_schema.forecast_series(forecast_dict)
+    return {
+        'schema': cache_schema.SCHEMA_VERSION,
+        'weather_main': cache_schema.weather_main(weather_dict),
+        'forecast_dt': forecast[0] if forecast is not None else None,
+        'forecast_main': forecast[1] if forecast is not None else None,
+        'timezone': weather_dict.get('timezone') or forecast_dict.get('timezone')
+    }
+
 
 # sunrise/sunset time information
-def get_sunrise_sunset_data(lat, lng):
+def get_sunrise_sunset_data(lat, lng, stale_sources=None):
     """
-    Fetches sunset/sunrise for location from cache, if possible. Otherwise, queries API.
+    Computes sunset/sunrise for location if SUNRISE_SUNSET_SOURCE is 'local'. Otherwise, fetches them from cache, if
+    possible, or queries API.
 
     :param lat: latitude, as float
     :param lng: longitude, as float
-    :return:  TODO(rlouie)
+    :param stale_sources: optional list to append 'sunrise_sunset' to if stale cached data is returned
+    :return: dict of today's sunrise/sunset in the compact format (see cache_schema), or the raw format cached before
+        it. empty if unavailable
     """
-    cached_location, valid_cache_location = DATA_CACHE.fetch_from_cache('SunriseSunsetCache', lat, lng,
-                                                                        SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD,
-                                                                        SUNRISE_SUNSET_TIME_THRESHOLD)
-    # check validity of cached location
-    if cached_location is not None:
-        if valid_cache_location:
-            print("SunriseSunset API -- VALID Cache HIT...returning cached data.")
-            sunrise_sunset_dict = cached_location['data']
-            return sunrise_sunset_dict
-        else:
-            print("SunriseSunset API -- EXPIRED Cache HIT...querying data from sunrise-sunset.org/api.")
-    else:
-        print("Weather API -- Cache MISS...querying data from sunrise-sunset.org/api.")
+    if SUNRISE_SUNSET_SOURCE == 'local':
+        return compute_sunrise_sunset_data(lat, lng)
+
+    sunrise_sunset_dict, is_stale = fetch_through_cache('SunriseSunsetCache', lat, lng,
+                                                        SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD,
+                                                        SUNRISE_SUNSET_TIME_THRESHOLD,
+                                                        fetch_sunrise_sunset_data, 'SunriseSunset API')
+    if is_stale and stale_sources is not None:
+        stale_sources.append('sunrise_sunset')
+    return sunrise_sunset_dict
 
-    # query data from API
-    sunrise_sunset_dict = SUNRISE_SUNSET_API.get_sunrise_sunset_at_location(lat, lng)
 
-    if sunrise_sunset_dict is None:
-        sunrise_sunset_dict = {}
+def fetch_sunrise_sunset_data(lat, lng):
+    """
+    Queries sunrise-sunset.org for today's sunrise and sunset at a location.
 
-    print("SunriseSunset API -- weather/forecast from OpenWeatherMaps: {}".format(sunrise_sunset_dict))
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :return: dict in the compact sunrise/sunset format (see cache_schema) and 'timezone', NegativeResult of an empty
+        dict if request failed
+    """
+    # query data from API, keeping only the fields used
+    sunrise_sunset_dict = cache_schema.compact_sunrise_sunset(SUNRISE_SUNSET_API.get_sunrise_sunset_at_location(lat,
+                                                                                                                lng))
+    print("SunriseSunset API -- sunrise/sunset from sunrise-sunset.org: {}".format(sunrise_sunset_dict))
+    if not sunrise_sunset_dict:
+        return NegativeResult(sunrise_sunset_dict)
 
-    # update/add to cache as needed
-    if cached_location is None:
-        DATA_CACHE.add_to_cache('SunriseSunsetCache', lat, lng, sunrise_sunset_dict)
-    else:
-        DATA_CACHE.update_cache('SunriseSunsetCache', cached_location['_id'], sunrise_sunset_dict)
+    sunrise_sunset_dict['timezone'] = TIMEZONE_RESOLVER.timezone_at(lat, lng)
+
+    # return sunrise/sunset dict
+    return sunrise_sunset_dict
 
-    # return weather/forecast dict
+
+def compute_sunrise_sunset_data(lat, lng, date=None):
+    """
+    Computes sunrise and sunset at a location, without querying sunrise-sunset.org.
+
+    :param lat: latitude, as float
+    :param lng: longitude, as float
+    :param date: optional local date to compute for. defaults to today at the location.
+    :return: dict with the same sunrise/sunset fields as fetch_sunrise_sunset_data, empty during polar day or night
+    """
+    tz_name = TIMEZONE_RESOLVER.timezone_at(lat, lng)
+    if date is None:
+        date = datetime.datetime.now(timezone(tz_name) if tz_name else utc).date()
+
+    sunrise_sunset_dict = cache_schema.compact_sunrise_sunset(SOLAR_CALCULATOR.sunrise_sunset_at(lat, lng, date))
+    if not sunrise_sunset_dict:
+        return {}
+
+    sunrise_sunset_dict['timezone'] = tz_name
     return sunrise_sunset_dict
 
-def compute_weather_time_affordances(lat, lng):
+
+def compute_weather_time_affordances(lat, lng, weather_forecast_dict=None, sunrise_sunset_dict=None, as_of=None):
     """
     Get the weather for current latitude and longitude, returned as a tuple.
 
     :param lat: latitude, as float
     :param lng: longitude, as float
+    :param weather_forecast_dict: optional dict already returned by combine_weather_forecast for the location
+    :param sunrise_sunset_dict: optional dict already returned by get_sunrise_sunset_data for the location
+    :param as_of: optional timezone-aware datetime to compute time affordances (local time, weekday, period of day)
+        for, instead of now. sunrise/sunset times are moved to the same local date.
     :return: tuple of (list, key-value dict) of weather for the location
     """
-    # get weather, forecast, and sunrise/sunset data
-    weather_forecast_dict = get_weather_data(lat, lng)
-    weather_resp = weather_forecast_dict['weather']
-    forecast_resp = weather_forecast_dict['forecast']
-    sunrise_sunset_dict = get_sunrise_sunset_data(lat, lng)
+    # get weather, forecast, and sunrise/sunset data if not already fetched
+    if weather_forecast_dict is None or sunrise_sunset_dict is None:
+        fetched_data = fetch_conditions_data(lat, lng, include_yelp=False)
+        weather_forecast_dict = fetched_data['weather']
+        sunrise_sunset_dict = fetched_data['sunrise_sunset']
+
+    # read cached data, in either the compact or raw upstream format
+    weather_features = list(cache_schema.weather_main(weather_forecast_dict))
+    forecast = cache_schema.forecast_series(weather_forecast_dict)
+    sunrise_sunset = cache_schema.sunrise_sunset_epochs(sunrise_sunset_dict)
 
     # create key-value output
     output_dict = {}
 
-    # specific local time variables
-    current_local = get_local_time(lat, lng)
-    current_in_utc = datetime.datetime.utcnow().replace(tzinfo=utc)
+    # specific local time variables, reusing the timezone stored with cached data when available
+    tz_name = weather_forecast_dict.get('timezone') or sunrise_sunset_dict.get('timezone')
+    current_local = get_local_time(lat, lng, tz_name=tz_name, as_of=as_of)
+    current_in_utc = current_local.astimezone(utc)
+
+    # sunrise/sunset can be computed for the exact date being computed for, otherwise they are moved to it below
+    if as_of is not None and SUNRISE_SUNSET_SOURCE == 'local':
+        sunrise_sunset = cache_schema.sunrise_sunset_epochs(compute_sunrise_sunset_data(lat, lng,
+                                                                                        date=current_local.date()))
     days_of_the_week = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
     current_day = days_of_the_week[current_local.weekday()]
     output_dict['utc_offset'] = current_local.utcoffset().total_seconds() / 60 / 60
@@ -483,37 +1727,30 @@ def compute_weather_time_affordances(lat, lng):
     output_dict[current_local.tzinfo.zone] = True  # 'America/Chicago': True
     output_dict[current_day] = True  # 'wednesday': True
 
-    # parse weather
-    if weather_resp:
-        weather_features = [weather['main'] for weather in weather_resp['weather']]
-        output_dict.update({weather_key: True for weather_key in weather_features})
-    else:
-        weather_features = []
+    # weather
+    output_dict.update({weather_key: True for weather_key in weather_features})
 
     # get sunrise/sunset/current times
-    if sunrise_sunset_dict:
-        sunrise = datetime.datetime.strptime(sunrise_sunset_dict["sunrise"], '%Y-%m-%dT%H:%M:%S+00:00')
-        sunset = datetime.datetime.strptime(sunrise_sunset_dict["sunset"], '%Y-%m-%dT%H:%M:%S+00:00')
-        sunrise_in_utc = sunrise.replace(tzinfo=utc)
-        sunset_in_utc = sunset.replace(tzinfo=utc)
+    if sunrise_sunset is not None:
+        sunrise_in_utc = datetime.datetime.fromtimestamp(sunrise_sunset[0], utc)
+        sunset_in_utc = datetime.datetime.fromtimestamp(sunrise_sunset[1], utc)
+        sunset_minute = sunset_in_utc.minute
+
+        # sunrise/sunset data is for the day it was fetched, shift it to the local date being computed for
+        if as_of is not None:
+            days_offset = current_local.date() - sunrise_in_utc.astimezone(current_local.tzinfo).date()
+            sunrise_in_utc += days_offset
+            sunset_in_utc += days_offset
         output_dict[period_of_day(current_in_utc, sunrise_in_utc, sunset_in_utc)] = True
-        output_dict['sunset_time_minutes'] = sunset.minute
-
-    if forecast_resp and sunrise_sunset_dict:
-        # parse forecast
-        forecast_sunset = ''
-
-        for prediction in forecast_resp['list']:
-            forecast_dt = datetime.datetime.utcfromtimestamp(prediction['dt'])
-            forecast_dt = forecast_dt.replace(tzinfo=utc)
+        output_dict['sunset_time_minutes'] = sunset_minute
 
-            # get only the sunset predicted weather (weather within 3 hours of sunset time)
-            if abs(sunset_in_utc - forecast_dt) <= datetime.timedelta(hours=3):
-                if sunset_in_utc.weekday() == forecast_dt.weekday():
-                    forecast_sunset += '{}'.format(prediction["weather"][0]["main"].lower())
-                    break
+    if forecast is not None and sunrise_sunset is not None:
+        forecast_timeline = ForecastTimeline(*forecast)
 
-        output_dict['sunset_predicted_weather'] = forecast_sunset
+        # get only the sunset predicted weather (first prediction within 3 hours of sunset time, on the same day)
+        forecast_sunset = forecast_timeline.first_near(calendar.timegm(sunset_in_utc.utctimetuple()), 3 * 60 * 60,
+                                                       same_utc_day=True)
+        output_dict['sunset_predicted_weather'] = forecast_sunset.lower() if forecast_sunset is not None else ''
 
     # return output tuple
     return weather_features + [current_day], output_dict
@@ -543,21 +1780,172 @@ def period_of_day(current_in_utc, sunrise_in_utc, sunset_in_utc):
         return "nighttime"
 
 
-def get_local_time(lat, lng):
+def get_local_time(lat, lng, tz_name=None, as_of=None):
     """
     Given a location, find the current local time in that time zone.
 
     :param lat: latitude, as float
     :param lng: longitude, as float
+    :param tz_name: optional timezone name already known for the location, e.g. from cached data
+    :param as_of: optional timezone-aware datetime to convert to local time, instead of now
     :return: current local time
     """
     # find the current timezone
-    tf = TimezoneFinder()
-    tz = timezone(tf.timezone_at(lng=lng, lat=lat))
+    if tz_name is None:
+        tz_name = TIMEZONE_RESOLVER.timezone_at(lat, lng)
+    tz = timezone(tz_name)
+
+    if as_of is not None:
+        return as_of.astimezone(tz)
 
     # get the current time with timezone set to above
     return datetime.datetime.now(tz)
 
 
+# movement prefetching
+def prefetch_along_path(session_id, lat, lng):
+    """
+    Records a session's location and, if MOVEMENT_PREFETCH_ENABLED is set, starts fetching Yelp data in the background
+    for up to MOVEMENT_PREFETCH_CELLS cache cells along its predicted path over the next MOVEMENT_PREFETCH_SECONDS, so
+    the session's next requests hit a warm cache.
+
+    :param session_id: string id sent by the client, or None if it did not send one
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :return: int number of prefetches started
+    """
+    global PREFETCH_PENDING
+    if not MOVEMENT_PREFETCH_ENABLED or not session_id:
+        return 0
+
+    MOVEMENT_TRACKER.record(session_id, lat, lng)
+
+    # sample the path at half a cell so no cell along it is skipped
+    current_cell = tile_id(lat, lng, YELP_CACHE_DISTANCE_THRESHOLD)
+    cells = OrderedDict()
+    for path_lat, path_lng in MOVEMENT_TRACKER.predict_path(session_id, MOVEMENT_PREFETCH_SECONDS,
+                                                            YELP_CACHE_DISTANCE_THRESHOLD / 2.0):
+        if len(cells) >= MOVEMENT_PREFETCH_CELLS:
+            break
+        cell = tile_id(path_lat, path_lng, YELP_CACHE_DISTANCE_THRESHOLD)
+        if cell != current_cell and cell not in cells and needs_yelp(path_lat, path_lng):
+            cells[cell] = (path_lat, path_lng)
+
+    started = 0
+    for cell, (path_lat, path_lng) in cells.items():
+        flight_key = 'LocationCache:{}'.format(cell)
+        if SINGLE_FLIGHT.in_flight(flight_key):
+            continue
+
+        with PREFETCH_LOCK:
+            if PREFETCH_PENDING >= MOVEMENT_PREFETCH_MAX_PENDING:
+                PREFETCH_STATS['dropped'] += 1
+                continue
+            PREFETCH_PENDING += 1
+            PREFETCH_STATS['submitted'] += 1
+
+        PREFETCH_EXECUTOR.submit(prefetch_yelp_cell, path_lat, path_lng, flight_key)
+        started += 1
+    return started
+
+
+def prefetch_yelp_cell(lat, lng, flight_key):
+    """
+    Fetches Yelp data for a location into LocationCache unless a valid entry is already there. Runs on
+    PREFETCH_EXECUTOR, coalesced with requests for the same cell through SINGLE_FLIGHT.
+
+    :param lat: latitude, as a float
+    :param lng: longitude, as a float
+    :param flight_key: string key identifying the collection and location cell
+    :return: None
+    """
+    global PREFETCH_PENDING
+    try:
+        cached_location, valid_cache_location = DATA_CACHE.fetch_from_cache('LocationCache', lat, lng,
+                                                                            YELP_CACHE_DISTANCE_THRESHOLD,
+                                                                            YELP_CACHE_TIME_THRESHOLD)
+        if valid_cache_location:
+            counter = 'already_cached'
+        else:
+            print("Yelp API -- prefetching {} ahead of a moving client.".format(flight_key))
+            SINGLE_FLIGHT.do(flight_key, refresh_cache, 'LocationCache', lat, lng, YELP_CACHE_DISTANCE_THRESHOLD,
+                             YELP_CACHE_TIME_THRESHOLD, fetch_yelp_data, cached_location, flight_key)
+            counter = 'prefetched'
+    except Exception as e:
+        print("Yelp API -- error prefetching {}: {}".format(flight_key, e))
+        counter = 'errors'
+
+    with PREFETCH_LOCK:
+        PREFETCH_PENDING -= 1
+        PREFETCH_STATS[counter] += 1
+
+
+def prefetch_stats():
+    """
+    Returns a copy of the movement prefetch counters.
+
+    :return: dict of counters, and the number of prefetches pending
+    """
+    with PREFETCH_LOCK:
+        return dict(PREFETCH_STATS, pending=PREFETCH_PENDING)
+
+
+# cache pre-warming
+def prewarm_jobs():
+    """
+    Lists the cache entries to keep warm: Yelp, weather, forecast, and (if fetched from sunrise-sunset.org)
+    sunrise/sunset data for hardcoded locations, places in PREWARM_PLACES_FILE, and campus buildings. Locations sharing
+    a cache cell share a job.
+
+    :return: list of WarmJob
+    """
+    try:
+        places = read_places(PREWARM_PLACES_FILE)
+    except IOError as e:
+        print("Prewarm -- could not read places from {}: {}".format(PREWARM_PLACES_FILE, e))
+        places = []
+
+    jobs = OrderedDict()
+    for lat, lng in hot_locations(HARDCODED_LOCATION, places, CAMPUS_GEOMETRY):
+        sources = [('WeatherCache', WEATHER_CACHE_DISTANCE_THRESHOLD, WEATHER_CACHE_TIME_THRESHOLD,
+                    fetch_weather_data, 'Weather API'),
+                   ('ForecastCache', FORECAST_CACHE_DISTANCE_THRESHOLD, FORECAST_CACHE_TIME_THRESHOLD,
+                    fetch_forecast_data, 'Forecast API')]
+        if needs_yelp(lat, lng):
+            sources.append(('LocationCache', YELP_CACHE_DISTANCE_THRESHOLD, YELP_CACHE_TIME_THRESHOLD,
+                            fetch_yelp_data, 'Yelp API'))
+        if SUNRISE_SUNSET_SOURCE == 'api':
+            sources.append(('SunriseSunsetCache', SUNRISE_SUNSET_CACHE_DISTANCE_THRESHOLD,
+                            SUNRISE_SUNSET_TIME_THRESHOLD, fetch_sunrise_sunset_data, 'SunriseSunset API'))
+
+        for collection_name, distance_threshold, time_threshold, fetch_from_upstream, source_name in sources:
+            flight_key = '{}:{}'.format(collection_name, tile_id(lat, lng, distance_threshold))
+            if flight_key not in jobs:
+                jobs[flight_key] = WarmJob(collection_name, lat, lng, distance_threshold, time_threshold,
+                                           fetch_from_upstream, source_name)
+    return list(jobs.values())
+
+
+def prewarm_refresh(job, cached_location):
+    """
+    Refreshes a cache entry for CACHE_WARMER through SINGLE_FLIGHT, so it is coalesced with requests missing the same
+    entry.
+
+    :param job: WarmJob to refresh
+    :param cached_location: dict cache entry to update, or None to add a new one
+    :return: None
+    """
+    flight_key = '{}:{}'.format(job.collection_name, tile_id(job.lat, job.lng, job.distance_threshold))
+    SINGLE_FLIGHT.do(flight_key, refresh_cache, job.collection_name, job.lat, job.lng, job.distance_threshold,
+                     job.time_threshold, job.fetch_from_upstream, cached_location, flight_key)
+
+
+CACHE_WARMER = CacheWarmer(DATA_CACHE, prewarm_jobs(), prewarm_refresh, lead_minutes=PREWARM_LEAD_MINUTES,
+                           interval_seconds=PREWARM_INTERVAL, rate_per_minute=PREWARM_RATE_PER_MINUTE,
+                           load=in_flight_requests, max_load=PREWARM_MAX_IN_FLIGHT)
+if PREWARM_ENABLED:
+    CACHE_WARMER.start()
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=int(environ.get("PORT", 5000)), host='0.0.0.0')
@@ -0,0 +1,200 @@
+"""
+This module is an in-process, location-keyed LRU cache used as the L1 tier in front of DataCache's MongoDB lookups.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import datetime
+import math
+import threading
+from collections import OrderedDict
+
+import distance
+from geo_cells import METERS_PER_DEGREE_LAT, MIN_METERS_PER_DEGREE_LAT
+
+
+class LocationLRUCache(object):
+    """
+    Holds recently used cache documents for one collection, in the same {'_id', 'location', 'data', 'date'} shape
+    they have in MongoDB, and answers nearest-within-distance queries against them. Documents are bucketed into
+    square grid cells, so a lookup only checks documents in the cells overlapping its bounding box.
+
+    Attributes:
+        max_entries (int): maximum number of documents to hold before evicting the least recently used one.
+        cell_size_meters (float): size of a grid cell in meters of latitude, or None until the first lookup.
+        evictions (int): number of documents evicted to stay within max_entries.
+        expirations (int): number of documents dropped because they were older than the time threshold.
+    """
+
+    def __init__(self, max_entries=1024, cell_size_meters=None):
+        """
+        Returns a LocationLRUCache object with class variables initialized.
+
+        :param max_entries: optional int maximum number of documents to hold.
+        :param cell_size_meters: optional float size of a grid cell in meters. defaults to the distance threshold of
+            the first lookup, so that lookups with the same threshold check at most four cells.
+        """
+        self.max_entries = max_entries
+        self.cell_size_meters = cell_size_meters
+        self.evictions = 0
+        self.expirations = 0
+
+        self._docs = OrderedDict()
+        self._cells = {}  # (row, col) tuple to set of ids of documents in that cell
+        self._doc_cells = {}  # id of document to its (row, col) cell
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _cell_for(self, lat, lng):
+        cell_size = self.cell_size_meters / METERS_PER_DEGREE_LAT
+        return int(math.floor(lat / cell_size)), int(math.floor(lng / cell_size))
+
+    def _index(self, doc):
+        if self.cell_size_meters is None:
+            return
+        doc_lng, doc_lat = doc['location']
+        cell = self._cell_for(doc_lat, doc_lng)
+        self._doc_cells[doc['_id']] = cell
+        self._cells.setdefault(cell, set()).add(doc['_id'])
+
+    def _unindex(self, object_id):
+        cell = self._doc_cells.pop(object_id, None)
+        if cell is None:
+            return
+        cell_ids = self._cells[cell]
+        cell_ids.discard(object_id)
+        if not cell_ids:
+            del self._cells[cell]
+
+    def _delete(self, object_id):
+        del self._docs[object_id]
+        self._unindex(object_id)
+
+    def _candidate_ids(self, lat, lng, lat_delta, lng_delta):
+        min_row, min_col = self._cell_for(lat - lat_delta, lng - lng_delta)
+        max_row, max_col = self._cell_for(lat + lat_delta, lng + lng_delta)
+
+        # for thresholds much larger than a cell, scanning occupied cells is cheaper than visiting every cell in range
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+            return [object_id for (row, col), cell_ids in self._cells.items()
+                    if min_row <= row <= max_row and min_col <= col <= max_col
+                    for object_id in cell_ids]
+        return [object_id
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                for object_id in self._cells.get((row, col), ())]
+
+    def lookup(self, lat, lng, distance_threshold, time_threshold):
+        """
+        Returns the nearest document within distance_threshold that is younger than time_threshold.
+
+        :param lat: Latitude of location, as float.
+        :param lng: Longitude of location, as float.
+        :param distance_threshold: A float that determine the distance in meters the document must be within.
+        :param time_threshold: An int that specifies the longest a document is valid for in minutes.
+        :return: tuple of (dict, float) with the document and its distance in meters, or (None, None) if none match.
+        """
+        # cheap bounding box in degrees, padded to contain the circle, so that only nearby documents need a distance
+        # computed
+        lat_delta = distance_threshold / MIN_METERS_PER_DEGREE_LAT
+        lng_delta = lat_delta / max(math.cos(math.radians(min(abs(lat) + lat_delta, 90.0))), 1e-6)
+        current_date = datetime.datetime.utcnow()
+
+        nearest_doc, nearest_dist = None, None
+        with self._lock:
+            if self.cell_size_meters is None:
+                self.cell_size_meters = distance_threshold
+                for doc in self._docs.values():
+                    self._index(doc)
+
+            for object_id in self._candidate_ids(lat, lng, lat_delta, lng_delta):
+                doc = self._docs[object_id]
+
+                # drop documents that have expired, they will be reloaded from MongoDB when needed
+                time_delta_mins = divmod((current_date - doc['date']).total_seconds(), 60)[0]
+                if time_delta_mins >= time_threshold:
+                    self._delete(object_id)
+                    self.expirations += 1
+                    continue
+
+                doc_lng, doc_lat = doc['location']
+                if abs(doc_lat - lat) > lat_delta or abs(doc_lng - lng) > lng_delta:
+                    continue
+
+                dist = distance.distance(doc_lat, doc_lng, lat, lng)
+                if dist < distance_threshold and (nearest_dist is None or dist < nearest_dist):
+                    nearest_doc, nearest_dist = doc, dist
+
+            if nearest_doc is not None:
+                self._docs.move_to_end(nearest_doc['_id'])
+
+        return nearest_doc, nearest_dist
+
+    def get(self, object_id, time_threshold):
+        """
+        Returns the document with the given id if it is younger than time_threshold.
+
+        :param object_id: Id of document to return.
+        :param time_threshold: An int that specifies the longest a document is valid for in minutes.
+        :return: dict document, or None if not held or expired.
+        """
+        current_date = datetime.datetime.utcnow()
+
+        with self._lock:
+            doc = self._docs.get(object_id)
+            if doc is None:
+                return None
+
+            time_delta_mins = divmod((current_date - doc['date']).total_seconds(), 60)[0]
+            if time_delta_mins >= time_threshold:
+                self._delete(object_id)
+                self.expirations += 1
+                return None
+
+            self._docs.move_to_end(object_id)
+            return doc
+
+    def put(self, doc):
+        """
+        Adds or replaces a document, evicting the least recently used one if over max_entries.
+
+        :param doc: dict cache document with '_id', 'location', 'data', and 'date' keys.
+        :return: None
+        """
+        with self._lock:
+            self._unindex(doc['_id'])
+            self._docs[doc['_id']] = doc
+            self._docs.move_to_end(doc['_id'])
+            self._index(doc)
+
+            while len(self._docs) > self.max_entries:
+                evicted_id, _ = self._docs.popitem(last=False)
+                self._unindex(evicted_id)
+                self.evictions += 1
+
+    def update(self, object_id, new_data, new_date):
+        """
+        Updates the data and date of a document, if it is held.
+
+        :param object_id: Id of document to update.
+        :param new_data: new data for the document.
+        :param new_date: new datetime the document was cached at.
+        :return: None
+        """
+        with self._lock:
+            doc = self._docs.get(object_id)
+            if doc is not None:
+                self._docs[object_id] = dict(doc, data=new_data, date=new_date)
+
+    def remove(self, object_id):
+        """
+        Removes a document, if it is held.
+
+        :param object_id: Id of document to remove.
+        :return: None
+        """
+        with self._lock:
+            if object_id in self._docs:
+                self._delete(object_id)
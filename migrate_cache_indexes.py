@@ -0,0 +1,22 @@
+"""
+One-off migration that drops the planar 'location_2d' index older versions created on each cache collection, and
+creates the spherical index lookups now use. Lookups fall back to a slower $geoWithin query while both indexes exist.
+
+Older workers create the planar index again on every lookup, so run this once the deploy has fully rolled out and no
+worker runs an older version (not as a release step, which runs while old workers still serve requests).
+
+From root of project, call
+python migrate_cache_indexes.py
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import main
+
+
+if __name__ == '__main__':
+    for collection_name in sorted(main.CACHE_NEGATIVE_TTLS):
+        if main.DATA_CACHE.migrate_indexes(collection_name):
+            print('{} -- dropped location_2d, 2dsphere index in place.'.format(collection_name))
+        else:
+            print('{} -- no location_2d index, 2dsphere index in place.'.format(collection_name))
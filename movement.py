@@ -0,0 +1,145 @@
+"""
+This module tracks the recent locations of clients that identify themselves with a session id, and extrapolates where
+they are heading, so data for the places ahead of them can be fetched before they ask for it.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from distance import EARTH_RADIUS_METERS
+
+
+class MovementTracker(object):
+    """
+    Remembers the last few fixes of each session, and predicts a session's path by extrapolating the velocity between
+    its oldest and newest recent fixes.
+
+    Attributes:
+        max_sessions (int): maximum number of sessions to remember before forgetting the least recently seen one.
+        max_fixes (int): number of fixes to remember per session.
+        max_fix_age (float): seconds before a session's newest fix that older fixes are still used for velocity.
+        min_speed (float): meters per second below which a session is treated as standing still, to ignore GPS jitter.
+        max_speed (float): meters per second above which velocity is treated as a bad fix.
+    """
+
+    def __init__(self, max_sessions=10000, max_fixes=5, max_fix_age=60.0, min_speed=0.5, max_speed=50.0):
+        """
+        Returns a MovementTracker object with class variables initialized.
+
+        :param max_sessions: optional int maximum number of sessions to remember.
+        :param max_fixes: optional int number of fixes to remember per session.
+        :param max_fix_age: optional float seconds older fixes are still used for velocity.
+        :param min_speed: optional float meters per second below which no path is predicted.
+        :param max_speed: optional float meters per second above which no path is predicted.
+        """
+        self.max_sessions = max_sessions
+        self.max_fixes = max_fixes
+        self.max_fix_age = max_fix_age
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+
+        self.predictions = 0
+        self.evictions = 0
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, session_id, lat, lng, timestamp=None):
+        """
+        Adds a fix to a session.
+
+        :param session_id: string id the client sent.
+        :param lat: float latitude of fix.
+        :param lng: float longitude of fix.
+        :param timestamp: optional float epoch seconds of fix, defaults to now.
+        :return: None
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            fixes = self._sessions.get(session_id)
+            if fixes is None:
+                fixes = self._sessions[session_id] = deque(maxlen=self.max_fixes)
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            fixes.append((timestamp, lat, lng))
+
+    def velocity(self, session_id):
+        """
+        Returns a session's velocity between its oldest and newest fixes within max_fix_age of each other.
+
+        :param session_id: string id the client sent.
+        :return: tuple of (float, float) meters per second north and east, or None if the session is unknown, standing
+            still, or moving implausibly fast
+        """
+        with self._lock:
+            fixes = list(self._sessions.get(session_id, ()))
+        if len(fixes) < 2:
+            return None
+
+        newest = fixes[-1]
+        oldest = next(fix for fix in fixes if newest[0] - fix[0] <= self.max_fix_age)
+        elapsed = newest[0] - oldest[0]
+        if elapsed <= 0:
+            return None
+
+        north = math.radians(newest[1] - oldest[1]) * EARTH_RADIUS_METERS / elapsed
+        east = (math.radians(newest[2] - oldest[2]) * EARTH_RADIUS_METERS *
+                math.cos(math.radians((newest[1] + oldest[1]) / 2.0)) / elapsed)
+        speed = math.hypot(north, east)
+        if not self.min_speed <= speed <= self.max_speed:
+            return None
+        return north, east
+
+    def predict_path(self, session_id, seconds, step_meters):
+        """
+        Returns points along a session's predicted path, starting from its newest fix.
+
+        :param session_id: string id the client sent.
+        :param seconds: float how far ahead to predict.
+        :param step_meters: float distance between returned points.
+        :return: list of (lat, lng) tuples, nearest first. empty if there is no velocity to extrapolate.
+        """
+        velocity = self.velocity(session_id)
+        if velocity is None:
+            return []
+
+        with self._lock:
+            if session_id not in self._sessions:
+                return []
+            _, lat, lng = self._sessions[session_id][-1]
+            self.predictions += 1
+
+        north, east = velocity
+        speed = math.hypot(north, east)
+        steps = int(speed * seconds // step_meters)
+        meters_per_degree_lat = math.radians(1.0) * EARTH_RADIUS_METERS
+        meters_per_degree_lng = meters_per_degree_lat * math.cos(math.radians(lat))
+
+        path = []
+        for step in range(1, steps + 1):
+            meters = step * step_meters
+            path.append((lat + north / speed * meters / meters_per_degree_lat,
+                         lng + east / speed * meters / meters_per_degree_lng))
+        return path
+
+    def stats(self):
+        """
+        Returns counters describing the tracker.
+
+        :return: dict with number of sessions, predictions made, and sessions evicted
+        """
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'predictions': self.predictions,
+                'evictions': self.evictions
+            }
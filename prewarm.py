@@ -0,0 +1,305 @@
+"""
+This module keeps cache entries for frequently visited locations fresh, refreshing them shortly before they expire so
+that requests there do not wait on upstream APIs.
+
+The warmer runs as a thread inside each web worker if PREWARM_ENABLED is set (see main.py), pausing while that worker
+is busy. It can also run as its own process, which cannot see the web workers' load directly. Set PREWARM_LOAD_URL to
+the app's /metrics endpoint to pause on the load reported there (by whichever worker answers), otherwise the process
+refreshes without pausing:
+
+From root of project, call
+python prewarm.py
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import re
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+from data_cache import DataCache
+
+# a cache entry to keep warm, with the arguments main.fetch_through_cache takes for it
+WarmJob = namedtuple('WarmJob', ['collection_name', 'lat', 'lng', 'distance_threshold', 'time_threshold',
+                                 'fetch_from_upstream', 'source_name'])
+
+_PLACES_COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[/,]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def read_places(places_path):
+    """
+    Reads coordinates from a places file with lines like '42.058331/-87.683631' or '42.047691, -87.679189'. Other
+    lines, e.g. place names, are skipped.
+
+    :param places_path: string path of places file.
+    :return: list of (lat, lng) tuples of floats
+    """
+    places = []
+    with open(places_path) as places_file:
+        for line in places_file:
+            match = _PLACES_COORDINATES.match(line)
+            if match is not None:
+                places.append((float(match.group(1)), float(match.group(2))))
+    return places
+
+
+def hot_locations(hardcoded_locations=None, places=None, campus_geometry=None):
+    """
+    Collects the locations users cluster around.
+
+    :param hardcoded_locations: optional list in the same format as Yelp's hardcoded_locations.
+    :param places: optional list of (lat, lng) tuples, e.g. from read_places.
+    :param campus_geometry: optional CampusGeometry, whose building centerpoints are included.
+    :return: list of unique (lat, lng) tuples, in the order given
+    """
+    locations = []
+    if hardcoded_locations is not None:
+        locations += [tuple(coords) for _, coords in hardcoded_locations]
+    if places is not None:
+        locations += places
+    if campus_geometry is not None:
+        locations += [building.center for building in campus_geometry.buildings]
+
+    seen = set()
+    return [location for location in locations if not (location in seen or seen.add(location))]
+
+
+def metrics_load(metrics_url, timeout=2.0):
+    """
+    Returns a load function for CacheWarmer that reads the number of requests in flight from the app's /metrics
+    endpoint.
+
+    :param metrics_url: string url of the /metrics endpoint.
+    :param timeout: optional float seconds to wait for it. a timeout counts as busy.
+    :return: function returning a number of requests in flight
+    """
+    def load():
+        try:
+            resp = requests.get(metrics_url, timeout=timeout)
+            resp.raise_for_status()
+            return resp.json()['prewarm']['in_flight_requests']
+        except requests.exceptions.Timeout:
+            return float('inf')
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print("Prewarm -- could not read load from {}: {}".format(metrics_url, e))
+            return 0
+    return load
+
+
+class TokenBucket(object):
+    """
+    Limits how often an action can happen, allowing short bursts.
+
+    Attributes:
+        rate (float): tokens added per second.
+        capacity (float): maximum number of tokens held, i.e. the largest burst.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Returns a TokenBucket object, starting full.
+
+        :param rate: float tokens added per second.
+        :param capacity: float maximum number of tokens held.
+        """
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available.
+
+        :return: float 0 if a token was taken, otherwise seconds until one will be available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class CacheWarmer(object):
+    """
+    Periodically checks a set of cache entries and refreshes those missing or about to expire, one at a time, within
+    an upstream rate limit. Refreshing pauses while the web worker is busy serving requests.
+
+    Attributes:
+        data_cache (DataCache): cache to check entries in.
+        jobs (list): WarmJob entries to keep warm.
+        refresh (function): takes (WarmJob, cached location or None) and refreshes the entry.
+        lead_minutes (float): how long before expiry to refresh an entry.
+        interval_seconds (float): how long to wait between checks of all jobs.
+        rate_limiter (TokenBucket): limits refreshes across all jobs.
+        load (function): returns the current number of requests in flight, or None to never pause.
+        max_load (int): number of requests in flight above which refreshing pauses.
+    """
+
+    def __init__(self, data_cache, jobs, refresh, lead_minutes=5.0, interval_seconds=60.0, rate_per_minute=30.0,
+                 load=None, max_load=8):
+        """
+        Returns a CacheWarmer object with class variables initialized. Call start to run it in the background.
+
+        :param data_cache: DataCache to check entries in.
+        :param jobs: list of WarmJob.
+        :param refresh: function taking (WarmJob, cached location or None) that fetches and caches data for the job.
+        :param lead_minutes: optional float minutes before expiry to refresh an entry.
+        :param interval_seconds: optional float seconds between checks of all jobs.
+        :param rate_per_minute: optional float maximum refreshes per minute, with bursts of up to as many.
+        :param load: optional function returning the number of requests in flight.
+        :param max_load: optional int number of requests in flight above which refreshing pauses.
+        """
+        self.data_cache = data_cache
+        self.jobs = jobs
+        self.refresh = refresh
+        self.lead_minutes = lead_minutes
+        self.interval_seconds = interval_seconds
+        self.rate_limiter = TokenBucket(rate_per_minute / 60.0, max(1.0, rate_per_minute))
+        self.load = load
+        self.max_load = max_load
+
+        self._stats = {'checks': 0, 'refreshes': 0, 'errors': 0, 'paused_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    def is_due(self, job):
+        """
+        Returns whether a job's cache entry is missing or expires within lead_minutes.
+
+        :param job: WarmJob
+        :return: tuple of (bool, cached location or None)
+        """
+        cached_location, valid_cache_location = self.data_cache.fetch_from_cache(job.collection_name, job.lat,
+                                                                                 job.lng, job.distance_threshold,
+                                                                                 job.time_threshold)
+        # expired entries, including negative ones past their shorter TTL, are due
+        if cached_location is None or not valid_cache_location:
+            return True, cached_location
+        return DataCache.age_in_minutes(cached_location) >= job.time_threshold - self.lead_minutes, cached_location
+
+    def _wait_for_capacity(self):
+        """
+        Blocks while the worker is under load or the rate limit is reached.
+
+        :return: bool False if stopped while waiting
+        """
+        while not self._stopped.is_set():
+            if self.load is not None and self.load() > self.max_load:
+                self._count('paused_seconds', 1.0)
+                self._stopped.wait(1.0)
+                continue
+
+            wait_seconds = self.rate_limiter.try_acquire()
+            if wait_seconds == 0:
+                return True
+            self._stopped.wait(wait_seconds)
+        return False
+
+    def run_once(self):
+        """
+        Checks every job once, refreshing those that are due.
+
+        :return: int number of entries refreshed
+        """
+        refreshed = 0
+        for job in self.jobs:
+            if self._stopped.is_set():
+                break
+
+            try:
+                self._count('checks')
+                due, cached_location = self.is_due(job)
+                if not due:
+                    continue
+                if not self._wait_for_capacity():
+                    break
+
+                print("Prewarm -- refreshing {} at {}, {}.".format(job.collection_name, job.lat, job.lng))
+                self.refresh(job, cached_location)
+                self._count('refreshes')
+                refreshed += 1
+            except Exception as e:
+                # keep warming other entries, the next check retries this one
+                self._count('errors')
+                print("Prewarm -- error refreshing {} at {}, {}: {}".format(job.collection_name, job.lat, job.lng, e))
+        return refreshed
+
+    def run(self):
+        """
+        Checks all jobs every interval_seconds until stopped.
+
+        :return: None
+        """
+        while not self._stopped.is_set():
+            self.run_once()
+            self._stopped.wait(self.interval_seconds)
+
+    def start(self):
+        """
+        Starts checking jobs on a daemon thread.
+
+        :return: None
+        """
+        self._thread = threading.Thread(target=self.run, name='cache-warmer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops checking jobs, finishing any refresh in progress.
+
+        :return: None
+        """
+        self._stopped.set()
+        self.join()
+
+    def join(self):
+        """
+        Waits for the thread started by start to finish.
+
+        :return: None
+        """
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        """
+        Returns counters describing the warmer's work.
+
+        :return: dict with number of jobs, checks, refreshes, errors, and seconds paused for load
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['jobs'] = len(self.jobs)
+        return stats
+
+
+if __name__ == '__main__':
+    import main
+
+    # importing main already starts the warmer if PREWARM_ENABLED is set
+    print("Prewarm -- keeping {} cache entries warm.".format(len(main.CACHE_WARMER.jobs)))
+    if main.PREWARM_ENABLED:
+        main.CACHE_WARMER.join()
+    else:
+        # this process serves no requests, so its own in-flight count is always 0
+        if main.PREWARM_LOAD_URL is not None:
+            main.CACHE_WARMER.load = metrics_load(main.PREWARM_LOAD_URL)
+        else:
+            main.CACHE_WARMER.load = None
+            print("Prewarm -- PREWARM_LOAD_URL not specified, refreshing without pausing for load.")
+        main.CACHE_WARMER.run()
@@ -0,0 +1,99 @@
+"""
+This module coalesces concurrent calls for the same key so that only one of them does the work.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import threading
+
+
+class _Call(object):
+    """
+    A call in flight, shared by the caller doing the work and any callers waiting on it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time within this process. Callers arriving while a call for their key is in
+    flight wait for it and share its result (or exception) instead of repeating the work.
+
+    Attributes:
+        calls (int): number of calls that did the work.
+        coalesced (int): number of calls that waited on another call's result instead.
+    """
+
+    def __init__(self):
+        """
+        Returns a SingleFlight object with class variables initialized.
+        """
+        self.calls = 0
+        self.coalesced = 0
+
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs), unless a call for key is already in flight, in which case waits for its result.
+
+        :param key: hashable key identifying the work, e.g. collection name plus location cell.
+        :param fn: function to call.
+        :return: tuple of (result, bool) where bool is whether the result was shared from another caller.
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._in_flight[key] = call
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self, key):
+        """
+        Returns whether a call for key is currently in flight.
+
+        :param key: hashable key identifying the work.
+        :return: bool
+        """
+        with self._lock:
+            return key in self._in_flight
+
+    def stats(self):
+        """
+        Returns counters describing how many calls were coalesced.
+
+        :return: dict with calls, coalesced, and currently in flight counts.
+        """
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._in_flight)
+            }
@@ -0,0 +1,190 @@
+"""
+This module computes sunrise and sunset times locally, using NOAA's solar position equations
+(https://gml.noaa.gov/grad/solcalc/calcdetails.html), so they do not need to be fetched from sunrise-sunset.org.
+Times are accurate to about a minute between the polar circles.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import datetime
+import math
+import threading
+from collections import OrderedDict
+
+# same format as sunrise-sunset.org with formatted=0
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'
+
+# sun's center 0.833 degrees below the horizon at sunrise/sunset, for refraction and the sun's radius
+SUNRISE_ZENITH = 90.833
+
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+_JULIAN_DAY_UNIX_EPOCH = 2440587.5
+
+
+def _sun_position(julian_day):
+    """
+    Returns the sun's declination and the equation of time at a moment.
+
+    :param julian_day: float Julian day of the moment.
+    :return: tuple of (float declination in degrees, float equation of time in minutes)
+    """
+    t = (julian_day - 2451545.0) / 36525.0  # Julian centuries since J2000
+
+    mean_longitude = (280.46646 + t * (36000.76983 + t * 0.0003032)) % 360
+    mean_anomaly = 357.52911 + t * (35999.05029 - 0.0001537 * t)
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+
+    m = math.radians(mean_anomaly)
+    center = (math.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t)) +
+              math.sin(2 * m) * (0.019993 - 0.000101 * t) +
+              math.sin(3 * m) * 0.000289)
+
+    omega = math.radians(125.04 - 1934.136 * t)
+    apparent_longitude = mean_longitude + center - 0.00569 - 0.00478 * math.sin(omega)
+    mean_obliquity = 23 + (26 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60) / 60
+    obliquity = math.radians(mean_obliquity + 0.00256 * math.cos(omega))
+
+    declination = math.degrees(math.asin(math.sin(obliquity) * math.sin(math.radians(apparent_longitude))))
+
+    y = math.tan(obliquity / 2) ** 2
+    l0 = math.radians(mean_longitude)
+    equation_of_time = 4 * math.degrees(y * math.sin(2 * l0) -
+                                        2 * eccentricity * math.sin(m) +
+                                        4 * eccentricity * y * math.sin(m) * math.cos(2 * l0) -
+                                        0.5 * y * y * math.sin(4 * l0) -
+                                        1.25 * eccentricity * eccentricity * math.sin(2 * m))
+    return declination, equation_of_time
+
+
+def _event_minutes(lat, lng, julian_day, direction):
+    """
+    Returns when the sun crosses the horizon (or its highest point, for direction 0), in minutes after 00:00 UTC.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param julian_day: float Julian day of 00:00 UTC on the date.
+    :param direction: -1 for sunrise, 1 for sunset, 0 for solar noon.
+    :return: float minutes after 00:00 UTC, or None if the sun does not rise or set on the date.
+    """
+    # start from noon at the location, then recompute at the estimated time of the event
+    minutes = 720 - 4 * lng
+    for _ in range(2):
+        declination, equation_of_time = _sun_position(julian_day + minutes / 1440.0)
+
+        hour_angle = 0.0
+        if direction != 0:
+            cos_hour_angle = (math.cos(math.radians(SUNRISE_ZENITH)) /
+                              (math.cos(math.radians(lat)) * math.cos(math.radians(declination))) -
+                              math.tan(math.radians(lat)) * math.tan(math.radians(declination)))
+            if not -1.0 <= cos_hour_angle <= 1.0:
+                return None
+            hour_angle = math.degrees(math.acos(cos_hour_angle))
+
+        minutes = 720 - 4 * lng - equation_of_time + direction * 4 * hour_angle
+    return minutes
+
+
+def sunrise_sunset(lat, lng, date):
+    """
+    Computes sunrise, sunset, and solar noon at a location on a date.
+
+    :param lat: float latitude of location.
+    :param lng: float longitude of location.
+    :param date: date to compute for, in the location's local time.
+    :return: dict with 'sunrise', 'sunset', and 'solar_noon' UTC times formatted like sunrise-sunset.org, and
+        'day_length' in seconds. None if the sun does not rise or set on the date (polar day or night).
+    """
+    midnight = datetime.datetime(date.year, date.month, date.day)
+    julian_day = (midnight - _UNIX_EPOCH).total_seconds() / 86400.0 + _JULIAN_DAY_UNIX_EPOCH
+
+    sunrise_minutes = _event_minutes(lat, lng, julian_day, -1)
+    sunset_minutes = _event_minutes(lat, lng, julian_day, 1)
+    if sunrise_minutes is None or sunset_minutes is None:
+        return None
+    solar_noon_minutes = _event_minutes(lat, lng, julian_day, 0)
+
+    def at(minutes):
+        return (midnight + datetime.timedelta(minutes=minutes)).strftime(TIME_FORMAT)
+
+    return {
+        'sunrise': at(sunrise_minutes),
+        'sunset': at(sunset_minutes),
+        'solar_noon': at(solar_noon_minutes),
+        'day_length': int(round((sunset_minutes - sunrise_minutes) * 60))
+    }
+
+
+class SolarCalculator(object):
+    """
+    Computes sunrise and sunset with sunrise_sunset, memoizing results per quantized lat/lng cell and local date.
+    Results are computed at the cell's center, which moves them by a few seconds at most for 0.01 degree cells.
+
+    Attributes:
+        cell_size (float): size of a cache cell, in degrees. 0.01 degrees is roughly 1 kilometer.
+        max_entries (int): maximum number of (cell, date) results to remember before evicting the least recently
+            used one.
+        hits (int): number of lookups answered from the cache.
+        misses (int): number of lookups that were computed.
+        evictions (int): number of results evicted from the cache.
+    """
+
+    def __init__(self, cell_size=0.01, max_entries=4096):
+        """
+        Returns a SolarCalculator object with class variables initialized.
+
+        :param cell_size: optional float size of a cache cell, in degrees.
+        :param max_entries: optional int maximum number of results to keep in the cache.
+        """
+        self.cell_size = cell_size
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sunrise_sunset_at(self, lat, lng, date):
+        """
+        Returns sunrise and sunset at a location on a date, as sunrise_sunset does.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :param date: date to compute for, in the location's local time.
+        :return: dict as returned by sunrise_sunset, or None during polar day or night. callers may modify it.
+        """
+        row, col = int(lat // self.cell_size), int(lng // self.cell_size)
+        key = (row, col, date)
+
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                result = self._results[key]
+                return dict(result) if result is not None else None
+            self.misses += 1
+
+        result = sunrise_sunset((row + 0.5) * self.cell_size, (col + 0.5) * self.cell_size, date)
+
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+        return dict(result) if result is not None else None
+
+    def stats(self):
+        """
+        Returns counters describing cache effectiveness.
+
+        :return: dict with hits, misses, evictions and size of the cache.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._results)
+            }
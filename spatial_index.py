@@ -0,0 +1,97 @@
+"""
+This module is a uniform grid index over points, used to find the points near a location without scanning them all.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import math
+
+import distance
+from geo_cells import METERS_PER_DEGREE_LAT, MIN_METERS_PER_DEGREE_LAT
+
+
+class GridIndex(object):
+    """
+    Buckets points into square cells of cell_size degrees. A radius query only looks at the cells overlapping the
+    query's bounding box, checks candidates against the box, and computes distance for the few left.
+
+    Attributes:
+        cell_size (float): size of a grid cell, in degrees.
+        cells (dict): (row, col) tuple to list of (lat, lng, item) tuples in that cell.
+    """
+
+    def __init__(self, cell_size_meters=100.0):
+        """
+        Returns a GridIndex object with class variables initialized.
+
+        :param cell_size_meters: optional float size of a grid cell, in meters of latitude.
+        """
+        self.cell_size = cell_size_meters / METERS_PER_DEGREE_LAT
+        self.cells = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _cell_for(self, lat, lng):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size))
+
+    def insert(self, lat, lng, item):
+        """
+        Adds a point to the index.
+
+        :param lat: float latitude of point.
+        :param lng: float longitude of point.
+        :param item: object to return for this point in query results.
+        :return: None
+        """
+        self.cells.setdefault(self._cell_for(lat, lng), []).append((lat, lng, item))
+        self._size += 1
+
+    def candidates(self, lat, lng, radius):
+        """
+        Returns points inside the bounding box of a circle, a superset of the points within radius.
+
+        :param lat: float latitude of circle center.
+        :param lng: float longitude of circle center.
+        :param radius: float radius of circle, in meters.
+        :return: list of (lat, lng, item) tuples.
+        """
+        lat_delta = radius / MIN_METERS_PER_DEGREE_LAT
+        lng_delta = lat_delta / max(math.cos(math.radians(min(abs(lat) + lat_delta, 90.0))), 1e-6)
+
+        min_row, min_col = self._cell_for(lat - lat_delta, lng - lng_delta)
+        max_row, max_col = self._cell_for(lat + lat_delta, lng + lng_delta)
+
+        # for very large radii, scanning occupied cells is cheaper than visiting every cell in range
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            cell_points = [points for (row, col), points in self.cells.items()
+                           if min_row <= row <= max_row and min_col <= col <= max_col]
+        else:
+            cell_points = [self.cells[(row, col)]
+                           for row in range(min_row, max_row + 1)
+                           for col in range(min_col, max_col + 1)
+                           if (row, col) in self.cells]
+
+        return [(point_lat, point_lng, item)
+                for points in cell_points
+                for point_lat, point_lng, item in points
+                if abs(point_lat - lat) <= lat_delta and abs(point_lng - lng) <= lng_delta]
+
+    def within(self, lat, lng, radius):
+        """
+        Returns points strictly closer than radius to a location, with their distance.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :param radius: float radius, in meters.
+        :return: list of (item, float distance in meters) tuples.
+        """
+        candidates = self.candidates(lat, lng, radius)
+        if not candidates:
+            return []
+
+        dists = distance.distance_many(lat, lng,
+                                       [point_lat for point_lat, _, _ in candidates],
+                                       [point_lng for _, point_lng, _ in candidates])
+        return [(item, float(dist)) for (_, _, item), dist in zip(candidates, dists) if dist < radius]
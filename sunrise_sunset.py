@@ -6,30 +6,48 @@ from __future__ import absolute_import
 
 import requests
 
+from http_client import PooledSession
+
 
 class SunriseSunset(object):
     """
     Manages queries to the sunrise sunset API (https://sunrise-sunset.org/api) and computes
     additional time-based affordances on top of this information.
+
+    Attributes:
+        session (PooledSession): keep-alive session used for all requests to sunrise-sunset.org.
     """
 
-    def __init__(self):
+    def __init__(self, session=None):
         """
         Returns a SunriseSunset object with class variables initialized.
+
+        :param session: optional PooledSession to send requests with. one is created if not provided.
         """
-        pass
+        # setup pooled session
+        if session is None:
+            session = PooledSession('sunrise-sunset')
+
+        self.session = session
 
-    def get_sunrise_sunset_at_location(self, lat, lng):
+    def get_sunrise_sunset_at_location(self, lat, lng, date=None):
         """
         Makes a request to the weather API for the weather at the current location.
 
         :param lat: float latitude to center request around.
         :param lng: float longitude to center request around.
+        :param date: optional date to get sunrise and sunset for. defaults to today.
         :return: JSON response "results" object from sunrise sunset API for today's sunrise and sunset at current location
         """
         # make request
         url = f'https://api.sunrise-sunset.org/json?lat={lat}&lng={lng}&formatted=0'
-        resp = requests.get(url)
+        if date is not None:
+            url += f'&date={date.isoformat()}'
+        try:
+            resp = self.session.get(url)
+        except requests.exceptions.RequestException as e:
+            print('Sunrise Sunset API -- request failed: {}'.format(e))
+            return None
 
         # return if request is valid
         if resp.status_code == requests.codes.ok:
@@ -0,0 +1,80 @@
+"""From root of project, call
+python -m unittest test_batch_score
+"""
+import datetime
+import io
+import unittest
+from unittest import mock
+
+from pytz import utc
+
+import batch_score
+from batch_score import parse_timestamp, read_rows, group_by_cell, score_rows
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+class TestBatchScore(unittest.TestCase):
+
+    def test_parse_timestamp(self):
+        expected = datetime.datetime(2019, 3, 2, 23, 6, tzinfo=utc)
+        self.assertEqual(parse_timestamp(1551567960), expected)
+        self.assertEqual(parse_timestamp('1551567960'), expected)
+        self.assertEqual(parse_timestamp('2019-03-02T23:06:00Z'), expected)
+        self.assertEqual(parse_timestamp('2019-03-02T17:06:00-06:00'), expected)
+        self.assertEqual(parse_timestamp('2019-03-02 23:06:00'), expected)
+
+    def test_read_rows(self):
+        csv_file = io.StringIO('lat,lng,timestamp\n42.05,-87.68,1551567960\n42.06,-87.67,\n')
+        self.assertEqual(list(read_rows(csv_file, 'csv')),
+                         [(0, 42.05, -87.68, '1551567960'), (1, 42.06, -87.67, '')])
+
+        jsonl_file = io.StringIO('{"lat": 42.05, "lng": -87.68, "timestamp": 1551567960}\n\n'
+                                 '{"lat": 42.06, "lng": -87.67}\n')
+        self.assertEqual(list(read_rows(jsonl_file, 'jsonl')),
+                         [(0, 42.05, -87.68, 1551567960), (1, 42.06, -87.67, None)])
+
+    def test_group_by_cell(self):
+        rows = [(0, BAT17['lat'], BAT17['lng'], None),
+                (1, 41.8781, -87.6298, None),
+                (2, BAT17['lat'] + 0.00001, BAT17['lng'], None)]
+        groups = sorted(group_by_cell(rows, 1000.0), key=len)
+        self.assertEqual([[row[0] for row in group] for group in groups], [[1], [0, 2]])
+
+    def test_read_rows_reports_malformed_rows(self):
+        errors = []
+        jsonl_file = io.StringIO('{"lat": 42.05, "lng": -87.68}\n{"lat": "x", "lng": -87.68}\nnot json\n'
+                                 '{"lng": -87.68}\n{"lat": 42.06, "lng": -87.67}\n')
+        rows = list(read_rows(jsonl_file, 'jsonl', on_error=lambda row_number, e: errors.append(row_number)))
+        self.assertEqual(rows, [(0, 42.05, -87.68, None), (4, 42.06, -87.67, None)])
+        self.assertEqual(errors, [1, 2, 3])
+
+        with self.assertRaises(ValueError):
+            list(read_rows(io.StringIO('{"lat": "x", "lng": -87.68}\n'), 'jsonl'))
+
+    def test_score_rows_fetches_once_per_group_and_continues_past_errors(self):
+        fake_main = mock.Mock(YELP_CACHE_DISTANCE_THRESHOLD=10.0)
+        fake_main.fetch_conditions_data.return_value = {'weather': {}, 'sunrise_sunset': {}, 'yelp': None,
+                                                        'stale_sources': [], 'missing_sources': []}
+        fake_main.needs_yelp.return_value = True
+        fake_main.get_categories_for_location.side_effect = [({}, {}), RuntimeError('Yelp down')]
+        fake_main.format_conditions_as_keyvalues.return_value = {'hour': 17}
+
+        rows = [(0, BAT17['lat'], BAT17['lng'], '1551567960'),
+                (1, BAT17['lat'], BAT17['lng'], 'not a timestamp'),
+                (2, BAT17['lat'] + 0.00001, BAT17['lng'], '1551567960'),
+                (3, BAT17['lat'] + 0.001, BAT17['lng'], '1551567960')]
+        with mock.patch.object(batch_score, 'main', fake_main):
+            scored = score_rows((rows, 'row'))
+
+        self.assertEqual([result['row'] for result in scored], [0, 1, 2, 3])
+        self.assertEqual([('error' in result) for result in scored], [False, True, False, True])
+        self.assertEqual(scored[3]['error'], 'RuntimeError: Yelp down')
+
+        # rows 0 and 2 share a Yelp cell, row 3 is 110 meters away
+        fake_main.fetch_conditions_data.assert_called_once_with(BAT17['lat'], BAT17['lng'], include_yelp=False)
+        self.assertEqual(fake_main.get_categories_for_location.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""From root of project, call
+python -m unittest test_business_store
+
+Must run local mongod instance, i.e.
+mongod --config /usr/local/etc/mongod.conf
+"""
+import unittest
+
+from pymongo import MongoClient
+
+from business_store import BusinessStore
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+def business(business_id, lat, lng, categories):
+    return {'id': business_id, 'alias': business_id, 'categories': [{'alias': c} for c in categories],
+            'coordinates': {'latitude': lat, 'longitude': lng}}
+
+
+class TestBusinessStore(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MongoClient()['affordance-aware-test']
+        self.db.drop_collection('YelpBusinesses')
+        self.db.drop_collection('YelpCoverage')
+        self.store = BusinessStore(self.db, fetch_radius=250.0)
+        self.wide_fetches = []
+
+    def fetch_wide(self, lat, lng, radius):
+        self.wide_fetches.append((lat, lng, radius))
+        return [business('bat-17-evanston', BAT17['lat'], BAT17['lng'], ['sandwiches']),
+                business('far-away', BAT17['lat'] + 0.002, BAT17['lng'], ['parks']),
+                business('no-coordinates', None, None, ['bars'])], radius
+
+    def test_one_wide_fetch_answers_nearby_queries(self):
+        self.assertTrue(self.store.ensure_covered(BAT17['lat'], BAT17['lng'], 30, self.fetch_wide))
+        self.assertTrue(self.store.ensure_covered(BAT17['lat'] + 0.0005, BAT17['lng'], 30, self.fetch_wide))
+        self.assertEqual(len(self.wide_fetches), 1)
+
+        # about 55 meters north, bat 17 is out of a 30 meter query but in a 60 meter one
+        self.assertEqual(self.store.within(BAT17['lat'] + 0.0005, BAT17['lng'], 30), [])
+        nearby = self.store.within(BAT17['lat'] + 0.0005, BAT17['lng'], 60)
+        self.assertEqual([b['alias'] for b, _ in nearby], ['bat-17-evanston'])
+        self.assertAlmostEqual(nearby[0][1], 55.6, delta=1.0)
+
+    def test_query_outside_coverage_fetches_again(self):
+        self.store.ensure_covered(BAT17['lat'], BAT17['lng'], 30, self.fetch_wide)
+        self.assertFalse(self.store.covers(BAT17['lat'] + 0.003, BAT17['lng'], 30))
+        self.store.ensure_covered(BAT17['lat'] + 0.003, BAT17['lng'], 30, self.fetch_wide)
+        self.assertEqual(len(self.wide_fetches), 2)
+
+    def test_truncated_fill_leaves_query_uncovered(self):
+        def fetch_dense(lat, lng, radius):
+            self.wide_fetches.append((lat, lng, radius))
+            return [business('bat-17-evanston', BAT17['lat'], BAT17['lng'], ['sandwiches'])], 20.0
+
+        # the wide search only covers 20 meters, less than the 30 meter query
+        self.assertFalse(self.store.ensure_covered(BAT17['lat'], BAT17['lng'], 30, fetch_dense))
+        self.assertTrue(self.store.ensure_covered(BAT17['lat'], BAT17['lng'], 10, fetch_dense))
+
+        # nearby misses are left to narrow searches instead of repeating the wide one
+        self.assertFalse(self.store.ensure_covered(BAT17['lat'] + 0.0005, BAT17['lng'], 30, fetch_dense))
+        self.assertEqual(len(self.wide_fetches), 1)
+        self.assertEqual(self.store.stats()['uncovered_queries'], 2)
+
+    def test_upsert_skips_businesses_without_coordinates(self):
+        self.assertEqual(self.store.upsert(self.fetch_wide(BAT17['lat'], BAT17['lng'], 250)[0]), 2)
+        self.assertEqual(self.store.upsert(self.fetch_wide(BAT17['lat'], BAT17['lng'], 250)[0]), 2)
+        self.assertEqual(self.db['YelpBusinesses'].count_documents({}), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
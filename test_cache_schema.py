@@ -0,0 +1,69 @@
+"""From root of project, call
+python -m unittest test_cache_schema
+"""
+import datetime
+import unittest
+from unittest import mock
+
+import cache_schema
+import main
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+SUNSET = datetime.datetime(2019, 3, 2, 23, 40, tzinfo=datetime.timezone.utc)
+SUNSET_EPOCH = int(SUNSET.timestamp())
+WEATHER_RESP = {'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky'}], 'main': {'temp': 270.1}}
+FORECAST_RESP = {'list': [{'dt': SUNSET_EPOCH - 4 * 60 * 60 + 3 * 60 * 60 * i,
+                           'main': {'temp': 270.1},
+                           'weather': [{'main': ['Clouds', 'Snow', 'Clear'][i % 3]}]} for i in range(40)]}
+SUNRISE_SUNSET_RESP = {'sunrise': '2019-03-02T12:25:00+00:00', 'sunset': '2019-03-02T23:40:00+00:00',
+                       'solar_noon': '2019-03-02T18:02:30+00:00', 'day_length': 40500}
+
+
+class TestCacheSchema(unittest.TestCase):
+
+    def test_compact_documents(self):
+        self.assertEqual(cache_schema.compact_weather(WEATHER_RESP), {'schema': 2, 'weather_main': ['Clear']})
+        self.assertEqual(cache_schema.compact_weather([]), {'schema': 2, 'weather_main': []})
+
+        compact_forecast = cache_schema.compact_forecast(FORECAST_RESP)
+        self.assertEqual(compact_forecast['forecast_dt'], [prediction['dt'] for prediction in FORECAST_RESP['list']])
+        self.assertEqual(compact_forecast['forecast_main'][:3], ['Clouds', 'Snow', 'Clear'])
+        self.assertIsNone(cache_schema.compact_forecast(None)['forecast_dt'])
+
+        self.assertEqual(cache_schema.compact_sunrise_sunset(SUNRISE_SUNSET_RESP),
+                         {'schema': 2, 'sunrise': SUNSET_EPOCH - 40500, 'sunset': SUNSET_EPOCH})
+        self.assertEqual(cache_schema.compact_sunrise_sunset(None), {})
+
+    def test_readers_accept_both_formats(self):
+        raw = {'weather': WEATHER_RESP, 'forecast': FORECAST_RESP}
+        compact = dict(cache_schema.compact_weather(WEATHER_RESP), **cache_schema.compact_forecast(FORECAST_RESP))
+        self.assertEqual(cache_schema.weather_main(raw), cache_schema.weather_main(compact))
+        self.assertEqual(cache_schema.forecast_series(raw), cache_schema.forecast_series(compact))
+        self.assertIsNone(cache_schema.forecast_series({'forecast': []}))
+
+        self.assertEqual(cache_schema.sunrise_sunset_epochs(SUNRISE_SUNSET_RESP),
+                         cache_schema.sunrise_sunset_epochs(cache_schema.compact_sunrise_sunset(SUNRISE_SUNSET_RESP)))
+        self.assertIsNone(cache_schema.sunrise_sunset_epochs({}))
+
+    def test_compute_weather_time_affordances_matches_for_both_formats(self):
+        raw_weather = {'weather': WEATHER_RESP, 'forecast': FORECAST_RESP, 'timezone': 'America/Chicago'}
+        compact_weather = main.combine_weather_forecast(
+            dict(cache_schema.compact_weather(WEATHER_RESP), timezone='America/Chicago'),
+            cache_schema.compact_forecast(FORECAST_RESP))
+        compact_sunrise_sunset = cache_schema.compact_sunrise_sunset(SUNRISE_SUNSET_RESP)
+
+        as_of = SUNSET - datetime.timedelta(minutes=10)
+        with mock.patch.object(main, 'SUNRISE_SUNSET_SOURCE', 'api'):
+            raw_output = main.compute_weather_time_affordances(BAT17['lat'], BAT17['lng'], raw_weather,
+                                                               SUNRISE_SUNSET_RESP, as_of=as_of)
+            compact_output = main.compute_weather_time_affordances(BAT17['lat'], BAT17['lng'], compact_weather,
+                                                                   compact_sunrise_sunset, as_of=as_of)
+        self.assertEqual(raw_output, compact_output)
+        self.assertEqual(compact_output[1]['sunset_predicted_weather'], 'snow')
+        self.assertEqual(compact_output[1]['sunset_time_minutes'], 40)
+        self.assertTrue(compact_output[1]['Clear'])
+
+
+if __name__ == '__main__':
+    unittest.main()
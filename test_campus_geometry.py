@@ -0,0 +1,39 @@
+"""From root of project, call
+python -m unittest test_campus_geometry
+"""
+import unittest
+
+from campus_geometry import CampusGeometry
+from campus_locations import campus_buildings
+
+CAMPUS_GEOMETRY = CampusGeometry(campus_buildings)
+BLOMQUIST = {'lat': 42.0542930959171, 'lng': -87.6782216341711}
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+class TestCampusGeometry(unittest.TestCase):
+
+    def test_all_buildings_parsed(self):
+        self.assertEqual(len(CAMPUS_GEOMETRY.buildings), len(campus_buildings))
+        for building in CAMPUS_GEOMETRY.buildings:
+            self.assertEqual(len(building.lats), len(building.lngs))
+            self.assertGreaterEqual(len(building.lats), 4)
+
+    def test_containing(self):
+        buildings = CAMPUS_GEOMETRY.containing(BLOMQUIST['lat'], BLOMQUIST['lng'])
+        self.assertEqual([building.name for building in buildings], ['blomquist_recreation_center'])
+        self.assertEqual(CAMPUS_GEOMETRY.containing(BAT17['lat'], BAT17['lng']), [])
+
+    def test_nearest(self):
+        # just west of Blomquist's west wall
+        results = CAMPUS_GEOMETRY.nearest(42.0543, -87.6785, 20.0)
+        self.assertEqual(results[0][0].name, 'blomquist_recreation_center')
+        self.assertGreater(results[0][1], 0.0)
+        self.assertLess(results[0][1], 20.0)
+        self.assertEqual(CAMPUS_GEOMETRY.nearest(BAT17['lat'], BAT17['lng'], 20.0), [])
+
+    def test_place_categories_dict(self):
+        place_categories_dict = CAMPUS_GEOMETRY.place_categories_dict(BLOMQUIST['lat'], BLOMQUIST['lng'])
+        self.assertEqual(place_categories_dict, {
+            'blomquist_recreation_center': {'categories': ['gym'], 'distance': 0.0}
+        })
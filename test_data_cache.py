@@ -0,0 +1,145 @@
+"""From root of project, call
+python -m unittest test_data_cache
+"""
+import datetime
+import unittest
+from unittest import mock
+
+from pymongo.errors import OperationFailure
+
+from data_cache import DataCache
+from geo_cells import tile_id, tile_center
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.data_cache = DataCache(None, 'affordance-aware-test', l1_max_entries=0)
+        self.collection = mock.MagicMock()
+        self.data_cache.db = {'LocationCache': self.collection}
+
+    def test_ensure_indexes_never_drops_planar_index(self):
+        self.collection.index_information.return_value = {'_id_': {}, 'location_2d': {}}
+        self.data_cache.ensure_indexes('LocationCache')
+        self.data_cache.ensure_indexes('LocationCache')
+
+        self.collection.create_index.assert_called_once()
+        self.collection.drop_index.assert_not_called()
+
+    def test_migrate_indexes_drops_planar_index(self):
+        self.collection.index_information.return_value = {'_id_': {}, 'location_2d': {}}
+        self.assertTrue(self.data_cache.migrate_indexes('LocationCache'))
+        self.collection.drop_index.assert_called_once_with('location_2d')
+
+        self.collection.index_information.return_value = {'_id_': {}, 'location_2dsphere': {}}
+        self.assertFalse(self.data_cache.migrate_indexes('LocationCache'))
+        self.assertEqual(self.collection.drop_index.call_count, 1)
+
+    def test_lookup_falls_back_while_both_indexes_exist(self):
+        near = {'_id': 'near', 'location': [BAT17['lng'], BAT17['lat'] + 0.00003], 'data': {},
+                'date': datetime.datetime.utcnow()}
+        far = {'_id': 'far', 'location': [BAT17['lng'], BAT17['lat'] + 0.00008], 'data': {},
+               'date': datetime.datetime.utcnow()}
+        self.collection.aggregate.side_effect = OperationFailure('more than one 2d index')
+        self.collection.find.return_value = [far, near]
+
+        cached_loc, valid = self.data_cache.fetch_from_cache('LocationCache', BAT17['lat'], BAT17['lng'], 10.0, 10080)
+
+        self.assertTrue(valid)
+        self.assertEqual(cached_loc['_id'], 'near')
+        self.assertNotIn('distance', cached_loc)
+
+
+class TestTileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.data_cache = DataCache(None, 'affordance-aware-test', l1_max_entries=0,
+                                    tile_sizes={'WeatherCache': 1000.0})
+        self.tiles = {}
+        self.collection = mock.MagicMock()
+        self.collection.replace_one.side_effect = lambda query, doc, upsert: self.tiles.__setitem__(query['_id'],
+                                                                                                 dict(doc))
+        self.collection.find_one.side_effect = lambda query: self.tiles.get(query['_id'])
+        self.collection.find.side_effect = lambda query: [self.tiles[tile] for tile in query['_id']['$in']
+                                                          if tile in self.tiles]
+        self.data_cache.db = {'WeatherCache': self.collection}
+
+        # a point in the same 1 km tile as BAT17, and one in the next tile north
+        self.tile = tile_id(BAT17['lat'], BAT17['lng'], 1000.0)
+        self.tile_lat, self.tile_lng = tile_center(self.tile)
+        self.same_tile = (self.tile_lat + 0.003, self.tile_lng - 0.004)
+        self.next_tile = (self.tile_lat + 0.01, self.tile_lng)
+        self.assertEqual(tile_id(self.same_tile[0], self.same_tile[1], 1000.0), self.tile)
+        self.assertNotEqual(tile_id(self.next_tile[0], self.next_tile[1], 1000.0), self.tile)
+
+    def age(self, tile, minutes):
+        self.tiles[tile]['date'] = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes)
+
+    def test_add_upserts_one_document_per_tile(self):
+        first_id = self.data_cache.add_to_cache('WeatherCache', BAT17['lat'], BAT17['lng'], {'temp': 1})
+        second_id = self.data_cache.add_to_cache('WeatherCache', self.same_tile[0], self.same_tile[1], {'temp': 2})
+
+        self.assertEqual(first_id, self.tile)
+        self.assertEqual(second_id, self.tile)
+        self.collection.insert_one.assert_not_called()
+        for call in self.collection.replace_one.call_args_list:
+            self.assertEqual(call[0][0], {'_id': self.tile})
+            self.assertTrue(call[1]['upsert'])
+
+        # the later write wins, stored at the tile center rather than the requested point
+        self.assertEqual(list(self.tiles), [self.tile])
+        self.assertEqual(self.tiles[self.tile]['data'], {'temp': 2})
+        self.assertEqual(self.tiles[self.tile]['location'], [self.tile_lng, self.tile_lat])
+        self.assertFalse(self.tiles[self.tile]['negative'])
+
+    def test_lookup_finds_tile_containing_point(self):
+        self.data_cache.add_to_cache('WeatherCache', BAT17['lat'], BAT17['lng'], {'temp': 1})
+
+        cached_tile, valid = self.data_cache.fetch_from_cache('WeatherCache', self.same_tile[0], self.same_tile[1],
+                                                              1000.0, 30)
+        self.assertTrue(valid)
+        self.assertEqual(cached_tile['data'], {'temp': 1})
+        self.collection.find_one.assert_called_with({'_id': self.tile})
+
+        cached_tile, valid = self.data_cache.fetch_from_cache('WeatherCache', self.next_tile[0], self.next_tile[1],
+                                                              1000.0, 30)
+        self.assertIsNone(cached_tile)
+        self.assertFalse(valid)
+        self.collection.aggregate.assert_not_called()
+
+        stats = self.data_cache.stats()['l2']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_lookup_returns_expired_tile_as_invalid(self):
+        self.data_cache.add_to_cache('WeatherCache', BAT17['lat'], BAT17['lng'], {'temp': 1})
+        self.age(self.tile, 31)
+
+        cached_tile, valid = self.data_cache.fetch_from_cache('WeatherCache', BAT17['lat'], BAT17['lng'], 1000.0, 30)
+
+        # expired tiles are still returned, so callers can serve them as stale
+        self.assertEqual(cached_tile['data'], {'temp': 1})
+        self.assertFalse(valid)
+        self.assertEqual(self.data_cache.stats()['l2']['expired'], 1)
+
+    def test_fetch_many_looks_up_each_tile_once(self):
+        self.data_cache.add_to_cache('WeatherCache', BAT17['lat'], BAT17['lng'], {'temp': 1})
+        far_tile = self.data_cache.add_to_cache('WeatherCache', self.tile_lat + 0.02, self.tile_lng, {'temp': 2})
+        self.age(far_tile, 31)
+
+        results = self.data_cache.fetch_many_from_cache('WeatherCache', [
+            (BAT17['lat'], BAT17['lng']), self.next_tile, self.same_tile, (self.tile_lat + 0.02, self.tile_lng)
+        ], 1000.0, 30)
+
+        self.assertEqual([(cached_tile and cached_tile['data'], valid) for cached_tile, valid in results],
+                         [({'temp': 1}, True), (None, False), ({'temp': 1}, True), ({'temp': 2}, False)])
+        self.collection.find.assert_called_once()
+        self.assertEqual(len(self.collection.find.call_args[0][0]['_id']['$in']), 3)
+
+        stats = self.data_cache.stats()['l2']
+        self.assertEqual((stats['hits'], stats['expired'], stats['misses']), (1, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
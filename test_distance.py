@@ -0,0 +1,59 @@
+"""From root of project, call
+python -m unittest test_distance
+"""
+import random
+import unittest
+
+import distance
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+class TestDistance(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(0)
+        self.lats = [BAT17['lat'] + rand.uniform(-0.05, 0.05) for _ in range(200)]
+        self.lngs = [BAT17['lng'] + rand.uniform(-0.05, 0.05) for _ in range(200)]
+
+    def tearDown(self):
+        distance.set_backend('haversine')
+
+    def test_fast_kernels_within_error_bounds(self):
+        for lat, lng in zip(self.lats, self.lngs):
+            exact = distance.geodesic_distance(BAT17['lat'], BAT17['lng'], lat, lng)
+            haversine = distance.haversine(BAT17['lat'], BAT17['lng'], lat, lng)
+            equirectangular = distance.equirectangular(BAT17['lat'], BAT17['lng'], lat, lng)
+            self.assertLess(abs(haversine - exact), exact * 0.005 + 1e-6)
+            self.assertLess(abs(equirectangular - haversine), haversine * 0.0001 + 1e-6)
+
+    def test_batched_kernels_match_scalar(self):
+        for scalar, batched in [(distance.haversine, distance.haversine_many),
+                                (distance.equirectangular, distance.equirectangular_many),
+                                (distance.geodesic_distance, distance.geodesic_many)]:
+            dists = batched(BAT17['lat'], BAT17['lng'], self.lats, self.lngs)
+            self.assertEqual(len(dists), len(self.lats))
+            for dist, lat, lng in zip(dists, self.lats, self.lngs):
+                self.assertAlmostEqual(dist, scalar(BAT17['lat'], BAT17['lng'], lat, lng), places=6)
+
+    def test_zero_distance(self):
+        self.assertEqual(distance.haversine(BAT17['lat'], BAT17['lng'], BAT17['lat'], BAT17['lng']), 0.0)
+        self.assertEqual(distance.equirectangular(BAT17['lat'], BAT17['lng'], BAT17['lat'], BAT17['lng']), 0.0)
+
+    def test_set_backend(self):
+        distance.set_backend('geodesic')
+        self.assertEqual(distance.get_backend(), 'geodesic')
+        self.assertEqual(distance.distance(BAT17['lat'], BAT17['lng'], self.lats[0], self.lngs[0]),
+                         distance.geodesic_distance(BAT17['lat'], BAT17['lng'], self.lats[0], self.lngs[0]))
+
+        distance.set_backend('equirectangular')
+        self.assertEqual(distance.distance(BAT17['lat'], BAT17['lng'], self.lats[0], self.lngs[0]),
+                         distance.equirectangular(BAT17['lat'], BAT17['lng'], self.lats[0], self.lngs[0]))
+
+        with self.assertRaises(ValueError):
+            distance.set_backend('manhattan')
+        self.assertEqual(distance.get_backend(), 'equirectangular')
+
+
+if __name__ == '__main__':
+    unittest.main()
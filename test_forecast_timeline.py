@@ -0,0 +1,62 @@
+"""From root of project, call
+python -m unittest test_forecast_timeline
+"""
+import datetime
+import random
+import unittest
+
+from forecast_timeline import ForecastTimeline
+
+START = 1551549600  # 2019-03-02T18:00:00+00:00
+THREE_HOURS = 3 * 60 * 60
+
+
+def linear_sunset_predicted_weather(dts, mains, sunset):
+    """
+    The linear scan compute_weather_time_affordances did before ForecastTimeline.
+    """
+    sunset_in_utc = datetime.datetime.fromtimestamp(sunset, datetime.timezone.utc)
+    for dt, main in zip(dts, mains):
+        forecast_dt = datetime.datetime.fromtimestamp(dt, datetime.timezone.utc)
+        if abs(sunset_in_utc - forecast_dt) <= datetime.timedelta(hours=3):
+            if sunset_in_utc.weekday() == forecast_dt.weekday():
+                return main
+    return None
+
+
+class TestForecastTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.dts = [START + THREE_HOURS * i for i in range(40)]
+        self.mains = ['weather_{}'.format(i) for i in range(40)]
+        self.timeline = ForecastTimeline(self.dts, self.mains)
+
+    def test_first_near_matches_linear_scan(self):
+        rand = random.Random(0)
+        for _ in range(2000):
+            sunset = START + rand.randint(-2 * THREE_HOURS, 42 * THREE_HOURS)
+            self.assertEqual(self.timeline.first_near(sunset, THREE_HOURS, same_utc_day=True),
+                             linear_sunset_predicted_weather(self.dts, self.mains, sunset))
+
+    def test_at(self):
+        self.assertEqual(self.timeline.at(START), 'weather_0')
+        self.assertEqual(self.timeline.at(START + THREE_HOURS + 60), 'weather_1')
+        self.assertEqual(self.timeline.at(START + 2 * THREE_HOURS - 60), 'weather_2')
+        self.assertEqual(self.timeline.at(START + THREE_HOURS // 2), 'weather_0')
+        self.assertEqual(self.timeline.at(START - THREE_HOURS), 'weather_0')
+        self.assertIsNone(self.timeline.at(START - THREE_HOURS - 1))
+        self.assertIsNone(self.timeline.at(self.dts[-1] + THREE_HOURS + 1))
+        self.assertIsNone(ForecastTimeline([], []).at(START))
+
+    def test_between(self):
+        self.assertEqual(self.timeline.between(START, START + 2 * THREE_HOURS),
+                         ['weather_0', 'weather_1', 'weather_2'])
+        self.assertEqual(self.timeline.between(START + 1, START + THREE_HOURS - 1), [])
+
+    def test_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            ForecastTimeline([START], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+"""From root of project, call
+python -m unittest test_geo_cells
+"""
+import unittest
+
+from geopy.distance import geodesic
+
+from geo_cells import tile_id, tile_center
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+class TestGeoCells(unittest.TestCase):
+
+    def test_nearby_points_share_tile(self):
+        self.assertEqual(tile_id(BAT17['lat'], BAT17['lng'], 16000.0),
+                         tile_id(BAT17['lat'] + 0.001, BAT17['lng'] + 0.001, 16000.0))
+
+    def test_far_points_do_not_share_tile(self):
+        self.assertNotEqual(tile_id(BAT17['lat'], BAT17['lng'], 10.0),
+                            tile_id(BAT17['lat'] + 0.001, BAT17['lng'], 10.0))
+
+    def test_tile_sizes_do_not_collide(self):
+        self.assertNotEqual(tile_id(0.0, 0.0, 10.0), tile_id(0.0, 0.0, 100.0))
+
+    def test_tile_center_is_inside_tile(self):
+        for tile_size in [10.0, 16000.0, 100000.0]:
+            tile = tile_id(BAT17['lat'], BAT17['lng'], tile_size)
+            center = tile_center(tile)
+            self.assertEqual(tile_id(center[0], center[1], tile_size), tile)
+            self.assertLess(geodesic(center, (BAT17['lat'], BAT17['lng'])).meters, tile_size)
@@ -0,0 +1,188 @@
+"""From root of project, call
+python -m unittest test_http_client
+
+Runs against a stub HTTP server on localhost, no upstream API keys needed.
+"""
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+from http_client import CircuitBreaker, CircuitOpenError, PooledSession
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive between requests
+    disable_nagle_algorithm = True  # headers and body are written separately, don't delay the body
+
+    # paths that should fail, e.g. '/error' -> number of times to fail before succeeding
+    failures = {}
+    # paths with injected latency, e.g. '/tail' -> list of seconds to delay the next requests by
+    delays = {}
+
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+        if self.delays.get(self.path):
+            time.sleep(self.delays[self.path].pop(0))
+
+        status = 200
+        if self.failures.get(self.path, 0) > 0:
+            self.failures[self.path] -= 1
+            status = 503
+
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPooledSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.handle_error = lambda request, client_address: None  # clients hang up on slow responses
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_connections_are_reused(self):
+        session = PooledSession('stub')
+        for _ in range(5):
+            resp = session.get(self.url)
+            self.assertEqual(resp.json(), {'ok': True})
+
+        stats = session.stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 4)
+
+    def test_timeouts_are_counted(self):
+        session = PooledSession('stub', read_timeout=0.1, retries=1, backoff=0.01)
+        with self.assertRaises(requests.exceptions.Timeout):
+            session.get(self.url + 'slow')
+
+        stats = session.stats()
+        self.assertEqual(stats['timeouts'], 2)
+        self.assertEqual(stats['retries'], 1)
+
+    def test_retries_retryable_statuses(self):
+        StubHandler.failures['/flaky'] = 1
+        session = PooledSession('stub', retries=2, backoff=0.01)
+        self.assertEqual(session.get(self.url + 'flaky').status_code, 200)
+        self.assertEqual(session.stats()['retries'], 1)
+        self.assertEqual(session.stats()['breaker']['state'], 'closed')
+
+    def test_breaker_fails_fast_then_recovers(self):
+        StubHandler.failures['/down'] = 3
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+        session = PooledSession('stub', retries=0, breaker=breaker)
+        for _ in range(3):
+            self.assertEqual(session.get(self.url + 'down').status_code, 503)
+        self.assertEqual(breaker.state, 'open')
+
+        with self.assertRaises(CircuitOpenError):
+            session.get(self.url + 'down')
+        self.assertEqual(session.stats()['short_circuited'], 1)
+
+        # a trial request after reset_timeout closes the breaker
+        time.sleep(0.25)
+        self.assertEqual(session.get(self.url + 'down').status_code, 200)
+        self.assertEqual(breaker.stats(), {'state': 'closed', 'consecutive_failures': 0, 'times_opened': 1})
+
+    def test_hedges_slow_requests(self):
+        session = PooledSession('stub', hedge_percentile=90, hedge_budget=0.1)
+        for _ in range(20):
+            session.get(self.url + 'hedged')
+        self.assertIsNotNone(session.hedge_delay())
+
+        # the first request stalls, its hedge answers right away
+        StubHandler.delays['/hedged'] = [1.0]
+        start = time.monotonic()
+        self.assertEqual(session.get(self.url + 'hedged').json(), {'ok': True})
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        stats = session.stats()
+        self.assertEqual(stats['hedges'], 1)
+        self.assertEqual(stats['hedge_wins'], 1)
+
+    def test_hedges_stay_within_budget(self):
+        # hedge past the median, which stays fast while the slow requests below are in the minority
+        session = PooledSession('stub', hedge_percentile=50, hedge_budget=0.1)
+        for _ in range(20):
+            session.get(self.url + 'budget')
+
+        # every request is slow now, hedges included
+        StubHandler.delays['/budget'] = [0.15] * 10
+        for _ in range(5):
+            session.get(self.url + 'budget')
+
+        stats = session.stats()
+        self.assertEqual(stats['hedges'], 2)
+        self.assertEqual(stats['hedges_over_budget'], 3)
+        self.assertLessEqual(stats['hedges'], 0.1 * stats['attempts'])
+
+    def test_hedge_budget_does_not_accrue(self):
+        # hedge past the median, which stays fast while the slow requests below are in the minority
+        session = PooledSession('stub', hedge_percentile=50, hedge_budget=0.02)
+        for _ in range(500):
+            session.get(self.url + 'burst')
+
+        # a long healthy period earns no more than hedge_budget of the recent window
+        StubHandler.delays['/burst'] = [0.08] * 20
+        for _ in range(10):
+            session.get(self.url + 'burst')
+
+        stats = session.stats()
+        self.assertEqual(stats['hedges'], 4)
+        self.assertEqual(stats['hedges_over_budget'], 6)
+
+    def test_hedging_is_opt_in(self):
+        session = PooledSession('stub')
+        for _ in range(20):
+            session.get(self.url)
+        self.assertIsNone(session.hedge_delay())
+        self.assertEqual(session.stats()['hedges'], 0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_half_open_allows_one_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        # a failed trial opens the breaker again
+        breaker.record_failure()
+        self.assertEqual(breaker.times_opened, 2)
+
+    def test_other_request_errors_release_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        session = PooledSession('stub', retries=0, breaker=breaker)
+
+        # the trial call fails with an error that is neither a timeout nor a connection error
+        with mock.patch.object(session.session, 'get', side_effect=requests.exceptions.ChunkedEncodingError()):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                session.get('http://127.0.0.1/')
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(session.stats()['other_errors'], 1)
+
+        # the next trial goes through and closes the breaker
+        with mock.patch.object(session.session, 'get', return_value=mock.Mock(status_code=200)):
+            self.assertEqual(session.get('http://127.0.0.1/').status_code, 200)
+        self.assertEqual(breaker.state, 'closed')
@@ -4,11 +4,19 @@ python -m unittest test_main
 Must run local mongod instance, i.e.
 mongod --config /usr/local/etc/mongod.conf
 """
+import datetime
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import main
 from main import (
     get_weather_time_conditions_as_keyvalues,
     get_current_conditions_as_keyvalues,
-    place_categories_dict_as_keyvalues
+    place_categories_dict_as_keyvalues,
+    fetch_conditions_data
 )
 
 BAT17 = {'lat': 42.048735, 'lng': -87.683187}
@@ -50,3 +58,436 @@ class TestEndPointHelpers(unittest.TestCase):
         }
         self.assertEqual(place_categories_dict_as_keyvalues(place_categories_dict), as_keyvals)
 
+
+class TestConcurrentFetch(unittest.TestCase):
+
+    @staticmethod
+    def slow(result, delay=0.2):
+        def fetch(lat, lng, stale_sources=None):
+            time.sleep(delay)
+            return result
+        return fetch
+
+    def test_fetch_conditions_data_runs_sources_concurrently(self):
+        with mock.patch.object(main, 'get_weather_data', self.slow({'weather_main': ['Clear']})), \
+                mock.patch.object(main, 'get_forecast_data', self.slow({'forecast_dt': [0], 'forecast_main': ['Rain']})), \
+                mock.patch.object(main, 'get_sunrise_sunset_data', self.slow('sunrise_sunset')), \
+                mock.patch.object(main, 'get_categories_for_location', self.slow('yelp')):
+            start = time.time()
+            fetched_data = fetch_conditions_data(BAT17['lat'], BAT17['lng'], include_yelp=True)
+            elapsed = time.time() - start
+
+        self.assertEqual(fetched_data, {'weather': {'schema': 2, 'weather_main': ['Clear'], 'forecast_dt': [0],
+                                                    'forecast_main': ['Rain'], 'timezone': None},
+                                        'sunrise_sunset': 'sunrise_sunset', 'yelp': 'yelp', 'stale_sources': [],
+                                        'missing_sources': []})
+        self.assertLess(elapsed, 0.5)
+
+    def test_fetch_conditions_data_without_yelp(self):
+        with mock.patch.object(main, 'get_weather_data', self.slow({'weather': []}, 0)), \
+                mock.patch.object(main, 'get_forecast_data', self.slow({'forecast': []}, 0)), \
+                mock.patch.object(main, 'get_sunrise_sunset_data', self.slow('sunrise_sunset', 0)), \
+                mock.patch.object(main, 'get_categories_for_location') as get_categories_for_location:
+            fetched_data = fetch_conditions_data(BAT17['lat'], BAT17['lng'], include_yelp=False)
+
+        self.assertIsNone(fetched_data['yelp'])
+        get_categories_for_location.assert_not_called()
+
+    def test_fetch_conditions_data_returns_partial_results_at_deadline(self):
+        cached = []
+
+        def slow_yelp(lat, lng, stale_sources=None):
+            time.sleep(0.3)
+            cached.append('yelp')
+            return 'yelp'
+
+        with mock.patch.object(main, 'get_weather_data', self.slow({'weather_main': ['Clear']}, 0)), \
+                mock.patch.object(main, 'get_forecast_data', self.slow({}, 0)), \
+                mock.patch.object(main, 'get_sunrise_sunset_data', self.slow('sunrise_sunset', 0)), \
+                mock.patch.object(main, 'get_categories_for_location', slow_yelp):
+            start = time.time()
+            fetched_data = fetch_conditions_data(BAT17['lat'], BAT17['lng'], include_yelp=True, deadline=0.1)
+            elapsed = time.time() - start
+
+            self.assertLess(elapsed, 0.25)
+            self.assertEqual(fetched_data['weather']['weather_main'], ['Clear'])
+            self.assertIsNone(fetched_data['yelp'])
+            self.assertEqual(fetched_data['missing_sources'], ['yelp'])
+
+            # the slow source still finishes, to populate its cache
+            time.sleep(0.4)
+            self.assertEqual(cached, ['yelp'])
+
+        self.assertGreaterEqual(main.deadline_stats()['missing_sources']['yelp'], 1)
+
+    def test_sources_at_in_flight_cap_are_skipped(self):
+        started = []
+
+        def slow_yelp(lat, lng, stale_sources=None):
+            started.append('yelp')
+            time.sleep(0.3)
+            return 'yelp'
+
+        def stale_weather(lat, lng, stale_sources=None):
+            stale_sources.append('weather')
+            return {'weather_main': ['Clear']}
+
+        with mock.patch.object(main, 'SOURCE_MAX_IN_FLIGHT', 1), \
+                mock.patch.object(main, 'get_weather_data', stale_weather), \
+                mock.patch.object(main, 'get_forecast_data', self.slow({}, 0)), \
+                mock.patch.object(main, 'get_sunrise_sunset_data', self.slow('sunrise_sunset', 0)), \
+                mock.patch.object(main, 'get_categories_for_location', slow_yelp):
+            first = fetch_conditions_data(BAT17['lat'], BAT17['lng'], include_yelp=True, deadline=0.05)
+            start = time.time()
+            second = fetch_conditions_data(BAT17['lat'], BAT17['lng'], include_yelp=True, deadline=0.2)
+            elapsed = time.time() - start
+            in_flight = main.deadline_stats()['in_flight']['yelp']
+
+            # yelp is still fetching for the first request, so the second one does not wait on it
+            self.assertLess(elapsed, 0.15)
+            self.assertEqual(started, ['yelp'])
+            self.assertEqual(in_flight, 1)
+            for fetched_data in (first, second):
+                self.assertEqual(fetched_data['missing_sources'], ['yelp'])
+                self.assertEqual(fetched_data['stale_sources'], ['weather'])
+
+            time.sleep(0.4)
+
+        self.assertGreaterEqual(main.deadline_stats()['skipped_sources']['yelp'], 1)
+        self.assertEqual(main.deadline_stats()['in_flight']['yelp'], 0)
+
+    def test_deadline_query_parameter_overrides_default(self):
+        with mock.patch.object(main, 'REQUEST_DEADLINE', 2.0):
+            with main.app.test_request_context('/location_keyvalues/42.05/-87.68'):
+                self.assertEqual(main.request_deadline(), 2.0)
+            with main.app.test_request_context('/location_keyvalues/42.05/-87.68?deadline=0.5'):
+                self.assertEqual(main.request_deadline(), 0.5)
+            with main.app.test_request_context('/location_keyvalues/42.05/-87.68?deadline=0'):
+                self.assertIsNone(main.request_deadline())
+
+
+class TestCampusAffordances(unittest.TestCase):
+
+    def test_on_campus_point_skips_yelp(self):
+        blomquist = {'lat': 42.0542930959171, 'lng': -87.6782216341711}
+        with mock.patch.object(main, 'get_weather_data', return_value={'weather': []}), \
+                mock.patch.object(main, 'get_forecast_data', return_value={'forecast': []}), \
+                mock.patch.object(main, 'get_sunrise_sunset_data', return_value={}), \
+                mock.patch.object(main, 'get_categories_for_location') as get_categories_for_location, \
+                mock.patch.object(main, 'CAMPUS_SKIP_YELP', True):
+            current_conditions = get_current_conditions_as_keyvalues(blomquist['lat'], blomquist['lng'])
+
+        get_categories_for_location.assert_not_called()
+        self.assertEqual(current_conditions['blomquist_recreation_center'], {'gym': True, 'distance': 0.0})
+
+
+class TestFetchThroughCache(unittest.TestCase):
+
+    def test_concurrent_misses_are_coalesced(self):
+        upstream_calls = []
+
+        def fetch_from_upstream(lat, lng):
+            upstream_calls.append((lat, lng))
+            time.sleep(0.2)
+            return {'fetched': True}
+
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache:
+            data_cache.fetch_from_cache.return_value = (None, False)
+            futures = [main.REQUEST_EXECUTOR.submit(main.fetch_through_cache, 'LocationCache',
+                                                    BAT17['lat'], BAT17['lng'] + i * 0.000001, 10.0, 10080,
+                                                    fetch_from_upstream, 'Test API')
+                       for i in range(5)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, [({'fetched': True}, False)] * 5)
+        self.assertEqual(len(upstream_calls), 1)
+        data_cache.add_to_cache.assert_called_once()
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        refreshed = []
+        stale_location = {'_id': 1, 'data': {'fetched': False},
+                          'date': datetime.datetime.utcnow() - datetime.timedelta(minutes=31)}
+
+        def fetch_from_upstream(lat, lng):
+            refreshed.append((lat, lng))
+            return {'fetched': True}
+
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.dict(main.CACHE_STALE_GRACE, {'WeatherCache': 15}):
+            data_cache.fetch_from_cache.return_value = (stale_location, False)
+            data, is_stale = main.fetch_through_cache('WeatherCache', BAT17['lat'], BAT17['lng'], 16000.0, 30,
+                                                      fetch_from_upstream, 'Test API')
+
+            # wait for background refresh
+            for _ in range(50):
+                if data_cache.update_cache.called:
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(data, {'fetched': False})
+        self.assertTrue(is_stale)
+        self.assertEqual(len(refreshed), 1)
+        data_cache.update_cache.assert_called_once_with('WeatherCache', 1, {'fetched': True}, negative=False)
+
+    def test_expired_entry_past_grace_is_fetched(self):
+        expired_location = {'_id': 1, 'data': {'fetched': False},
+                            'date': datetime.datetime.utcnow() - datetime.timedelta(minutes=60)}
+
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.dict(main.CACHE_STALE_GRACE, {'WeatherCache': 15}):
+            data_cache.fetch_from_cache.return_value = (expired_location, False)
+            data, is_stale = main.fetch_through_cache('WeatherCache', BAT17['lat'], BAT17['lng'], 16000.0, 30,
+                                                      lambda lat, lng: {'fetched': True}, 'Test API')
+
+        self.assertEqual(data, {'fetched': True})
+        self.assertFalse(is_stale)
+
+    def test_should_refresh_early(self):
+        with mock.patch.object(main, 'CACHE_EARLY_REFRESH_BETA', 1.0), \
+                mock.patch.dict(main.UPSTREAM_FETCH_SECONDS, {'WeatherCache': 1.0}):
+            self.assertFalse(any(main.should_refresh_early('WeatherCache', 1, 30) for _ in range(100)))
+            self.assertTrue(all(main.should_refresh_early('WeatherCache', 30, 30) for _ in range(100)))
+
+        with mock.patch.object(main, 'CACHE_EARLY_REFRESH_BETA', 0):
+            self.assertFalse(main.should_refresh_early('WeatherCache', 30, 30))
+
+    def test_background_refreshes_are_bounded(self):
+        release = threading.Event()
+        refreshed = []
+
+        def blocking_refresh(*args):
+            release.wait(5)
+            refreshed.append(args)
+            return {}
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        with mock.patch.object(main, 'REFRESH_EXECUTOR', executor), \
+                mock.patch.object(main, 'REFRESH_MAX_PENDING', 1):
+            self.assertTrue(main.refresh_in_background(('WeatherCache:a', blocking_refresh, 'WeatherCache')))
+            self.assertFalse(main.refresh_in_background(('WeatherCache:b', blocking_refresh, 'WeatherCache')))
+            release.set()
+            executor.shutdown(wait=True)
+
+        self.assertEqual(len(refreshed), 1)
+        self.assertEqual(main.REFRESH_PENDING, 0)
+        self.assertGreaterEqual(main.stale_while_revalidate_stats()['WeatherCache']['dropped_refreshes'], 1)
+
+
+    def test_failed_background_refreshes_are_counted(self):
+        def failing_refresh(*args):
+            raise RuntimeError('Yelp API -- request failed')
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        with mock.patch.object(main, 'REFRESH_EXECUTOR', executor):
+            self.assertTrue(main.refresh_in_background(('LocationCache:failing', failing_refresh, 'LocationCache')))
+            executor.shutdown(wait=True)
+
+        self.assertEqual(main.REFRESH_PENDING, 0)
+        self.assertGreaterEqual(main.stale_while_revalidate_stats()['LocationCache']['failed_refreshes'], 1)
+
+
+class TestBatchConditions(unittest.TestCase):
+
+    def test_batch_dedupes_cells_and_preserves_order(self):
+        locations = [(BAT17['lat'], BAT17['lng']), (41.8781, -87.6298), (BAT17['lat'], BAT17['lng'])]
+        upstream_calls = {'weather': 0, 'forecast': 0, 'yelp': 0}
+
+        def fetch_weather_data(lat, lng):
+            upstream_calls['weather'] += 1
+            return {'weather': [], 'timezone': 'America/Chicago'}
+
+        def fetch_forecast_data(lat, lng):
+            upstream_calls['forecast'] += 1
+            return {'forecast': [], 'timezone': 'America/Chicago'}
+
+        def fetch_yelp_data(lat, lng):
+            upstream_calls['yelp'] += 1
+            return {'place_{}'.format(lat): {'categories': ['bars'], 'distance': 1.0}}
+
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.object(main, 'fetch_weather_data', fetch_weather_data), \
+                mock.patch.object(main, 'fetch_forecast_data', fetch_forecast_data), \
+                mock.patch.object(main, 'fetch_sunrise_sunset_data', return_value={}), \
+                mock.patch.object(main, 'fetch_yelp_data', fetch_yelp_data), \
+                mock.patch.object(main, 'SUNRISE_SUNSET_SOURCE', 'api'), \
+                mock.patch.object(main, 'REQUEST_EXECUTOR') as request_executor:
+            data_cache.fetch_many_from_cache.side_effect = lambda collection_name, cell_locations, *args: \
+                [(None, False)] * len(cell_locations)
+            results = main.get_batch_conditions_as_keyvalues(locations)
+
+        # misses are fetched on BATCH_EXECUTOR, leaving REQUEST_EXECUTOR to single-location requests
+        request_executor.submit.assert_not_called()
+
+        # one cache query per collection, one upstream query per distinct cell
+        self.assertEqual(data_cache.fetch_many_from_cache.call_count, 4)
+        self.assertEqual(upstream_calls, {'weather': 2, 'forecast': 2, 'yelp': 2})
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], results[2])
+        self.assertIn('place_{}'.format(BAT17['lat']), results[0])
+        self.assertIn('place_41.8781', results[1])
+
+    def test_batch_endpoint_rejects_malformed_body(self):
+        client = main.app.test_client()
+        self.assertEqual(client.post('/location_keyvalues/batch', json={'points': []}).status_code, 400)
+        self.assertEqual(client.post('/location_keyvalues/batch', json={'locations': [{'lat': 'x'}]}).status_code,
+                         400)
+        self.assertEqual(client.post('/location_keyvalues/batch', data='not json').status_code, 400)
+
+
+class TestAsOf(unittest.TestCase):
+
+    def test_time_affordances_as_of(self):
+        weather_forecast_dict = {'weather': [], 'forecast': [], 'timezone': 'America/Chicago'}
+        sunrise_sunset_dict = {'sunrise': '2019-03-02T12:25:00+00:00', 'sunset': '2019-03-02T23:40:00+00:00'}
+
+        with mock.patch.object(main, 'SUNRISE_SUNSET_SOURCE', 'api'):
+            as_of = datetime.datetime(2019, 6, 5, 18, 0, tzinfo=datetime.timezone.utc)
+            _, output_dict = main.compute_weather_time_affordances(BAT17['lat'], BAT17['lng'], weather_forecast_dict,
+                                                                   sunrise_sunset_dict, as_of=as_of)
+            self.assertEqual(output_dict['hour'], 13)
+            self.assertEqual(output_dict['utc_offset'], -5)
+            self.assertTrue(output_dict['wednesday'])
+            self.assertTrue(output_dict['daytime'])
+
+            # fetched sunrise/sunset are moved to the local date of as_of
+            as_of = datetime.datetime(2019, 6, 5, 23, 45, tzinfo=datetime.timezone.utc)
+            _, output_dict = main.compute_weather_time_affordances(BAT17['lat'], BAT17['lng'], weather_forecast_dict,
+                                                                   sunrise_sunset_dict, as_of=as_of)
+            self.assertTrue(output_dict['sunset'])
+
+        # local sunrise/sunset are computed for the local date of as_of, sunset is 8:24pm CDT on June 5, 2019
+        with mock.patch.object(main, 'SUNRISE_SUNSET_SOURCE', 'local'):
+            as_of = datetime.datetime(2019, 6, 6, 1, 20, tzinfo=datetime.timezone.utc)
+            _, output_dict = main.compute_weather_time_affordances(BAT17['lat'], BAT17['lng'], weather_forecast_dict,
+                                                                   sunrise_sunset_dict, as_of=as_of)
+            self.assertTrue(output_dict['sunset'])
+            self.assertTrue(output_dict['wednesday'])
+
+
+class TestWeatherForecastCaches(unittest.TestCase):
+
+    def test_expired_weather_with_valid_forecast_makes_one_upstream_call(self):
+        valid_forecast = {'_id': 2, 'data': {'forecast': {'list': []}, 'timezone': 'America/Chicago'},
+                          'date': datetime.datetime.utcnow()}
+        cached_locations = {'WeatherCache': (None, False), 'ForecastCache': (valid_forecast, True)}
+
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.object(main, 'WEATHER_API') as weather_api, \
+                mock.patch.object(main, 'CACHE_EARLY_REFRESH_BETA', 0):
+            data_cache.fetch_from_cache.side_effect = lambda collection_name, *args: cached_locations[collection_name]
+            weather_api.get_weather_at_location.return_value = {'weather': [{'main': 'Clear'}]}
+            saved_before = main.upstream_stats().get('ForecastCache', {}).get('saved', 0)
+
+            fetched_data = fetch_conditions_data(BAT17['lat'], BAT17['lng'], include_yelp=False)
+
+        weather_api.get_weather_at_location.assert_called_once()
+        weather_api.get_forecast_at_location.assert_not_called()
+        self.assertEqual(fetched_data['weather']['weather_main'], ['Clear'])
+        self.assertEqual(fetched_data['weather']['forecast_dt'], [])
+        self.assertEqual(main.upstream_stats()['ForecastCache']['saved'], saved_before + 1)
+
+
+class TestPrewarm(unittest.TestCase):
+
+    def test_jobs_share_cache_cells(self):
+        with mock.patch.object(main, 'SUNRISE_SUNSET_SOURCE', 'api'):
+            jobs = main.prewarm_jobs()
+
+        collections = [job.collection_name for job in jobs]
+        # hot locations around campus share a few wide weather, forecast and sunrise/sunset cells
+        for collection_name in ('WeatherCache', 'ForecastCache', 'SunriseSunsetCache'):
+            self.assertIn(collection_name, collections)
+            self.assertLessEqual(collections.count(collection_name), 2)
+        self.assertGreaterEqual(collections.count('LocationCache'), len(main.HARDCODED_LOCATION))
+
+    def test_in_flight_requests_counted(self):
+        before = main.in_flight_requests()
+        with main.app.test_request_context('/'):
+            main.app.preprocess_request()
+            self.assertEqual(main.in_flight_requests(), before + 1)
+        self.assertEqual(main.in_flight_requests(), before)
+
+
+class TestMovementPrefetch(unittest.TestCase):
+
+    def test_prefetches_cells_ahead_of_session(self):
+        step = 1.5 * 5 / 111195.0
+        fetched = []
+
+        def fetch_yelp_data(lat, lng):
+            fetched.append((lat, lng))
+            return {}
+
+        with mock.patch.object(main, 'MOVEMENT_PREFETCH_ENABLED', True), \
+                mock.patch.object(main, 'MOVEMENT_TRACKER', main.MovementTracker()), \
+                mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.object(main, 'fetch_yelp_data', fetch_yelp_data), \
+                mock.patch.object(main, 'CAMPUS_SKIP_YELP', False), \
+                mock.patch.object(main, 'MOVEMENT_PREFETCH_SECONDS', 20.0):
+            data_cache.fetch_from_cache.return_value = (None, False)
+
+            # no prefetch without a session, or before a heading is known
+            self.assertEqual(main.prefetch_along_path(None, BAT17['lat'], BAT17['lng']), 0)
+            main.MOVEMENT_TRACKER.record('walker', BAT17['lat'] - step, BAT17['lng'], timestamp=time.time() - 5)
+            started = main.prefetch_along_path('walker', BAT17['lat'], BAT17['lng'])
+            deadline = time.time() + 5
+            while main.prefetch_stats()['pending'] and time.time() < deadline:
+                time.sleep(0.01)
+
+        # 30 meters ahead at 1.5 meters per second, in 10 meter cells
+        self.assertEqual(started, 3)
+        self.assertEqual(len(fetched), started)
+        self.assertTrue(all(lat > BAT17['lat'] for lat, _ in fetched))
+        self.assertEqual(data_cache.add_to_cache.call_count, started)
+
+
+class TestNegativeCaching(unittest.TestCase):
+
+    def test_negative_tiles_expire_after_negative_ttl(self):
+        data_cache = main.DataCache(None, 'affordance-aware-test', l1_max_entries=8,
+                                    tile_sizes={'WeatherCache': 16000.0}, negative_ttls={'WeatherCache': 2})
+        collection = mock.Mock()
+        with mock.patch.object(data_cache, 'ensure_indexes', return_value=collection):
+            for negative, age, valid in [(True, 1, True), (True, 5, False), (False, 5, True)]:
+                collection.find_one.return_value = {
+                    '_id': 'tile', 'data': {}, 'negative': negative,
+                    'date': datetime.datetime.utcnow() - datetime.timedelta(minutes=age)
+                }
+                _, valid_cache_location = data_cache.fetch_from_cache('WeatherCache', BAT17['lat'], BAT17['lng'],
+                                                                      16000.0, 30)
+                self.assertEqual(valid_cache_location, valid)
+                # negative tiles are never held in L1
+                data_cache.l1.clear()
+
+        self.assertEqual(data_cache.stats()['negative']['hits'], 1)
+
+    def test_failed_weather_cached_as_negative(self):
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.object(main, 'WEATHER_API') as weather_api:
+            weather_api.get_weather_at_location.return_value = None
+            data = main.refresh_cache('WeatherCache', BAT17['lat'], BAT17['lng'], 16000.0, 30,
+                                      main.fetch_weather_data, None, 'WeatherCache:test')
+
+        self.assertEqual(data['weather_main'], [])
+        data_cache.add_to_cache.assert_called_once_with('WeatherCache', BAT17['lat'], BAT17['lng'], data,
+                                                        negative=True)
+
+    def test_failed_yelp_keeps_last_good_data(self):
+        cached_location = {'_id': 1, 'data': {'bat_17_evanston': {'distance': 1.0, 'categories': ['bars']}},
+                           'negative': False}
+        with mock.patch.object(main, 'DATA_CACHE') as data_cache, \
+                mock.patch.object(main.YELP_API, 'fetch_yelp_locations', side_effect=RuntimeError('Yelp is down')):
+            data = main.refresh_cache('LocationCache', BAT17['lat'], BAT17['lng'], 10.0, 10080,
+                                      main.fetch_yelp_data, cached_location, 'LocationCache:test')
+
+        self.assertEqual(data, cached_location['data'])
+        data_cache.update_cache.assert_called_once_with('LocationCache', 1, cached_location['data'], negative=True)
+
+    def test_failed_yelp_caches_hardcoded_locations(self):
+        lat, lng = main.HARDCODED_LOCATION[0][1]
+        with mock.patch.object(main.YELP_API, 'fetch_yelp_locations', side_effect=RuntimeError('Yelp is down')):
+            result = main.fetch_yelp_data(lat, lng)
+
+        self.assertIsInstance(result, main.NegativeResult)
+        self.assertIn(list(main.HARDCODED_LOCATION[0][0])[0], result.data)
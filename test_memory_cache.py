@@ -0,0 +1,101 @@
+"""From root of project, call
+python -m unittest test_memory_cache
+"""
+import datetime
+import math
+import random
+import unittest
+
+import distance
+from memory_cache import LocationLRUCache
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+def make_doc(object_id, lat, lng, minutes_old=0):
+    return {
+        '_id': object_id,
+        'location': [lng, lat],
+        'data': {'id': object_id},
+        'date': datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes_old)
+    }
+
+
+class TestLocationLRUCache(unittest.TestCase):
+
+    def test_lookup_within_distance(self):
+        l1_cache = LocationLRUCache()
+        l1_cache.put(make_doc(1, BAT17['lat'], BAT17['lng']))
+
+        doc, dist = l1_cache.lookup(BAT17['lat'] + 0.00005, BAT17['lng'], 10.0, 30)
+        self.assertEqual(doc['_id'], 1)
+        self.assertLess(dist, 10.0)
+
+        doc, dist = l1_cache.lookup(BAT17['lat'] + 0.001, BAT17['lng'], 10.0, 30)
+        self.assertIsNone(doc)
+
+    def test_lookup_returns_nearest(self):
+        l1_cache = LocationLRUCache()
+        l1_cache.put(make_doc(1, BAT17['lat'] + 0.0002, BAT17['lng']))
+        l1_cache.put(make_doc(2, BAT17['lat'] + 0.0001, BAT17['lng']))
+
+        doc, _ = l1_cache.lookup(BAT17['lat'], BAT17['lng'], 100.0, 30)
+        self.assertEqual(doc['_id'], 2)
+
+    def test_expired_documents_are_dropped(self):
+        l1_cache = LocationLRUCache()
+        l1_cache.put(make_doc(1, BAT17['lat'], BAT17['lng'], minutes_old=31))
+
+        doc, _ = l1_cache.lookup(BAT17['lat'], BAT17['lng'], 10.0, 30)
+        self.assertIsNone(doc)
+        self.assertEqual(len(l1_cache), 0)
+        self.assertEqual(l1_cache.expirations, 1)
+
+    def test_lru_eviction(self):
+        l1_cache = LocationLRUCache(max_entries=2)
+        l1_cache.put(make_doc(1, BAT17['lat'], BAT17['lng']))
+        l1_cache.put(make_doc(2, BAT17['lat'] + 1, BAT17['lng']))
+
+        # touch 1 so that 2 is least recently used
+        l1_cache.lookup(BAT17['lat'], BAT17['lng'], 10.0, 30)
+        l1_cache.put(make_doc(3, BAT17['lat'] + 2, BAT17['lng']))
+
+        self.assertEqual(l1_cache.evictions, 1)
+        self.assertIsNone(l1_cache.lookup(BAT17['lat'] + 1, BAT17['lng'], 10.0, 30)[0])
+        self.assertIsNotNone(l1_cache.lookup(BAT17['lat'], BAT17['lng'], 10.0, 30)[0])
+
+    def test_update(self):
+        l1_cache = LocationLRUCache()
+        l1_cache.put(make_doc(1, BAT17['lat'], BAT17['lng'], minutes_old=29))
+        l1_cache.update(1, {'id': 'new'}, datetime.datetime.utcnow())
+
+        doc, _ = l1_cache.lookup(BAT17['lat'], BAT17['lng'], 10.0, 30)
+        self.assertEqual(doc['data'], {'id': 'new'})
+
+    def test_lookup_includes_documents_just_inside_threshold(self):
+        # due north and south, where the bounding box is tightest
+        lat_offset = math.degrees((10.0 - 0.001) / distance.EARTH_RADIUS_METERS)
+        for sign in (1, -1):
+            l1_cache = LocationLRUCache()
+            l1_cache.put(make_doc(1, BAT17['lat'] + sign * lat_offset, BAT17['lng']))
+            doc, _ = l1_cache.lookup(BAT17['lat'], BAT17['lng'], 10.0, 30)
+            self.assertIsNotNone(doc)
+
+    def test_lookup_matches_linear_scan(self):
+        rand = random.Random(0)
+        docs = [make_doc(i, BAT17['lat'] + rand.uniform(-0.01, 0.01), BAT17['lng'] + rand.uniform(-0.01, 0.01))
+                for i in range(300)]
+        l1_cache = LocationLRUCache()
+        for doc in docs:
+            l1_cache.put(doc)
+
+        # the first lookup sets the cell size, later ones use other thresholds on the same grid
+        for threshold in [10.0, 60.0, 250.0, 5000.0]:
+            for _ in range(20):
+                lat, lng = BAT17['lat'] + rand.uniform(-0.01, 0.01), BAT17['lng'] + rand.uniform(-0.01, 0.01)
+                dists = [(distance.distance(doc['location'][1], doc['location'][0], lat, lng), doc['_id'])
+                         for doc in docs]
+                expected = min([dist for dist in dists if dist[0] < threshold], default=(None, None))
+                doc, dist = l1_cache.lookup(lat, lng, threshold, 30)
+                self.assertEqual(doc['_id'] if doc is not None else None, expected[1])
+        self.assertEqual(l1_cache.cell_size_meters, 10.0)
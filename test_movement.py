@@ -0,0 +1,69 @@
+"""From root of project, call
+python -m unittest test_movement
+"""
+import unittest
+
+from distance import haversine
+from movement import MovementTracker
+
+# about 1.5 meters per second north, then east, at 42 degrees latitude
+NORTH_STEP = 1.5 * 5 / 111195.0
+EAST_STEP = NORTH_STEP / 0.7431
+
+
+class TestMovementTracker(unittest.TestCase):
+
+    def test_predicts_path_along_heading(self):
+        tracker = MovementTracker()
+        for i in range(3):
+            tracker.record('walker', 42.05 + i * NORTH_STEP, -87.68, timestamp=100.0 + i * 5)
+
+        north, east = tracker.velocity('walker')
+        self.assertAlmostEqual(north, 1.5, places=2)
+        self.assertAlmostEqual(east, 0.0, places=2)
+
+        path = tracker.predict_path('walker', 20, 5.0)
+        self.assertEqual(len(path), 6)
+        newest = (42.05 + 2 * NORTH_STEP, -87.68)
+        for step, (lat, lng) in enumerate(path, 1):
+            self.assertAlmostEqual(haversine(newest[0], newest[1], lat, lng), 5.0 * step, places=1)
+            self.assertGreater(lat, newest[0])
+
+    def test_heading_east(self):
+        tracker = MovementTracker()
+        tracker.record('walker', 42.0, -87.68, timestamp=0.0)
+        tracker.record('walker', 42.0, -87.68 + EAST_STEP, timestamp=5.0)
+
+        north, east = tracker.velocity('walker')
+        self.assertAlmostEqual(east, 1.5, places=2)
+        self.assertTrue(all(lng > -87.68 + EAST_STEP for _, lng in tracker.predict_path('walker', 10, 5.0)))
+
+    def test_no_path_when_standing_still_or_unknown(self):
+        tracker = MovementTracker()
+        self.assertEqual(tracker.predict_path('nobody', 20, 5.0), [])
+
+        tracker.record('sitter', 42.05, -87.68, timestamp=0.0)
+        self.assertEqual(tracker.predict_path('sitter', 20, 5.0), [])
+        tracker.record('sitter', 42.05 + 1e-6, -87.68, timestamp=10.0)
+        self.assertIsNone(tracker.velocity('sitter'))
+
+    def test_ignores_old_fixes(self):
+        tracker = MovementTracker(max_fix_age=30)
+        tracker.record('walker', 41.0, -87.68, timestamp=0.0)
+        tracker.record('walker', 42.05, -87.68, timestamp=100.0)
+        tracker.record('walker', 42.05 + NORTH_STEP, -87.68, timestamp=105.0)
+        self.assertAlmostEqual(tracker.velocity('walker')[0], 1.5, places=2)
+
+    def test_evicts_least_recent_session(self):
+        tracker = MovementTracker(max_sessions=2)
+        tracker.record('a', 42.05, -87.68)
+        tracker.record('b', 42.05, -87.68)
+        tracker.record('a', 42.05, -87.68)
+        tracker.record('c', 42.05, -87.68)
+        self.assertEqual(tracker.stats()['sessions'], 2)
+        self.assertEqual(tracker.stats()['evictions'], 1)
+        self.assertIsNone(tracker.velocity('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""From root of project, call
+python -m unittest test_prewarm
+"""
+import datetime
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from prewarm import CacheWarmer, TokenBucket, WarmJob, hot_locations, metrics_load, read_places
+
+
+def cached_entry(age_minutes):
+    return {'_id': 1, 'data': {}, 'date': datetime.datetime.utcnow() - datetime.timedelta(minutes=age_minutes)}
+
+
+class TestHotLocations(unittest.TestCase):
+
+    def test_read_places(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as places_file:
+            places_file.write('Coffee Lab\n42.058331/-87.683631\n\n"sailing center", \n42.047691, -87.679189\n')
+        try:
+            self.assertEqual(read_places(places_file.name), [(42.058331, -87.683631), (42.047691, -87.679189)])
+        finally:
+            os.remove(places_file.name)
+
+    def test_hot_locations_dedupes(self):
+        hardcoded = [({'bat_17_evanston': ['bars']}, (42.048735, -87.683187))]
+        places = [(42.048735, -87.683187), (42.058331, -87.683631)]
+        self.assertEqual(hot_locations(hardcoded, places), [(42.048735, -87.683187), (42.058331, -87.683631)])
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_bursts_then_limits(self):
+        bucket = TokenBucket(rate=1.0, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertGreater(bucket.try_acquire(), 0)
+
+
+class TestCacheWarmer(unittest.TestCase):
+
+    def setUp(self):
+        self.data_cache = mock.Mock()
+        self.refresh = mock.Mock()
+        self.jobs = [WarmJob('WeatherCache', 42.05, -87.68, 16000.0, 30, None, 'Weather API')]
+
+    def test_refreshes_missing_and_expiring_entries(self):
+        warmer = CacheWarmer(self.data_cache, self.jobs, self.refresh, lead_minutes=5)
+
+        self.data_cache.fetch_from_cache.return_value = (None, False)
+        self.assertEqual(warmer.run_once(), 1)
+        self.refresh.assert_called_once_with(self.jobs[0], None)
+
+        # refreshed 5 minutes before expiry, not earlier
+        self.refresh.reset_mock()
+        self.data_cache.fetch_from_cache.return_value = (cached_entry(20), True)
+        self.assertEqual(warmer.run_once(), 0)
+        entry = cached_entry(26)
+        self.data_cache.fetch_from_cache.return_value = (entry, True)
+        self.assertEqual(warmer.run_once(), 1)
+        self.refresh.assert_called_once_with(self.jobs[0], entry)
+
+        self.assertEqual(warmer.stats()['refreshes'], 2)
+
+    def test_rate_limited(self):
+        jobs = self.jobs * 3
+        self.data_cache.fetch_from_cache.return_value = (None, False)
+        warmer = CacheWarmer(self.data_cache, jobs, self.refresh, rate_per_minute=60)
+        warmer.rate_limiter = TokenBucket(rate=10.0, capacity=1)
+
+        start = time.monotonic()
+        self.assertEqual(warmer.run_once(), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_pauses_under_load(self):
+        load = [10]
+
+        def refresh(job, cached_location):
+            self.assertLessEqual(load[0], 2)
+
+        self.data_cache.fetch_from_cache.return_value = (None, False)
+        warmer = CacheWarmer(self.data_cache, self.jobs, refresh, load=lambda: load[0], max_load=2)
+        warmer.start()
+        time.sleep(0.2)
+        self.assertEqual(warmer.stats()['refreshes'], 0)
+
+        load[0] = 0
+        deadline = time.monotonic() + 5
+        while warmer.stats()['refreshes'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        warmer.stop()
+        self.assertEqual(warmer.stats()['refreshes'], 1)
+        self.assertGreater(warmer.stats()['paused_seconds'], 0)
+
+    def test_errors_do_not_stop_other_jobs(self):
+        jobs = self.jobs * 2
+        self.data_cache.fetch_from_cache.return_value = (None, False)
+        self.refresh.side_effect = [RuntimeError('upstream down'), None]
+        warmer = CacheWarmer(self.data_cache, jobs, self.refresh)
+
+        self.assertEqual(warmer.run_once(), 1)
+        self.assertEqual(warmer.stats()['errors'], 1)
+
+    def test_metrics_load(self):
+        load = metrics_load('http://localhost:5000/metrics')
+        with mock.patch('prewarm.requests.get') as get:
+            get.return_value.json.return_value = {'prewarm': {'in_flight_requests': 3}}
+            self.assertEqual(load(), 3)
+
+            # an app too busy to answer counts as loaded, one that is down does not
+            get.side_effect = requests.exceptions.Timeout()
+            self.assertGreater(load(), 8)
+            get.side_effect = requests.exceptions.ConnectionError()
+            self.assertEqual(load(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""From root of project, call
+python -m unittest test_solar
+"""
+import datetime
+import unittest
+
+import requests
+
+from solar import sunrise_sunset, SolarCalculator, TIME_FORMAT
+from sunrise_sunset import SunriseSunset
+
+CHICAGO = {'lat': 41.8781, 'lng': -87.6298}
+TOLERANCE = datetime.timedelta(minutes=2)
+
+# (lat, lng, local date)
+FIXED_DATES = [
+    (CHICAGO['lat'], CHICAGO['lng'], datetime.date(2019, 3, 20)),
+    (CHICAGO['lat'], CHICAGO['lng'], datetime.date(2019, 6, 21)),
+    (CHICAGO['lat'], CHICAGO['lng'], datetime.date(2019, 12, 21)),
+    (35.6762, 139.6503, datetime.date(2019, 6, 21)),     # Tokyo
+    (-33.8688, 151.2093, datetime.date(2019, 6, 21)),    # Sydney
+    (51.5074, -0.1278, datetime.date(2019, 10, 27))      # London, day daylight saving time ends
+]
+
+
+def parse(time_string):
+    return datetime.datetime.strptime(time_string, TIME_FORMAT)
+
+
+class TestSolar(unittest.TestCase):
+
+    def assertTimeNear(self, time_string, expected):
+        self.assertLessEqual(abs(parse(time_string) - expected), TOLERANCE)
+
+    def test_chicago_solstices(self):
+        # June 21, 2019: sunrise 5:15am CDT, sunset 8:29pm CDT
+        result = sunrise_sunset(CHICAGO['lat'], CHICAGO['lng'], datetime.date(2019, 6, 21))
+        self.assertTimeNear(result['sunrise'], datetime.datetime(2019, 6, 21, 10, 15))
+        self.assertTimeNear(result['sunset'], datetime.datetime(2019, 6, 22, 1, 29))
+
+        # December 21, 2019: sunrise 7:15am CST, sunset 4:22pm CST
+        result = sunrise_sunset(CHICAGO['lat'], CHICAGO['lng'], datetime.date(2019, 12, 21))
+        self.assertTimeNear(result['sunrise'], datetime.datetime(2019, 12, 21, 13, 15))
+        self.assertTimeNear(result['sunset'], datetime.datetime(2019, 12, 21, 22, 22))
+
+        day_length = parse(result['sunset']) - parse(result['sunrise'])
+        self.assertLessEqual(abs(day_length.total_seconds() - result['day_length']), 1)
+
+    def test_polar_day_and_night(self):
+        self.assertIsNone(sunrise_sunset(69.6492, 18.9553, datetime.date(2019, 6, 21)))
+        self.assertIsNone(sunrise_sunset(69.6492, 18.9553, datetime.date(2019, 12, 21)))
+
+    def test_calculator_memoizes_per_cell_and_date(self):
+        calculator = SolarCalculator()
+        june = datetime.date(2019, 6, 21)
+        first = calculator.sunrise_sunset_at(CHICAGO['lat'], CHICAGO['lng'], june)
+        calculator.sunrise_sunset_at(CHICAGO['lat'] + 0.001, CHICAGO['lng'], june)
+        calculator.sunrise_sunset_at(CHICAGO['lat'], CHICAGO['lng'], datetime.date(2019, 6, 22))
+        self.assertEqual(calculator.stats(), {'hits': 1, 'misses': 2, 'evictions': 0, 'size': 2})
+
+        # returned dicts are copies
+        first['timezone'] = 'America/Chicago'
+        self.assertNotIn('timezone', calculator.sunrise_sunset_at(CHICAGO['lat'], CHICAGO['lng'], june))
+        self.assertTimeNear(first['sunrise'], datetime.datetime(2019, 6, 21, 10, 15))
+
+    def test_matches_sunrise_sunset_api(self):
+        api = SunriseSunset()
+        for lat, lng, date in FIXED_DATES:
+            try:
+                expected = api.get_sunrise_sunset_at_location(lat, lng, date=date)
+            except requests.exceptions.RequestException:
+                self.skipTest('sunrise-sunset.org is not reachable')
+            if expected is None:
+                self.skipTest('sunrise-sunset.org returned an error')
+
+            result = sunrise_sunset(lat, lng, date)
+            self.assertTimeNear(result['sunrise'], parse(expected['sunrise']))
+            self.assertTimeNear(result['sunset'], parse(expected['sunset']))
+
+
+if __name__ == '__main__':
+    unittest.main()
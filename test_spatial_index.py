@@ -0,0 +1,52 @@
+"""From root of project, call
+python -m unittest test_spatial_index
+"""
+import math
+import random
+import unittest
+
+import distance
+from spatial_index import GridIndex
+
+BAT17 = {'lat': 42.048735, 'lng': -87.683187}
+
+
+class TestGridIndex(unittest.TestCase):
+
+    def test_within_matches_linear_scan(self):
+        rand = random.Random(0)
+        points = [(BAT17['lat'] + rand.uniform(-0.01, 0.01), BAT17['lng'] + rand.uniform(-0.01, 0.01))
+                  for _ in range(500)]
+        grid_index = GridIndex(cell_size_meters=50.0)
+        for i, (lat, lng) in enumerate(points):
+            grid_index.insert(lat, lng, i)
+        self.assertEqual(len(grid_index), 500)
+
+        for radius in [10.0, 60.0, 250.0, 5000.0]:
+            expected = {i for i, point in enumerate(points)
+                        if distance.distance(point[0], point[1], BAT17['lat'], BAT17['lng']) < radius}
+            found = {i for i, _ in grid_index.within(BAT17['lat'], BAT17['lng'], radius)}
+            self.assertEqual(found, expected)
+
+    def test_within_returns_distance(self):
+        grid_index = GridIndex()
+        grid_index.insert(BAT17['lat'], BAT17['lng'], 'bat_17')
+        results = grid_index.within(BAT17['lat'] + 0.0001, BAT17['lng'], 60.0)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], 'bat_17')
+        self.assertAlmostEqual(results[0][1], 11.1, places=0)
+
+    def test_within_includes_points_just_inside_radius(self):
+        # due north and south, where the bounding box is tightest
+        lat_offset = math.degrees((60.0 - 0.01) / distance.EARTH_RADIUS_METERS)
+        grid_index = GridIndex()
+        grid_index.insert(BAT17['lat'] + lat_offset, BAT17['lng'], 'north')
+        grid_index.insert(BAT17['lat'] - lat_offset, BAT17['lng'], 'south')
+
+        for backend in distance.BACKENDS:
+            distance.set_backend(backend)
+            try:
+                found = {item for item, _ in grid_index.within(BAT17['lat'], BAT17['lng'], 60.0)}
+            finally:
+                distance.set_backend('haversine')
+            self.assertEqual(found, {'north', 'south'}, backend)
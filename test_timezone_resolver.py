@@ -0,0 +1,30 @@
+"""From root of project, call
+python -m unittest test_timezone_resolver
+"""
+import unittest
+
+from timezone_resolver import TimezoneResolver
+
+
+class TestTimezoneResolver(unittest.TestCase):
+
+    def test_timezone_at(self):
+        resolver = TimezoneResolver()
+        self.assertEqual(resolver.timezone_at(42.048735, -87.683187), 'America/Chicago')
+        self.assertEqual(resolver.timezone_at(47.671756, -122.344640), 'America/Los_Angeles')
+
+    def test_same_cell_is_cached(self):
+        resolver = TimezoneResolver(cell_size=0.01)
+        resolver.timezone_at(42.048735, -87.683187)
+        resolver.timezone_at(42.048736, -87.683188)
+        self.assertEqual(resolver.stats()['misses'], 1)
+        self.assertEqual(resolver.stats()['hits'], 1)
+
+    def test_bounded_eviction(self):
+        resolver = TimezoneResolver(cell_size=0.01, max_entries=2)
+        resolver.timezone_at(42.01, -87.61)
+        resolver.timezone_at(42.11, -87.61)
+        resolver.timezone_at(42.21, -87.61)
+        stats = resolver.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], 1)
@@ -5,6 +5,7 @@ Run this in python 3.7, there's wonky things between how str vs unicode is handl
 """
 import unittest
 from os import environ
+from unittest import mock
 
 from yelp import Yelp
 
@@ -57,6 +58,18 @@ class TestYelpMethods(unittest.TestCase):
             self.assertEqual(type(category), text_type)
         print(place_category_dict)
 
+    def test_invalid_hardcoded_locations_raise_on_construction(self):
+        with self.assertRaises(ValueError):
+            Yelp('', hardcoded_locations=[({"a": ["x"], "b": ["y"]}, (42.0, -87.0))])
+        with self.assertRaises(ValueError):
+            Yelp('', hardcoded_locations=[({"a": ["x"]}, (42.0, -87.0, 0.0))])
+
+    def test_fetch_hardcoded_locations_later_duplicates_win(self):
+        yelp_api = Yelp('', hardcoded_locations=[({"grocery": ["first"]}, (42.047691, -87.679189)),
+                                                 ({"grocery": ["second"]}, (42.047874, -87.679489))])
+        place_category_dict = yelp_api.fetch_hardcoded_locations(42.047691, -87.679189, 60.0)
+        self.assertEqual(place_category_dict['grocery']['categories'], ['second'])
+
     def test_fetch_yelp_locations(self):
         """return looks like
         {'bat_17_evanston': {'categories': ['sandwiches', 'sportsbars'], 'distance': 17.0},
@@ -109,3 +122,101 @@ class TestYelpMethods(unittest.TestCase):
         self.assertEqual(YELP_API.clean_string('ATV Rentals/Tours'), 'atv_rentals_tours')
         self.assertEqual(YELP_API.clean_string('Hunting & Fishing Supplies'), 'hunting___fishing_supplies')
         self.assertEqual(YELP_API.clean_string("May's Vietnamese Restaurant"), 'may_s_vietnamese_restaurant')
+
+
+class TestYelpSearches(unittest.TestCase):
+
+    @staticmethod
+    def search_response(businesses):
+        resp = mock.Mock(status_code=200)
+        resp.json.return_value = {'businesses': businesses}
+        return resp
+
+    @classmethod
+    def paged_search(cls, businesses):
+        def get(url, headers, params):
+            offset = params.get('offset', 0)
+            resp = cls.search_response(businesses[offset:offset + params['limit']])
+            resp.json.return_value['total'] = len(businesses)
+            return resp
+        return get
+
+    def test_full_wide_search_narrows_coverage(self):
+        full = [{'id': str(i), 'distance': float(i)} for i in range(120)]
+        yelp_api = Yelp('')
+        yelp_api.session = mock.Mock()
+        generic, specific = self.paged_search(full), self.paged_search(full[:3])
+        yelp_api.session.get.side_effect = lambda url, headers, params: (
+            generic if 'categories' not in params else specific)(url, headers, params)
+
+        businesses, covered_radius = yelp_api.fetch_wide_businesses(42.048735, -87.683187, 'bars', 250)
+        self.assertEqual(len(businesses), 50)
+        self.assertEqual(covered_radius, 49.0)
+        self.assertEqual(yelp_api.session.get.call_args[1]['params']['sort_by'], 'distance')
+
+    def test_unsorted_truncated_search_covers_nothing(self):
+        full = [{'id': str(i), 'distance': float(i)} for i in range(120)]
+        full[10], full[60] = full[60], full[10]
+        yelp_api = Yelp('')
+        yelp_api.session = mock.Mock()
+        generic, specific = self.paged_search(full), self.paged_search(full[:3])
+        yelp_api.session.get.side_effect = lambda url, headers, params: (
+            generic if 'categories' not in params else specific)(url, headers, params)
+
+        businesses, covered_radius = yelp_api.fetch_wide_businesses(42.048735, -87.683187, 'bars', 250)
+        self.assertEqual(len(businesses), 50)
+        self.assertEqual(covered_radius, 0.0)
+
+    def test_fetch_yelp_locations_answers_from_store(self):
+        store = mock.Mock()
+        store.ensure_covered.return_value = True
+        store.within.return_value = [({'alias': 'Bat-17-Evanston', 'categories': ['sportsbars']}, 12.5)]
+        yelp_api = Yelp('', business_store=store)
+
+        place_category_dict = yelp_api.fetch_yelp_locations(42.048735, -87.683187, 'bars', radius=30)
+        self.assertEqual(place_category_dict, {'bat_17_evanston': {'categories': ['sportsbars'], 'distance': 12.5}})
+        store.ensure_covered.assert_called_once()
+        store.within.assert_called_once_with(42.048735, -87.683187, 30)
+
+    def test_fetch_yelp_locations_searches_where_store_is_not_covered(self):
+        store = mock.Mock()
+        store.ensure_covered.return_value = False
+        yelp_api = Yelp('', business_store=store)
+        yelp_api.session = mock.Mock()
+        yelp_api.session.get.side_effect = self.paged_search([{'id': '1', 'alias': 'Bat-17-Evanston', 'distance': 12.5,
+                                                               'categories': [{'alias': 'sportsbars'}]}])
+
+        place_category_dict = yelp_api.fetch_yelp_locations(42.048735, -87.683187, 'bars', radius=30)
+        self.assertEqual(place_category_dict, {'bat_17_evanston': {'categories': ['sportsbars'], 'distance': 12.5}})
+        store.within.assert_not_called()
+        self.assertEqual(yelp_api.session.get.call_args[1]['params']['radius'], 30)
+
+    def test_pages_fetched_concurrently_and_deduped(self):
+        businesses = [{'id': str(i), 'alias': 'place-{}'.format(i), 'distance': 10.0,
+                       'categories': [{'alias': 'bars'}]} for i in range(120)]
+        yelp_api = Yelp('', max_pages=3)
+        yelp_api.session = mock.Mock()
+        yelp_api.session.get.side_effect = self.paged_search(businesses)
+
+        place_category_dict = yelp_api.fetch_yelp_locations(42.048735, -87.683187, 'bars', radius=30)
+        self.assertEqual(len(place_category_dict), 120)
+        # 3 pages each of the generic and category searches, which return the same businesses here
+        self.assertEqual(yelp_api.session.get.call_count, 6)
+        self.assertEqual(sorted(call[1]['params'].get('offset', 0) for call in yelp_api.session.get.call_args_list),
+                         [0, 0, 50, 50, 100, 100])
+        self.assertEqual(yelp_api.stats()['searches_per_fetch'], 6)
+
+    def test_failed_page_raises(self):
+        yelp_api = Yelp('', max_pages=2)
+        yelp_api.session = mock.Mock()
+        paged = self.paged_search([{'id': str(i), 'distance': 1.0} for i in range(80)])
+
+        def get(url, headers, params):
+            if params.get('offset'):
+                return mock.Mock(status_code=500, text='error')
+            return paged(url, headers, params)
+        yelp_api.session.get.side_effect = get
+
+        with self.assertRaises(RuntimeError):
+            yelp_api.fetch_yelp_locations(42.048735, -87.683187, 'bars', radius=30)
+
@@ -0,0 +1,98 @@
+"""
+This module wraps TimezoneFinder in a process-wide resolver with a cell-level cache.
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import threading
+from collections import OrderedDict
+
+from timezonefinder import TimezoneFinder
+
+
+class TimezoneResolver(object):
+    """
+    Resolves timezone names for lat, lng pairs using a single TimezoneFinder instance, memoizing results per
+    quantized lat/lng cell. Setting up TimezoneFinder loads the timezone polygon data, so one resolver should be
+    created per worker and shared across requests.
+
+    Attributes:
+        cell_size (float): size of a cache cell, in degrees. 0.01 degrees is roughly 1 kilometer.
+        max_entries (int): maximum number of cells to remember before evicting the least recently used one.
+        hits (int): number of lookups answered from the cell cache.
+        misses (int): number of lookups that needed TimezoneFinder.
+        evictions (int): number of cells evicted from the cell cache.
+    """
+
+    def __init__(self, cell_size=0.01, max_entries=4096):
+        """
+        Returns a TimezoneResolver object with class variables initialized.
+
+        :param cell_size: optional float size of a cache cell, in degrees.
+        :param max_entries: optional int maximum number of cells to keep in the cache.
+        """
+        self.cell_size = cell_size
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # TimezoneFinder is created lazily so that importing this module stays cheap
+        self._finder = None
+        self._cells = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cell_for(self, lat, lng):
+        """
+        Quantizes a location into the cache cell containing it.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :return: tuple of (int, int) identifying the cell.
+        """
+        return int(lat // self.cell_size), int(lng // self.cell_size)
+
+    def timezone_at(self, lat, lng):
+        """
+        Returns the timezone name for a location, e.g. 'America/Chicago'.
+
+        :param lat: float latitude of location.
+        :param lng: float longitude of location.
+        :return: string timezone name, or None if location has no timezone.
+        """
+        cell = self.cell_for(lat, lng)
+
+        with self._lock:
+            if cell in self._cells:
+                self._cells.move_to_end(cell)
+                self.hits += 1
+                return self._cells[cell]
+
+            self.misses += 1
+            if self._finder is None:
+                self._finder = TimezoneFinder()
+
+            # TimezoneFinder is not documented as thread-safe, so resolve while holding the lock
+            tz_name = self._finder.timezone_at(lng=lng, lat=lat)
+
+            self._cells[cell] = tz_name
+            if len(self._cells) > self.max_entries:
+                self._cells.popitem(last=False)
+                self.evictions += 1
+
+        return tz_name
+
+    def stats(self):
+        """
+        Returns counters describing cache effectiveness.
+
+        :return: dict with hits, misses, evictions and size of the cell cache.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._cells)
+            }
@@ -6,6 +6,8 @@ from __future__ import absolute_import
 
 import requests
 
+from http_client import PooledSession
+
 
 class Weather(object):
     """
@@ -14,17 +16,25 @@ class Weather(object):
 
     Attributes:
         api_key (string): API key to authenticate requests with.
+        session (PooledSession): keep-alive session used for all requests to OpenWeatherMap.
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, session=None):
         """
        Returns a Weather object with class variables initialized.
 
        :param api_key: string for OpenWeatherMap API Key.
+       :param session: optional PooledSession to send requests with. one is created if not provided.
        """
         # setup keys
         self.api_key = api_key
 
+        # setup pooled session
+        if session is None:
+            session = PooledSession('openweathermap')
+
+        self.session = session
+
     def get_weather_at_location(self, lat, lng):
         """
         Makes a request to the weather API for the weather at the current location.
@@ -35,7 +45,11 @@ class Weather(object):
         """
         # make request
         url = 'http://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={api_key}'
-        resp = requests.get(url.format(latitude=str(lat), longitude=str(lng), api_key=self.api_key))
+        try:
+            resp = self.session.get(url.format(latitude=str(lat), longitude=str(lng), api_key=self.api_key))
+        except requests.exceptions.RequestException as e:
+            print('Weather API -- weather request failed: {}'.format(e))
+            return None
 
         # return if request is valid
         if resp.status_code == requests.codes.ok:
@@ -52,7 +66,11 @@ class Weather(object):
         :return: JSON response as dict from weather API for current forecast at current location
         """
         url = 'http://api.openweathermap.org/data/2.5/forecast?lat={latitude}&lon={longitude}&appid={api_key}'
-        resp = requests.get(url.format(latitude=str(lat), longitude=str(lng), api_key=self.api_key))
+        try:
+            resp = self.session.get(url.format(latitude=str(lat), longitude=str(lng), api_key=self.api_key))
+        except requests.exceptions.RequestException as e:
+            print('Weather API -- forecast request failed: {}'.format(e))
+            return None
 
         # return if request is valid
         if resp.status_code == requests.codes.ok:
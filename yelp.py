@@ -4,8 +4,14 @@ This module is a class wrapper for the Yelp API.
 from __future__ import print_function
 from __future__ import absolute_import
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from geopy.distance import geodesic
+
+from http_client import DEFAULT_TIMEOUT, PooledSession
+from spatial_index import GridIndex
 
 
 class Yelp(object):
@@ -15,14 +21,27 @@ class Yelp(object):
     Attributes:
         header (dict): header for querying using yelp API key.
         hardcoded_locations (list): tuples of (location string, (latitude, longitude)) hardcoded locations to match on.
+        hardcoded_index (GridIndex): spatial index over hardcoded_locations, built once at construction.
+        executor (ThreadPoolExecutor): pool used to issue Yelp searches concurrently.
+        session (PooledSession): keep-alive session used for all requests to Yelp.
+        business_store (BusinessStore): local store of businesses to answer searches from, or None to always search
+            Yelp.
+        max_pages (int): number of 50 result pages to fetch per search. more pages find more businesses in dense
+            areas, at the cost of more requests.
     """
 
-    def __init__(self, api_key, hardcoded_locations=None):
+    def __init__(self, api_key, hardcoded_locations=None, max_workers=8, session=None,
+                 hardcoded_index_cell_size=100.0, business_store=None, max_pages=1):
         """
         Returns a Yelp object with class variables initialized.
 
         :param api_key: string for Yelp API Key.
         :param hardcoded_locations: list of categories and locations to add that are not included in Yelp.
+        :param max_workers: optional int number of threads used to issue Yelp searches concurrently.
+        :param session: optional PooledSession to send requests with. one is created if not provided.
+        :param hardcoded_index_cell_size: optional float size in meters of cells in the hardcoded location index.
+        :param business_store: optional BusinessStore to answer searches from, filled by wide Yelp searches.
+        :param max_pages: optional int number of 50 result pages to fetch per search, for dense areas.
         """
         # setup keys
         self.header = self.generate_request_header(api_key)
@@ -32,6 +51,24 @@ class Yelp(object):
             hardcoded_locations = []
 
         self.hardcoded_locations = hardcoded_locations
+        self.hardcoded_index = self.build_hardcoded_index(hardcoded_locations, hardcoded_index_cell_size)
+
+        # setup pool for concurrent searches
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # setup pooled session
+        if session is None:
+            session = PooledSession('yelp', pool_maxsize=max_workers)
+
+        self.session = session
+
+        # setup local business store
+        self.business_store = business_store
+
+        # setup pagination and fetch counters
+        self.max_pages = max_pages
+        self._stats = {'fetches': 0, 'searches': 0, 'fetch_seconds': 0.0}
+        self._lock = threading.Lock()
 
     @staticmethod
     def generate_request_header(key):
@@ -48,7 +85,8 @@ class Yelp(object):
         }
 
     @staticmethod
-    def yelp_search(headers, lat, lng, radius=30, limit=50, term='', categories=''):
+    def yelp_search(headers, lat, lng, radius=30, limit=50, term='', categories='', sort_by='', offset=0,
+                    session=None):
         """
         Queries Yelp with the given parameters.
 
@@ -60,6 +98,9 @@ class Yelp(object):
         :param term: optional string to search for. '' returns everything.
         :param categories: optional string with comma separated categories to search for (ex. 'trainstations,grocery)
             List of all categories: https://www.yelp.com/developers/documentation/v3/all_category_list
+        :param sort_by: optional string to sort results by, e.g. 'distance'. '' uses Yelp's best match.
+        :param offset: optional int number of results to skip, to fetch later pages.
+        :param session: optional PooledSession to send the request with. a one-off connection is used if not provided.
         :return: response object
         """
         params = {
@@ -76,8 +117,17 @@ class Yelp(object):
         if categories != '':
             params['categories'] = categories
 
+        if sort_by != '':
+            params['sort_by'] = sort_by
+
+        if offset > 0:
+            params['offset'] = offset
+
         # make and return request
-        return requests.get('https://api.yelp.com/v3/businesses/search', headers=headers, params=params)
+        if session is None:
+            return requests.get('https://api.yelp.com/v3/businesses/search', headers=headers, params=params,
+                                timeout=DEFAULT_TIMEOUT)
+        return session.get('https://api.yelp.com/v3/businesses/search', headers=headers, params=params)
 
     @staticmethod
     def clean_string(target_string):
@@ -96,18 +146,18 @@ class Yelp(object):
                 .replace('-', '_')
                 .lower())
 
-    def fetch_hardcoded_locations(self, lat, lng, distance_threshold=60):
+    @staticmethod
+    def build_hardcoded_index(hardcoded_locations, cell_size):
         """
-        Checks and returns categories for locations that are near hardcoded locations, if within distance_threshold.
+        Validates hardcoded locations and builds a spatial index over them.
 
-        :param lat: float latitude of current location.
-        :param lng: float longitude of current location.
-        :param distance_threshold: optional float for how close lat, lng must be to hardcoded location
-        :return:
+        :param hardcoded_locations: list of ({"placename": [affordance]}, (lat, lng)) tuples.
+        :param cell_size: float size in meters of index cells.
+        :return: GridIndex with (position in hardcoded_locations, place/category dict) tuples as items.
         """
-        nearby_hardcoded_place_cats = {}
+        hardcoded_index = GridIndex(cell_size_meters=cell_size)
 
-        for location in self.hardcoded_locations:
+        for position, location in enumerate(hardcoded_locations):
             place_categorylist_dict = location[0]
             if len(place_categorylist_dict) != 1:
                 raise ValueError(
@@ -117,17 +167,105 @@ class Yelp(object):
                 raise ValueError(
                     'element of hardcoded_locations should look like ({"placename": [affordance]}, (lat,lng))')
 
-            # add location if within distance_threshold
-            dist = geodesic(curr_location_coords, (lat, lng)).meters
-            if dist < distance_threshold:
-                for place, categorylist in place_categorylist_dict.items():
-                    nested_place_metadata = {}
-                    nested_place_metadata['categories'] = categorylist
-                    nested_place_metadata['distance'] = dist
-                    nearby_hardcoded_place_cats[place] = nested_place_metadata
+            hardcoded_index.insert(curr_location_coords[0], curr_location_coords[1],
+                                   (position, place_categorylist_dict))
+
+        return hardcoded_index
+
+    def fetch_hardcoded_locations(self, lat, lng, distance_threshold=60):
+        """
+        Checks and returns categories for locations that are near hardcoded locations, if within distance_threshold.
+
+        :param lat: float latitude of current location.
+        :param lng: float longitude of current location.
+        :param distance_threshold: optional float for how close lat, lng must be to hardcoded location
+        :return:
+        """
+        nearby_hardcoded_place_cats = {}
+
+        # add locations within distance_threshold, in the order they were hardcoded
+        nearby_locations = sorted(self.hardcoded_index.within(lat, lng, distance_threshold))
+        for (_, place_categorylist_dict), dist in nearby_locations:
+            for place, categorylist in place_categorylist_dict.items():
+                nested_place_metadata = {}
+                nested_place_metadata['categories'] = categorylist
+                nested_place_metadata['distance'] = dist
+                nearby_hardcoded_place_cats[place] = nested_place_metadata
 
         return nearby_hardcoded_place_cats
 
+    def search_pages(self, lat, lng, radius, categories, sort_by=''):
+        """
+        Runs a generic search and a search for the given categories, each for up to max_pages pages. Both first pages
+        are issued concurrently. Once they report how many results there are, all further pages of both searches are
+        issued concurrently, so dense areas take two round trips however many pages they need.
+
+        :param lat: float latitude to center request around.
+        :param lng: float longitude to center request around.
+        :param radius: int radius to determine area around lat, lng to query for.
+        :param categories: string with comma separated categories to search for.
+        :param sort_by: optional string to sort results by, e.g. 'distance'.
+        :return: list of (list of Yelp business dicts, int total number of results) tuples, generic search first
+        """
+        fetch_start = time.time()
+        limit = 50
+        search_categories = ['', categories]
+
+        def submit(search_categories_string, offset):
+            return self.executor.submit(self.yelp_search, self.header, lat, lng, radius=radius, limit=limit,
+                                        term='', categories=search_categories_string, sort_by=sort_by,
+                                        offset=offset, session=self.session)
+
+        def result(future):
+            # timeouts, connection errors and an open circuit breaker fail the fetch like an invalid response does
+            try:
+                return future.result()
+            except requests.exceptions.RequestException as e:
+                raise RuntimeError('Yelp API request failed: {}'.format(e))
+
+        first_pages = [submit(search_categories_string, 0) for search_categories_string in search_categories]
+        responses = [[result(future)] for future in first_pages]
+        self._raise_for_responses([resp for search_responses in responses for resp in search_responses])
+
+        # Yelp returns at most 1000 results per search
+        totals = [min(search_responses[0].json().get('total', 0), self.max_pages * limit, 1000)
+                  for search_responses in responses]
+        later_pages = [[submit(search_categories_string, offset) for offset in range(limit, total, limit)]
+                       for search_categories_string, total in zip(search_categories, totals)]
+        for search_responses, futures in zip(responses, later_pages):
+            search_responses += [result(future) for future in futures]
+        self._raise_for_responses([resp for search_responses in responses for resp in search_responses])
+
+        self._count_fetch(sum(len(search_responses) for search_responses in responses), time.time() - fetch_start)
+        return [([business for resp in search_responses for business in resp.json()['businesses']],
+                 search_responses[0].json().get('total', 0))
+                for search_responses in responses]
+
+    @staticmethod
+    def _raise_for_responses(responses):
+        """
+        Raises if any Yelp response failed, after printing the failures.
+
+        :param responses: list of response objects.
+        :return: None
+        """
+        failed = [resp for resp in responses if resp.status_code != requests.codes.ok]
+        for resp in failed:
+            print("Yelp Response: \n {}".format(resp.text))
+        if failed:
+            raise RuntimeError('Yelp API endpoint returned invalid responses (see above)')
+
+    @staticmethod
+    def dedupe_businesses(businesses):
+        """
+        Removes businesses returned by more than one search or page, keeping the first of each id.
+
+        :param businesses: list of Yelp business dicts.
+        :return: list of Yelp business dicts, in their original order
+        """
+        seen = set()
+        return [business for business in businesses if not (business['id'] in seen or seen.add(business['id']))]
+
     def fetch_yelp_locations(self, lat, lng, categories, radius=30):
         """
         Fetch yelp categories and locations, given a lat and lng location.
@@ -142,20 +280,26 @@ class Yelp(object):
             {'bat_17_evanston': {'distance': 17.0, 'categories': ['sandwiches', 'sportsbars']},
              'le_peep_evanston': {'distance': 25.0, 'categories': ['breakfast']} }
     """
-        # attempt to make yelp request
-        yelp_generic_resp = self.yelp_search(self.header, lat, lng,
-                                             radius=radius, limit=50, term='', categories='')
-        yelp_specific_resp = self.yelp_search(self.header, lat, lng,
-                                              radius=radius, limit=50, term='', categories=categories)
-
-        # if either response failed, return None
-        if yelp_generic_resp.status_code != requests.codes.ok or yelp_specific_resp.status_code != requests.codes.ok:
-            print("Yelp Generic Response: \n {}".format(yelp_generic_resp.text))
-            print("Yelp Specific Response: \n {}".format(yelp_specific_resp.text))
-            raise RuntimeError('Yelp API endpoint returned invalid responses (see above)')
+        if self.business_store is not None:
+            return self.fetch_stored_locations(lat, lng, categories, radius=radius)
+        return self.search_yelp_locations(lat, lng, categories, radius=radius)
+
+    def search_yelp_locations(self, lat, lng, categories, radius=30):
+        """
+        Fetch yelp categories and locations with searches around lat, lng, as fetch_yelp_locations does without a
+        business_store.
+
+        :param lat: float latitude to center request around.
+        :param lng: float longitude to center request around.
+        :param categories: string with comma separated categories to search for.
+        :param radius: optional int radius to determine area around lat, lng to query for.
+        :return: dict of places and categories, aliases cleaned using clean_string.
+        """
+        # attempt to make yelp requests, issuing both searches concurrently
+        searches = self.search_pages(lat, lng, radius, categories)
 
         # create yelp output
-        yelp_businesses = yelp_generic_resp.json()['businesses'] + yelp_specific_resp.json()['businesses']
+        yelp_businesses = self.dedupe_businesses([business for businesses, _ in searches for business in businesses])
         place_category_dict = {}
 
         for business in yelp_businesses:
@@ -178,6 +322,87 @@ class Yelp(object):
 
         return place_category_dict
 
+    def fetch_wide_businesses(self, lat, lng, categories, radius):
+        """
+        Fetches businesses for a wide area, as fetch_yelp_locations does for a narrow one: a search for any business
+        and one for the given categories, both sorted by distance. If a search has more results than the pages
+        fetched, the area is only complete up to its farthest fetched business. Yelp does not guarantee the distance
+        order, so such a search that comes back out of order covers nothing.
+
+        :param lat: float latitude to center request around.
+        :param lng: float longitude to center request around.
+        :param categories: string with comma separated categories to search for.
+        :param radius: float radius in meters to search.
+        :return: tuple of (list of Yelp business dicts, float radius in meters within which the list is complete)
+        """
+        searches = self.search_pages(lat, lng, int(radius), categories, sort_by='distance')
+
+        covered_radius = float(radius)
+        for businesses, total in searches:
+            if businesses and len(businesses) < total:
+                distances = [business['distance'] for business in businesses]
+                if any(later < earlier for earlier, later in zip(distances, distances[1:])):
+                    print("Yelp API -- truncated search not sorted by distance, treating it as uncovered.")
+                    covered_radius = 0.0
+                else:
+                    covered_radius = min(covered_radius, distances[-1])
+
+        return self.dedupe_businesses([business for businesses, _ in searches for business in businesses]), \
+            covered_radius
+
+    def _count_fetch(self, searches, seconds):
+        with self._lock:
+            self._stats['fetches'] += 1
+            self._stats['searches'] += searches
+            self._stats['fetch_seconds'] += seconds
+
+    def stats(self):
+        """
+        Returns counters describing Yelp fetches, each of which covers one cache miss.
+
+        :return: dict with number of fetches, searches sent, searches per fetch, and mean fetch latency in seconds
+        """
+        with self._lock:
+            stats = dict(self._stats)
+
+        fetches = stats.pop('fetches')
+        fetch_seconds = stats.pop('fetch_seconds')
+        return {
+            'fetches': fetches,
+            'searches': stats['searches'],
+            'searches_per_fetch': stats['searches'] / fetches if fetches else 0.0,
+            'mean_fetch_seconds': fetch_seconds / fetches if fetches else 0.0
+        }
+
+    def fetch_stored_locations(self, lat, lng, categories, radius=30):
+        """
+        Fetch yelp categories and locations from business_store, filling it with a wide search first if the area
+        around lat, lng has not been fetched. Returns the same as fetch_yelp_locations, with distances computed from
+        lat, lng to each business. Falls back to searching around lat, lng if the store cannot cover it, e.g. where a
+        wide search is truncated by Yelp's result limit.
+
+        :param lat: float latitude to center request around.
+        :param lng: float longitude to center request around.
+        :param categories: string with comma separated categories to search for, used for wide searches.
+        :param radius: optional int radius to determine area around lat, lng to query for.
+        :return: dict of places and categories, aliases cleaned using clean_string.
+        """
+        covered = self.business_store.ensure_covered(
+            lat, lng, radius,
+            lambda wide_lat, wide_lng, wide_radius: self.fetch_wide_businesses(wide_lat, wide_lng, categories,
+                                                                               wide_radius))
+        if not covered:
+            return self.search_yelp_locations(lat, lng, categories, radius=radius)
+
+        place_category_dict = {}
+        for business, curr_dist in self.business_store.within(lat, lng, radius):
+            nested_place_metadata = {}
+            nested_place_metadata['categories'] = [self.clean_string(category) for category in business['categories']]
+            nested_place_metadata['distance'] = curr_dist
+            place_category_dict[self.clean_string(business['alias'])] = nested_place_metadata
+
+        return place_category_dict
+
     def fetch_all_locations(self, lat, lng, categories, distance_threshold=60, radius=30):
         """
         Fetch all categories and locations, including hardcoded, given a lat and lng location.